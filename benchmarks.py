@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+"""
+Benchmark script for performance-sensitive code paths.
+Run with: python benchmarks.py
+"""
+
+import time
+
+import numpy as np
+
+
+def benchmark_meal_optimizer(meals_per_slot=5000, num_days=7, repeats=20):
+    """Time a full optimized plan against a synthetic catalog."""
+    from meal_optimizer import MealPlanOptimizer
+
+    rng = np.random.default_rng(42)
+    slots = ['breakfast', 'lunch', 'dinner', 'snacks']
+    total_meals = meals_per_slot * len(slots)
+    macro_matrix = np.column_stack([
+        rng.uniform(100, 800, total_meals),
+        rng.uniform(0, 60, total_meals),
+        rng.uniform(0, 100, total_meals),
+        rng.uniform(0, 40, total_meals)
+    ])
+    slot_ids = {
+        slot: list(range(index * meals_per_slot, (index + 1) * meals_per_slot))
+        for index, slot in enumerate(slots)
+    }
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        MealPlanOptimizer(macro_matrix, slot_ids, (2400, 150, 300, 67)).plan(num_days)
+    elapsed_ms = (time.perf_counter() - start) / repeats * 1000
+
+    print(f"Meal optimizer: {num_days}-day plan over {total_meals} meals in {elapsed_ms:.1f} ms")
+
+
+def benchmark_daily_calories(rows=1_000_000, repeats=5):
+    """Time calorie and macro targets for a synthetic user base, batched and scalar."""
+    from diet_plan import (ACTIVITY_MULTIPLIERS, DIET_TYPES, GOAL_ADJUSTMENTS, calculate_daily_calories,
+                           calculate_daily_calories_batch, calculate_macro_targets_batch)
+
+    rng = np.random.default_rng(42)
+    weight_kg = rng.uniform(40, 140, rows)
+    height_cm = rng.uniform(145, 205, rows)
+    age = rng.integers(16, 90, rows)
+    gender = rng.choice(['male', 'female'], rows)
+    activity_level = rng.choice(list(ACTIVITY_MULTIPLIERS), rows)
+    goal = rng.choice(list(GOAL_ADJUSTMENTS), rows)
+    diet_type = rng.choice(list(DIET_TYPES), rows)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        daily_calories = calculate_daily_calories_batch(weight_kg, height_cm, age, gender, activity_level, goal)
+        calculate_macro_targets_batch(daily_calories, diet_type)
+    batch_seconds = (time.perf_counter() - start) / repeats
+
+    # The scalar path is timed on a sample and extrapolated
+    sample = min(rows, 20_000)
+    start = time.perf_counter()
+    for index in range(sample):
+        calculate_daily_calories(weight_kg[index], height_cm[index], age[index], gender[index],
+                                 activity_level[index], goal[index])
+    scalar_seconds = (time.perf_counter() - start) / sample * rows
+
+    print(f"Daily calories: {rows} rows in {batch_seconds * 1000:.1f} ms batched "
+          f"({rows / batch_seconds / 1e6:.1f}M rows/s), ~{scalar_seconds:.1f} s row by row")
+
+
+def benchmark_wellness_scoring(users=500_000, repeats=5):
+    """Time wellness scores and age cohort percentiles for a synthetic user base."""
+    from wellness_scoring import age_band_codes, cohort_percentiles, score_wellness_batch
+
+    rng = np.random.default_rng(42)
+    steps = rng.integers(0, 20000, users)
+    sleep_hours = rng.uniform(0, 12, users).round(1)
+    calories_burned = rng.integers(0, 900, users)
+    consistent_days = rng.integers(0, 8, users)
+    heart_rate = rng.integers(0, 120, users)
+    ages = rng.integers(14, 80, users)
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        scores = score_wellness_batch(steps, sleep_hours, calories_burned, consistent_days, heart_rate)['score']
+        cohort_percentiles(scores, age_band_codes(ages))
+    elapsed_ms = (time.perf_counter() - start) / repeats * 1000
+
+    print(f"Wellness scoring: {users} users scored and ranked in {elapsed_ms:.1f} ms")
+
+
+def benchmark_intent_router(messages=100_000, extra_intents=1000):
+    """Time chatbot intent routing over corpus messages, as declared and with many synthetic intents."""
+    import json
+    from chatbot_intents import INTENT_CORPUS_PATH, INTENTS, IntentRouter
+
+    with open(INTENT_CORPUS_PATH) as f:
+        corpus = json.load(f)
+
+    rng = np.random.default_rng(42)
+    picks = rng.integers(0, len(corpus), messages)
+    cases = [(corpus[i]['message'], corpus[i]['category']) for i in picks]
+
+    # Synthetic intents whose keywords never occur in the corpus, to show routing cost doesn't grow with rules
+    alphabet = np.array(list('qxzjvk'))
+    synthetic = [
+        {
+            'name': f'synthetic_{index}',
+            'category': 'fitness',
+            'keywords': [[''.join(rng.choice(alphabet, 6)) for _ in range(3)], [''.join(rng.choice(alphabet, 5))]],
+            'response': ''
+        }
+        for index in range(extra_intents)
+    ]
+
+    for label, intents in (('declared', INTENTS), (f'+{extra_intents} synthetic', INTENTS + synthetic)):
+        router = IntentRouter(intents)
+        start = time.perf_counter()
+        for message, category in cases:
+            router.match(message, category)
+        elapsed = time.perf_counter() - start
+        print(f"Intent router ({label}, {len(router.keywords)} keywords): {messages} messages in "
+              f"{elapsed * 1000:.0f} ms ({elapsed / messages * 1e6:.2f} us/message)")
+
+
+def benchmark_retrieval(documents=20_000, queries=2000, words_per_document=120):
+    """Time BM25 top-k lookups against a synthetic memory-mapped chatbot index."""
+    import tempfile
+    from chatbot_retrieval import RetrievalIndex, update_index
+
+    rng = np.random.default_rng(42)
+    # Zipf-distributed words over a 20k-word vocabulary, like natural text
+    vocabulary = np.array([f'word{index}' for index in range(20_000)])
+    categories = ['fitness', 'diet', 'wellness', 'progress']
+
+    def text(length):
+        return ' '.join(vocabulary[np.minimum(rng.zipf(1.3, length), len(vocabulary)) - 1])
+
+    corpus = [
+        {'id': f'doc{index}', 'category': categories[index % 4], 'title': '', 'text': text(words_per_document)}
+        for index in range(documents)
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        update_index(corpus, directory=directory)
+        build_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        update_index(corpus + [{'id': 'added', 'category': 'diet', 'title': '', 'text': text(words_per_document)}],
+                     directory=directory)
+        add_ms = (time.perf_counter() - start) * 1000
+
+        index = RetrievalIndex(directory)
+        query_texts = [text(6) for _ in range(queries)]
+        timings = []
+        for query in query_texts:
+            start = time.perf_counter()
+            index.search(query, k=5, category='diet')
+            timings.append(time.perf_counter() - start)
+
+    timings = np.array(timings) * 1000
+    print(f"Chatbot retrieval: {documents} documents indexed in {build_seconds:.1f} s, one added in {add_ms:.0f} ms; "
+          f"top-5 lookup mean {timings.mean():.3f} ms, p99 {np.percentile(timings, 99):.3f} ms")
+
+
+def benchmark_chat_writes(turns=500):
+    """Compare chat turn write latency with a commit per message, per turn and write-behind batching."""
+    import datetime
+    import os
+    import tempfile
+    from sqlalchemy import create_engine
+    from db import db, User, ChatMessage
+    from chat_writer import ChatWriter
+
+    def rows(turn):
+        now = datetime.datetime.now()
+        return [
+            {'user_id': 1, 'role': role, 'content': f'message {turn}', 'category': 'fitness', 'timestamp': now}
+            for role in ('user', 'assistant')
+        ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'chat.db')}")
+        db.metadata.create_all(engine, tables=[User.__table__, ChatMessage.__table__])
+        insert = ChatMessage.__table__.insert()
+
+        def per_message(turn_rows):
+            for row in turn_rows:
+                with engine.begin() as connection:
+                    connection.execute(insert, [row])
+
+        def per_turn(turn_rows):
+            with engine.begin() as connection:
+                connection.execute(insert, turn_rows)
+
+        writer = ChatWriter(mode='write_behind', engine=engine)
+        for label, write in (('commit per message', per_message), ('one transaction per turn', per_turn),
+                             ('write-behind', writer.write)):
+            timings = []
+            for turn in range(turns):
+                turn_rows = rows(turn)
+                start = time.perf_counter()
+                write(turn_rows)
+                timings.append(time.perf_counter() - start)
+            timings = np.array(timings) * 1000
+            print(f"Chat writes ({label}): {turns} turns, mean {timings.mean():.3f} ms, "
+                  f"p99 {np.percentile(timings, 99):.3f} ms per turn")
+
+        start = time.perf_counter()
+        writer.close()
+        print(f"Chat writes (write-behind): {writer.flushed} rows in {writer.batches} batches, "
+              f"final flush {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    benchmark_meal_optimizer()
+    benchmark_daily_calories()
+    benchmark_wellness_scoring()
+    benchmark_intent_router()
+    benchmark_retrieval()
+    benchmark_chat_writes()
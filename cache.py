@@ -0,0 +1,86 @@
+"""
+Cache Module
+This module provides a small thread-safe LRU cache with optional TTL expiry and
+hit/miss counters, shared by the API modules that memoize expensive results.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+# Every named cache, so their counters can be scraped from one place
+CACHES = {}
+
+
+class LRUCache:
+    """Bounded least-recently-used cache with optional per-entry time-to-live."""
+
+    def __init__(self, name, maxsize=256, ttl=None):
+        """
+        Args:
+            name (str): Name the cache's counters are reported under
+            maxsize (int): Maximum number of entries before the oldest is evicted
+            ttl (float, optional): Seconds an entry stays valid. Defaults to no expiry.
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        CACHES[name] = self
+
+    def get(self, key, default=None):
+        """Get a cached value, counting the lookup as a hit or a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entry when full."""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        """Remove a single entry if it is cached."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove every entry, keeping the counters."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Get the cache counters as a dictionary."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+def get_cache_stats():
+    """Get the counters of every named cache."""
+    return {name: cache.stats() for name, cache in CACHES.items()}
@@ -0,0 +1,168 @@
+"""
+Chat Retention Job
+This module bounds the size of the chat_message table. Messages older than
+CHAT_RETENTION_DAYS are compacted into one ChatSummary row per user and
+category (message counts, time span and the topics asked about), and the
+originals are deleted.
+
+SQLite locks the whole database for a write, so messages are compacted and
+deleted in small batches, each in its own short transaction. A batch's
+summary update and delete commit together, so an interrupted run never
+counts a message twice. Clearing a user's history deletes in batches too.
+
+Usage: python chat_retention.py [--days N]
+"""
+
+import datetime
+import os
+import sys
+import time
+
+from db import db, app, ChatMessage, ChatSummary
+from chatbot_intents import router as intent_router
+
+# Days chat messages are kept before they are compacted
+CHAT_RETENTION_DAYS = int(os.getenv('CHAT_RETENTION_DAYS', 180))
+
+# Messages compacted or deleted per transaction
+CHAT_PURGE_BATCH_SIZE = int(os.getenv('CHAT_PURGE_BATCH_SIZE', 500))
+
+# Seconds the job waits between batches, so request writes can take the lock
+CHAT_PURGE_PAUSE = float(os.getenv('CHAT_PURGE_PAUSE', 0.05))
+
+
+def _fold_messages(summaries, user_id, messages):
+    """Add a batch of one user's messages to their per-category summaries."""
+    topic_counts = {}
+    for message in messages:
+        summary = summaries.get(message.category)
+        if summary is None:
+            summary = ChatSummary(
+                user_id=user_id,
+                category=message.category,
+                message_count=0,
+                user_message_count=0
+            )
+            db.session.add(summary)
+            summaries[message.category] = summary
+
+        summary.message_count += 1
+        if summary.first_message_at is None or message.timestamp < summary.first_message_at:
+            summary.first_message_at = message.timestamp
+        if summary.last_message_at is None or message.timestamp > summary.last_message_at:
+            summary.last_message_at = message.timestamp
+
+        if message.role == 'user':
+            summary.user_message_count += 1
+            intent = intent_router.match(message.content, message.category)
+            counts = topic_counts.setdefault(message.category, {})
+            topic = intent['name'] if intent else 'other'
+            counts[topic] = counts.get(topic, 0) + 1
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for category in {message.category for message in messages}:
+        summary = summaries[category]
+        topics = summary.get_topics()
+        for topic, count in topic_counts.get(category, {}).items():
+            topics[topic] = topics.get(topic, 0) + count
+        summary.set_topics(topics)
+        summary.updated_at = now
+
+
+def compact_user_history(user_id, cutoff, batch_size=CHAT_PURGE_BATCH_SIZE, pause=0):
+    """
+    Compact a user's messages older than a cutoff into their summaries, a batch at a time.
+
+    Returns:
+        int: Number of messages compacted
+    """
+    summaries = {summary.category: summary for summary in ChatSummary.query.filter_by(user_id=user_id)}
+    compacted = 0
+
+    while True:
+        # Oldest first, along the (user_id, timestamp) index
+        messages = db.session.query(
+            ChatMessage.id, ChatMessage.category, ChatMessage.role, ChatMessage.content, ChatMessage.timestamp
+        ).filter(
+            ChatMessage.user_id == user_id,
+            ChatMessage.timestamp < cutoff
+        ).order_by(ChatMessage.timestamp, ChatMessage.id).limit(batch_size).all()
+        if not messages:
+            return compacted
+
+        try:
+            _fold_messages(summaries, user_id, messages)
+            ChatMessage.query.filter(
+                ChatMessage.id.in_([message.id for message in messages])
+            ).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        compacted += len(messages)
+        if pause:
+            time.sleep(pause)
+
+
+def run_retention(days=CHAT_RETENTION_DAYS, batch_size=CHAT_PURGE_BATCH_SIZE, pause=CHAT_PURGE_PAUSE):
+    """
+    Compact every user's messages older than the retention period.
+
+    Returns:
+        dict: Number of users touched and of messages compacted
+    """
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
+    user_ids = [
+        row[0] for row in db.session.query(ChatMessage.user_id)
+        .filter(ChatMessage.timestamp < cutoff)
+        .distinct()
+        .order_by(ChatMessage.user_id)
+    ]
+
+    compacted = 0
+    for user_id in user_ids:
+        try:
+            compacted += compact_user_history(user_id, cutoff, batch_size, pause)
+        except Exception as e:
+            print(f"Error compacting chat history for user {user_id}: {str(e)}")
+
+    return {'users': len(user_ids), 'compacted': compacted}
+
+
+def delete_chat_history(user_id, category=None, batch_size=CHAT_PURGE_BATCH_SIZE):
+    """
+    Delete a user's chat messages and summaries, in one category or all, a batch at a time.
+
+    Returns:
+        int: Number of messages deleted
+    """
+    query = db.session.query(ChatMessage.id).filter(ChatMessage.user_id == user_id)
+    summaries = ChatSummary.query.filter_by(user_id=user_id)
+    if category is not None:
+        query = query.filter(ChatMessage.category == category)
+        summaries = summaries.filter_by(category=category)
+
+    deleted = 0
+    while True:
+        ids = [row[0] for row in query.limit(batch_size)]
+        if not ids:
+            break
+        ChatMessage.query.filter(ChatMessage.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        deleted += len(ids)
+
+    summaries.delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    retention_days = int(args[args.index('--days') + 1]) if '--days' in args else CHAT_RETENTION_DAYS
+
+    with app.app_context():
+        db.create_all()
+        result = run_retention(retention_days)
+        print(f"Compacted {result['compacted']} chat messages older than {retention_days} days "
+              f"for {result['users']} users")
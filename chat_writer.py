@@ -0,0 +1,216 @@
+"""
+Chat Writer Module
+This module persists chatbot messages off the request path.
+
+In write-behind mode (the default) rows are buffered in memory and inserted
+by a background thread in one batched transaction once CHAT_FLUSH_SIZE rows
+are waiting or CHAT_FLUSH_INTERVAL seconds have passed, and whatever is left
+is flushed when the process exits. A crash that skips that final flush loses
+at most the last interval's messages. Buffered rows are visible through
+``pending`` until they are committed, so a user's history stays consistent.
+
+A batch that fails is retried ahead of newer rows up to CHAT_FLUSH_ATTEMPTS
+times. After that its rows are inserted one by one and any row that still
+fails is appended to CHAT_FAILED_LOG as a JSON line, so one bad row can't
+hold back the buffer.
+
+The buffer belongs to one process. ``pending`` and ``discard`` only see this
+process's rows, so with several workers a user's history may miss messages
+another worker hasn't flushed yet, and a clear can be followed by rows that
+another worker flushes afterwards, for at most CHAT_FLUSH_INTERVAL. Use
+sync mode where that matters.
+
+In sync mode rows are written immediately, with all rows of a call (both
+turns of a chat exchange) in one transaction.
+"""
+
+import atexit
+import json
+import os
+import threading
+
+from db import db, app, ChatMessage
+
+# 'write_behind' to batch inserts on a background thread, or 'sync'
+CHAT_WRITE_MODE = os.getenv('CHAT_WRITE_MODE', 'write_behind')
+
+# Buffered rows that trigger a flush, and the longest a row waits in seconds
+CHAT_FLUSH_SIZE = int(os.getenv('CHAT_FLUSH_SIZE', 64))
+CHAT_FLUSH_INTERVAL = float(os.getenv('CHAT_FLUSH_INTERVAL', 0.5))
+
+# Failed flushes of a batch before its rows are written one by one, and where rows that still fail go
+CHAT_FLUSH_ATTEMPTS = int(os.getenv('CHAT_FLUSH_ATTEMPTS', 3))
+CHAT_FAILED_LOG = os.getenv('CHAT_FAILED_LOG', os.path.join(app.instance_path, 'chat_failed_messages.jsonl'))
+
+
+class ChatWriter:
+    """
+    Buffer ChatMessage rows and insert them in batches.
+
+    Rows are dicts of ChatMessage column values.
+    """
+
+    def __init__(self, mode=CHAT_WRITE_MODE, batch_size=CHAT_FLUSH_SIZE, interval=CHAT_FLUSH_INTERVAL, engine=None,
+                 max_attempts=CHAT_FLUSH_ATTEMPTS, failed_log=CHAT_FAILED_LOG):
+        self.mode = mode
+        self.batch_size = batch_size
+        self.interval = interval
+        self.engine = engine
+        self.max_attempts = max_attempts
+        self.failed_log = failed_log
+        self.flushed = 0
+        self.batches = 0
+        self.failed = 0
+        self._attempts = 0
+        self._rows = []
+        self._inflight = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+
+    def _get_engine(self):
+        """Get the engine rows are inserted with."""
+        if self.engine is not None:
+            return self.engine
+        with app.app_context():
+            return db.engine
+
+    def _ensure_thread(self):
+        """Start the flush thread, again in a child process after a fork."""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._rows, self._inflight = [], []
+        self._thread = threading.Thread(target=self._run, name='chat-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, rows):
+        """Persist rows, now in sync mode or by the flush thread in write-behind mode."""
+        if self.mode == 'sync' or self._closed:
+            # One transaction for every row of the call
+            db.session.execute(ChatMessage.__table__.insert(), rows)
+            db.session.commit()
+            return
+
+        with self._lock:
+            self._ensure_thread()
+            self._rows.extend(rows)
+            full = len(self._rows) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def pending(self, user_id, category=None):
+        """Get a user's rows that are buffered or being inserted, oldest first."""
+        with self._lock:
+            rows = self._inflight + self._rows
+        return [
+            row for row in rows
+            if row['user_id'] == user_id and (category is None or row['category'] == category)
+        ]
+
+    def discard(self, user_id, category=None):
+        """
+        Drop a user's buffered rows, in one category or all, once any insert in progress is done.
+
+        Returns:
+            int: Number of rows dropped
+        """
+        with self._flush_lock:
+            with self._lock:
+                kept = [
+                    row for row in self._rows
+                    if row['user_id'] != user_id or (category is not None and row['category'] != category)
+                ]
+                dropped = len(self._rows) - len(kept)
+                self._rows = kept
+        return dropped
+
+    def flush(self):
+        """
+        Insert every buffered row in one transaction.
+
+        Returns:
+            int: Number of rows inserted
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._rows:
+                    return 0
+                self._inflight, self._rows = self._rows, []
+
+            rows = self._inflight
+            try:
+                with self._get_engine().begin() as connection:
+                    connection.execute(ChatMessage.__table__.insert(), rows)
+            except Exception:
+                self._attempts += 1
+                if self._attempts < self.max_attempts:
+                    # Keep the rows, ahead of newer ones, for the next flush
+                    with self._lock:
+                        self._rows = rows + self._rows
+                        self._inflight = []
+                    raise
+                inserted = self._insert_each(rows)
+            else:
+                inserted = len(rows)
+
+            with self._lock:
+                self._inflight = []
+            self._attempts = 0
+            self.flushed += inserted
+            self.batches += 1
+            return inserted
+
+    def _insert_each(self, rows):
+        """Insert rows one per transaction, logging the ones that fail."""
+        inserted = 0
+        engine = self._get_engine()
+        for row in rows:
+            try:
+                with engine.begin() as connection:
+                    connection.execute(ChatMessage.__table__.insert(), [row])
+                inserted += 1
+            except Exception as e:
+                print(f"Error writing chat message for user {row['user_id']}, logged to {self.failed_log}: {str(e)}")
+                os.makedirs(os.path.dirname(self.failed_log) or '.', exist_ok=True)
+                with open(self.failed_log, 'a', encoding='utf-8') as log:
+                    log.write(json.dumps(row, default=str) + '\n')
+                self.failed += 1
+        return inserted
+
+    def _run(self):
+        """Flush on a full buffer or every interval until closed."""
+        while not self._closed:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing chat messages: {str(e)}")
+
+    def close(self):
+        """Stop the flush thread and durably write every buffered row."""
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+        self.flush()
+
+    def stats(self):
+        """Get the writer's mode, buffered rows and flush counts."""
+        with self._lock:
+            buffered = len(self._rows) + len(self._inflight)
+        return {
+            'mode': self.mode,
+            'buffered': buffered,
+            'flushed': self.flushed,
+            'batches': self.batches,
+            'failed': self.failed
+        }
+
+
+chat_writer = ChatWriter()
+atexit.register(chat_writer.close)
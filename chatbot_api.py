@@ -3,15 +3,40 @@ Chatbot API Module
 This module provides API endpoints for the AI fitness and diet chatbot.
 """
 
-from flask import Blueprint, request, jsonify, render_template, session
+from flask import Blueprint, request, jsonify, render_template, session, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import and_, or_
 from db import db, User, ChatMessage, HealthStat
+from chatbot_intents import router as intent_router
+from chatbot_retrieval import find_document, index_version
+from chat_writer import chat_writer
+from chat_retention import delete_chat_history
+from health_rollups import commit_health_stats
+from chatbot_backends import CHATBOT_BACKEND, BackendError, RuleBackend, create_backend
+from admin_api import admin_required
+from cache import LRUCache
 import datetime
+import json
 import os
 import re
 
 chatbot_bp = Blueprint('chatbot', __name__)
 
+# Page sizes for reading a user's chat history
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+# Answers to repeated questions, by category and normalized message, shared by every user.
+# Entries hold which answer a message resolves to; profile fields are filled in per user.
+answer_cache = LRUCache(
+    'chatbot_answers',
+    maxsize=int(os.getenv('CHATBOT_ANSWER_CACHE_SIZE', 4096)),
+    ttl=int(os.getenv('CHATBOT_ANSWER_CACHE_TTL', 3600))
+)
+
+# Version of the knowledge base index the cached answers were resolved against
+answers_index_version = None
+
 # Constants for the chatbot
 # Using a rule-based approach instead of OpenAI API
 
@@ -96,11 +121,10 @@ def send_message():
         conversation_history = get_conversation_history(user.id, category, limit=10)
 
         # Generate response from AI
-        ai_response = generate_ai_response(user_message, conversation_history, category, user)
+        ai_response = ''.join(stream_reply(user_message, conversation_history, category, user))
 
         # Save the user message and AI response to the database
-        save_message(user.id, "user", user_message, category)
-        save_message(user.id, "assistant", ai_response, category)
+        save_turn(user.id, category, user_message, ai_response)
 
         return jsonify({
             "response": ai_response,
@@ -110,10 +134,72 @@ def send_message():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@chatbot_bp.route('/api/chatbot/message/stream', methods=['POST'])
+@jwt_required()
+def stream_message():
+    """
+    Send a message to the chatbot and stream the response as server-sent events.
+
+    Each "chunk" event carries the next piece of the response as it is
+    generated, and a final "done" event follows once the exchange is saved.
+    An "error" event ends a reply that failed part way; nothing is saved then.
+    """
+    try:
+        # Get the current user
+        current_user_identity = get_jwt_identity()
+        user = User.query.filter_by(email=current_user_identity['email']).first()
+
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        # Get request data
+        data = request.get_json()
+
+        if 'message' not in data:
+            return jsonify({"error": "Message is required"}), 400
+
+        user_message = data['message']
+        category = data.get('category', 'fitness')  # Default to fitness if not specified
+
+        # Validate category
+        if category not in SYSTEM_PROMPTS:
+            return jsonify({"error": f"Invalid category. Choose from: {', '.join(SYSTEM_PROMPTS.keys())}"}), 400
+
+        # Get conversation history
+        conversation_history = get_conversation_history(user.id, category, limit=10)
+        user_id = user.id
+
+        def generate():
+            chunks = []
+            try:
+                for chunk in stream_reply(user_message, conversation_history, category, user):
+                    chunks.append(chunk)
+                    yield sse_event('chunk', {"text": chunk})
+            except Exception as e:
+                yield sse_event('error', {"error": str(e)})
+                return
+
+            # Saved once, after the whole response has been sent
+            save_turn(user_id, category, user_message, ''.join(chunks))
+            yield sse_event('done', {"category": category})
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Keep reverse proxies from buffering the stream
+        })
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @chatbot_bp.route('/api/chatbot/history', methods=['GET'])
 @jwt_required()
 def get_history():
-    """Get the chat history for the current user."""
+    """
+    Get a page of the current user's chat history, in chronological order.
+
+    The newest messages are returned by default. Pass the id of a message as
+    before or after to page to older or newer messages.
+    """
     try:
         # Get the current user
         current_user_identity = get_jwt_identity()
@@ -124,17 +210,53 @@ def get_history():
 
         # Get query parameters
         category = request.args.get('category', 'fitness')  # Default to fitness if not specified
-        limit = request.args.get('limit', 50, type=int)
+        limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), MAX_HISTORY_PAGE_SIZE)
+        before = request.args.get('before', type=int)
+        after = request.args.get('after', type=int)
+
+        if before is not None and after is not None:
+            return jsonify({"error": "Pass only one of before and after"}), 400
 
         # Validate category
         if category not in SYSTEM_PROMPTS and category != 'all':
             return jsonify({"error": f"Invalid category. Choose from: {', '.join(SYSTEM_PROMPTS.keys())} or 'all'"}), 400
 
+        # Write out buffered messages so the history is complete
+        try:
+            chat_writer.flush()
+        except Exception as e:
+            print(f"Error flushing chat messages: {str(e)}")
+
         # Get conversation history
-        if category == 'all':
-            messages = ChatMessage.query.filter_by(user_id=user.id).order_by(ChatMessage.timestamp.asc()).limit(limit).all()
+        query = ChatMessage.query.filter_by(user_id=user.id)
+        if category != 'all':
+            query = query.filter_by(category=category)
+
+        cursor = before if before is not None else after
+        if cursor is not None:
+            cursor_timestamp = db.session.query(ChatMessage.timestamp).filter_by(id=cursor, user_id=user.id).scalar()
+            if cursor_timestamp is None:
+                return jsonify({"error": "Invalid cursor"}), 400
+
+        # Keyset over (timestamp, id), walking the history index away from the cursor
+        if after is not None:
+            query = query.filter(or_(
+                ChatMessage.timestamp > cursor_timestamp,
+                and_(ChatMessage.timestamp == cursor_timestamp, ChatMessage.id > after)
+            )).order_by(ChatMessage.timestamp.asc(), ChatMessage.id.asc())
         else:
-            messages = ChatMessage.query.filter_by(user_id=user.id, category=category).order_by(ChatMessage.timestamp.asc()).limit(limit).all()
+            if before is not None:
+                query = query.filter(or_(
+                    ChatMessage.timestamp < cursor_timestamp,
+                    and_(ChatMessage.timestamp == cursor_timestamp, ChatMessage.id < before)
+                ))
+            query = query.order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc())
+
+        messages = query.limit(limit + 1).all()
+        has_more = len(messages) > limit
+        messages = messages[:limit]
+        if after is None:
+            messages.reverse()  # Reverse to get chronological order
 
         # Format messages
         formatted_messages = []
@@ -149,7 +271,10 @@ def get_history():
 
         return jsonify({
             "messages": formatted_messages,
-            "category": category
+            "category": category,
+            "has_more": has_more,  # More messages past this page, older unless paging with after
+            "before": messages[0].id if messages else before,
+            "after": messages[-1].id if messages else after
         }), 200
 
     except Exception as e:
@@ -171,17 +296,15 @@ def clear_history():
         data = request.get_json()
         category = data.get('category', 'all')  # Default to all if not specified
 
-        # Delete messages
-        if category == 'all':
-            ChatMessage.query.filter_by(user_id=user.id).delete()
-        else:
-            # Validate category
-            if category not in SYSTEM_PROMPTS:
-                return jsonify({"error": f"Invalid category. Choose from: {', '.join(SYSTEM_PROMPTS.keys())}"}), 400
+        # Validate category
+        if category != 'all' and category not in SYSTEM_PROMPTS:
+            return jsonify({"error": f"Invalid category. Choose from: {', '.join(SYSTEM_PROMPTS.keys())}"}), 400
 
-            ChatMessage.query.filter_by(user_id=user.id, category=category).delete()
+        # Drop buffered messages first so none of them are written after the delete
+        chat_writer.discard(user.id, None if category == 'all' else category)
 
-        db.session.commit()
+        # Delete messages in batches, each its own short transaction
+        delete_chat_history(user.id, None if category == 'all' else category)
 
         return jsonify({
             "message": f"Chat history for category '{category}' cleared successfully"
@@ -191,424 +314,148 @@ def clear_history():
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@chatbot_bp.route('/api/chatbot/admin/cache-stats', methods=['GET'])
+@admin_required
+def get_answer_cache_stats():
+    """Get the hit rate of the chatbot answer cache and the state of the message writer."""
+    try:
+        return jsonify({
+            "answers": answer_cache.stats(),
+            "writer": chat_writer.stats()
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 def get_conversation_history(user_id, category, limit=10):
     """Get the conversation history for a user in a specific category."""
-    messages = ChatMessage.query.filter_by(user_id=user_id, category=category).order_by(ChatMessage.timestamp.desc()).limit(limit).all()
-    messages.reverse()  # Reverse to get chronological order
+    # Buffered rows first: a flush between the two reads moves rows into the
+    # table, where the query still finds them, rather than out of both
+    pending = chat_writer.pending(user_id, category)
+    messages = db.session.query(ChatMessage.timestamp, ChatMessage.role, ChatMessage.content).filter_by(
+        user_id=user_id, category=category
+    ).order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(limit).all()
+    messages = [tuple(message) for message in reversed(messages)]  # Reverse to get chronological order
+
+    # Include messages still waiting to be written, skipping any committed meanwhile
+    committed = set(messages)
+    messages.extend(
+        (row['timestamp'], row['role'], row['content'])
+        for row in pending
+        if (row['timestamp'], row['role'], row['content']) not in committed
+    )
+    # Stable, so committed messages sharing a timestamp keep their id order
+    messages = sorted(messages, key=lambda message: message[0])[-limit:]
 
     # Format messages for the AI
     formatted_messages = []
-    for message in messages:
+    for _, role, content in messages:
         formatted_messages.append({
-            "role": message.role,
-            "content": message.content
+            "role": role,
+            "content": content
         })
 
     return formatted_messages
 
-def save_message(user_id, role, content, category):
-    """Save a message to the database."""
-    message = ChatMessage(
-        user_id=user_id,
-        role=role,
-        content=content,
-        category=category,
-        timestamp=datetime.datetime.now()
-    )
-
-    db.session.add(message)
-    db.session.commit()
-
-    return message
+def save_turn(user_id, category, user_message, ai_response):
+    """Save a user message and the assistant's response to the database."""
+    asked_at = datetime.datetime.now()
+    # The response is always ordered after the message it answers
+    answered_at = max(datetime.datetime.now(), asked_at + datetime.timedelta(microseconds=1))
+
+    chat_writer.write([
+        {'user_id': user_id, 'role': 'user', 'content': user_message, 'category': category, 'timestamp': asked_at},
+        {'user_id': user_id, 'role': 'assistant', 'content': ai_response, 'category': category, 'timestamp': answered_at}
+    ])
+
+def sse_event(event, data):
+    """Format a server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_reply(user_message, conversation_history, category, user):
+    """Yield the response to a message from the configured backend, in chunks."""
+    backend = chat_backend
+    # Progress tracking commands save data, which only the rule engine does
+    if category == 'progress' and extract_progress_data(user_message):
+        backend = rule_backend
+
+    sent = False
+    try:
+        for chunk in backend.stream(user_message, conversation_history, category, user):
+            sent = True
+            yield chunk
+    except BackendError as e:
+        if sent:
+            raise
+        print(f"Chat backend '{backend.name}' failed, answering with the rule engine: {str(e)}")
+        yield from rule_backend.stream(user_message, conversation_history, category, user)
+
+def normalize_message(message):
+    """Lowercase a message and collapse its whitespace, so repeats of a question share an answer."""
+    return ' '.join(message.lower().split())
+
+def resolve_answer(message, category):
+    """
+    Get which answer a normalized message resolves to.
+
+    Returns:
+        tuple: ('intent', intent name), ('text', knowledge base text) or ('default', None)
+    """
+    # Since we don't have an OpenAI API key, we use a rule-based approach:
+    # intents declared in chatbot_intents, matched with one compiled keyword scan
+    intent = intent_router.match(message, category)
+    if intent is not None:
+        return ('intent', intent['name'])
+
+    # Otherwise answer from the offline knowledge base when a document is close enough
+    document = find_document(message, category)
+    if document is not None:
+        if document.get('intent'):
+            return ('intent', document['intent'])
+        return ('text', document['text'])
+
+    return ('default', None)
+
+def get_answer(message, category):
+    """Get which answer a normalized message resolves to, cached until the knowledge base index changes."""
+    global answers_index_version
+    version = index_version()
+    if version != answers_index_version:
+        answer_cache.clear()
+        answers_index_version = version
+
+    key = (category, message)
+    answer = answer_cache.get(key)
+    if answer is None:
+        try:
+            answer = resolve_answer(message, category)
+        except Exception as e:
+            # Not cached, so the message is resolved again once the index can be searched
+            print(f"Error searching chatbot knowledge base: {str(e)}")
+            return ('default', None)
+        answer_cache.set(key, answer)
+    return answer
 
 def generate_ai_response(user_message, conversation_history, category, user):
     """Generate a response from the AI model."""
-    # Check if the message is a progress tracking command
+    # Check if the message is a progress tracking command; these save data, so are never cached
     progress_data = extract_progress_data(user_message)
     if progress_data and category == 'progress':
         # Save the progress data
         save_progress_data(user, progress_data)
         return generate_progress_response(progress_data, user)
 
-    # Since we don't have an OpenAI API key, we'll use a rule-based approach
-    # with predefined responses for common questions in each category
-
-    # Convert user message to lowercase for easier matching
-    user_message_lower = user_message.lower()
-
-    # Get user profile information for more personalized responses
-    user_name = user.name if user and user.name else "there"
-    user_weight = user.weight_kg if user and user.weight_kg else None
-    user_height = user.height_cm if user and user.height_cm else None
-    user_gender = user.gender if user and user.gender else None
-    user_age = user.age if user and user.age else None
-    user_activity = user.activity_level if user and user.activity_level else "moderate"
-    user_diet_goal = user.diet_goal if user and user.diet_goal else "maintain"
-    user_diet_type = user.diet_type if user and user.diet_type else "balanced"
-
-    # Common responses for all categories
-    if "hello" in user_message_lower or "hi" in user_message_lower or "hey" in user_message_lower:
-        return f"Hello {user_name}! How can I help you with your {category} goals today?"
-
-    if "thank" in user_message_lower:
-        return f"You're welcome! I'm here to help with all your {category} needs. Is there anything else you'd like to know?"
-
-    if "bye" in user_message_lower or "goodbye" in user_message_lower:
-        return f"Goodbye! Remember to stay consistent with your {category} routine. Come back anytime you need advice!"
-
-    # Category-specific responses
-    if category == "fitness":
-        if "beginner" in user_message_lower and ("workout" in user_message_lower or "routine" in user_message_lower):
-            return """Here's a beginner workout routine you can try:
-
-1. **Monday**: Full Body
-   - Bodyweight squats: 3 sets of 12
-   - Push-ups (or knee push-ups): 3 sets of 10
-   - Walking lunges: 3 sets of 10 per leg
-   - Plank: 3 sets, hold for 30 seconds
-
-2. **Wednesday**: Cardio
-   - 30 minutes of brisk walking or light jogging
-   - 10 minutes of jumping jacks and high knees (alternate 30 seconds each)
-
-3. **Friday**: Full Body
-   - Glute bridges: 3 sets of 15
-   - Dumbbell rows (or doorway rows): 3 sets of 12
-   - Bicycle crunches: 3 sets of 20
-   - Wall sit: 3 sets, hold for 30 seconds
-
-Start with this for 2-3 weeks, then gradually increase intensity. Remember to warm up before and stretch after each workout!"""
-
-        if "lose weight" in user_message_lower and "workout" in user_message_lower:
-            return """For weight loss, combine these workouts with a calorie deficit diet:
-
-1. **HIIT Workout** (3x per week):
-   - 30 seconds jumping jacks
-   - 30 seconds mountain climbers
-   - 30 seconds burpees
-   - 30 seconds high knees
-   - 30 seconds rest
-   - Repeat 5 times
-
-2. **Strength Training** (2x per week):
-   - Squats: 3 sets of 15
-   - Push-ups: 3 sets of 10-15
-   - Lunges: 3 sets of 12 per leg
-   - Dumbbell rows: 3 sets of 12
-   - Plank: 3 sets of 45 seconds
-
-3. **Low-Intensity Cardio** (1-2x per week):
-   - 45-60 minutes of brisk walking, swimming, or cycling
-
-Remember, consistency is key for weight loss. Aim to be active most days of the week!"""
-
-        if "build muscle" in user_message_lower:
-            return """To build muscle, focus on progressive overload and adequate protein intake:
-
-**4-Day Split Routine:**
-
-1. **Day 1: Chest & Triceps**
-   - Bench press: 4 sets of 8-10 reps
-   - Incline dumbbell press: 3 sets of 10-12 reps
-   - Chest flies: 3 sets of 12-15 reps
-   - Tricep dips: 3 sets of 10-12 reps
-   - Tricep pushdowns: 3 sets of 12-15 reps
-
-2. **Day 2: Back & Biceps**
-   - Pull-ups or lat pulldowns: 4 sets of 8-10 reps
-   - Bent-over rows: 3 sets of 10-12 reps
-   - Seated cable rows: 3 sets of 12 reps
-   - Bicep curls: 3 sets of 10-12 reps
-   - Hammer curls: 3 sets of 12-15 reps
-
-3. **Day 3: Rest or Light Cardio**
-
-4. **Day 4: Legs & Shoulders**
-   - Squats: 4 sets of 8-10 reps
-   - Leg press: 3 sets of 10-12 reps
-   - Romanian deadlifts: 3 sets of 10-12 reps
-   - Shoulder press: 3 sets of 10-12 reps
-   - Lateral raises: 3 sets of 12-15 reps
-
-5. **Day 5: Core & Arms**
-   - Weighted crunches: 3 sets of 15-20 reps
-   - Russian twists: 3 sets of 20 reps
-   - Plank: 3 sets of 45-60 seconds
-   - Skull crushers: 3 sets of 12 reps
-   - Concentration curls: 3 sets of 12 reps
-
-Ensure you're eating in a slight caloric surplus with 1.6-2g of protein per kg of bodyweight!"""
-
-        if "how many" in user_message_lower and "calories" in user_message_lower and "burn" in user_message_lower:
-            # Calculate estimated calories burned based on user profile
-            if user_weight and user_height and user_gender and user_age:
-                # Basic calculation for demonstration purposes
-                if user_gender.lower() == "male":
-                    bmr = 10 * user_weight + 6.25 * user_height - 5 * user_age + 5
-                else:
-                    bmr = 10 * user_weight + 6.25 * user_height - 5 * user_age - 161
-
-                activity_multipliers = {
-                    "sedentary": 1.2,
-                    "light": 1.375,
-                    "moderate": 1.55,
-                    "active": 1.725,
-                    "very_active": 1.9
-                }
-
-                multiplier = activity_multipliers.get(user_activity, 1.55)
-                daily_calories = int(bmr * multiplier)
-
-                return f"Based on your profile (weight: {user_weight}kg, height: {user_height}cm, age: {user_age}, gender: {user_gender}, activity level: {user_activity}), you burn approximately {daily_calories} calories per day. To lose weight, aim for a deficit of 500 calories per day through diet and exercise."
-            else:
-                return "The number of calories you burn depends on your weight, height, age, gender, and activity level. A moderately active adult typically burns between 1,800 and 2,400 calories per day. For a personalized estimate, please update your profile with your weight, height, age, and gender."
-
-    elif category == "diet":
-        if "meal plan" in user_message_lower or "diet plan" in user_message_lower:
-            if user_diet_goal == "lose":
-                calorie_target = "lower-calorie"
-                focus = "weight loss"
-            elif user_diet_goal == "gain":
-                calorie_target = "higher-calorie"
-                focus = "muscle gain"
-            else:
-                calorie_target = "balanced"
-                focus = "maintenance"
-
-            diet_type_desc = user_diet_type.capitalize()
-
-            return f"""Here's a sample {diet_type_desc} meal plan for {focus}:
-
-**Breakfast:**
-- Overnight oats with berries and nuts
-- Greek yogurt with honey
-- Green tea or black coffee
-
-**Mid-morning Snack:**
-- Apple with 1 tablespoon almond butter
-- Small handful of mixed nuts
-
-**Lunch:**
-- Grilled chicken or tofu salad with mixed greens
-- Quinoa or brown rice (½ cup)
-- Olive oil and lemon dressing
-- Water with lemon
-
-**Afternoon Snack:**
-- Protein smoothie with banana and spinach
-- Carrot sticks with hummus
-
-**Dinner:**
-- Baked salmon or lentils
-- Roasted vegetables (broccoli, bell peppers, zucchini)
-- Sweet potato (medium)
-- Herbal tea
-
-This is a {calorie_target} plan that follows {diet_type_desc} principles. Adjust portion sizes based on your specific calorie needs and preferences."""
-
-        if "protein" in user_message_lower and ("how much" in user_message_lower or "how many" in user_message_lower):
-            if user_weight:
-                if user_diet_goal == "gain":
-                    protein_g = round(user_weight * 1.8)
-                    return f"For muscle building, you should aim for approximately {protein_g}g of protein daily (about 1.8g per kg of body weight). With your weight of {user_weight}kg, this is your target. Spread your protein intake throughout the day for optimal muscle protein synthesis."
-                else:
-                    protein_g = round(user_weight * 1.4)
-                    return f"Based on your weight of {user_weight}kg, you should aim for approximately {protein_g}g of protein daily (about 1.4g per kg of body weight). This will help maintain muscle mass while supporting your overall health."
-            else:
-                return "The recommended protein intake is typically 1.2-2.0g per kg of body weight, depending on your goals. For general health, aim for at least 0.8g/kg. For muscle building, aim for 1.6-2.0g/kg. For weight loss while preserving muscle, aim for 1.4-1.8g/kg. Update your profile with your weight for a more personalized recommendation."
-
-        if "breakfast" in user_message_lower and ("idea" in user_message_lower or "suggestion" in user_message_lower):
-            return """Here are some healthy breakfast ideas:
-
-1. **Greek Yogurt Parfait**
-   - Greek yogurt, mixed berries, granola, and a drizzle of honey
-
-2. **Avocado Toast**
-   - Whole grain toast, mashed avocado, poached egg, and a sprinkle of red pepper flakes
-
-3. **Protein Smoothie**
-   - Blend protein powder, banana, spinach, almond milk, and a tablespoon of nut butter
-
-4. **Overnight Oats**
-   - Oats soaked in milk or yogurt with chia seeds, cinnamon, and topped with fruit and nuts
-
-5. **Veggie Omelette**
-   - Eggs with spinach, bell peppers, onions, and a small amount of cheese
-
-6. **Breakfast Burrito**
-   - Whole grain wrap with scrambled eggs, black beans, salsa, and avocado
-
-Choose options that align with your dietary preferences and goals!"""
-
-    elif category == "wellness":
-        if "stress" in user_message_lower and ("reduce" in user_message_lower or "manage" in user_message_lower):
-            return """Here are effective stress management techniques:
-
-1. **Deep Breathing**
-   - Practice 4-7-8 breathing: Inhale for 4 seconds, hold for 7, exhale for 8
-   - Do this for 5 minutes whenever you feel stressed
-
-2. **Progressive Muscle Relaxation**
-   - Tense and then release each muscle group from toes to head
-   - This helps identify and release physical tension
-
-3. **Mindfulness Meditation**
-   - Start with just 5 minutes daily
-   - Focus on your breath and gently return attention when your mind wanders
-
-4. **Physical Activity**
-   - Even a 10-minute walk can reduce stress hormones
-   - Find movement you enjoy rather than forcing yourself to exercise
-
-5. **Nature Time**
-   - Spend 20 minutes outdoors daily
-   - "Forest bathing" has been shown to lower cortisol levels
-
-6. **Digital Detox**
-   - Set boundaries for technology use
-   - Try a 1-hour phone-free period before bed
-
-Remember, stress management is personal - experiment to find what works best for you!"""
-
-        if "sleep" in user_message_lower and ("better" in user_message_lower or "improve" in user_message_lower):
-            return """To improve your sleep quality:
-
-1. **Consistent Schedule**
-   - Go to bed and wake up at the same time daily, even on weekends
-   - This regulates your body's internal clock
-
-2. **Bedtime Routine**
-   - Create a 30-minute wind-down ritual
-   - Try reading, gentle stretching, or meditation
-
-3. **Optimize Your Environment**
-   - Keep your bedroom cool (65-68°F/18-20°C)
-   - Ensure it's dark and quiet (use blackout curtains and white noise if needed)
-   - Invest in a comfortable mattress and pillows
-
-4. **Limit Screen Time**
-   - Avoid screens 1 hour before bed (blue light blocks melatonin)
-   - Use night mode on devices if you must use them
-
-5. **Watch What You Consume**
-   - Avoid caffeine after 2pm
-   - Limit alcohol (it disrupts REM sleep)
-   - Don't eat heavy meals within 3 hours of bedtime
-
-6. **Daytime Habits**
-   - Get natural sunlight exposure during the day
-   - Exercise regularly, but not too close to bedtime
-   - Limit naps to 20 minutes early in the day
-
-If sleep problems persist for more than a month, consider consulting a healthcare provider."""
-
-        if "meditat" in user_message_lower and ("how" in user_message_lower or "beginner" in user_message_lower):
-            return """**Beginner's Guide to Meditation:**
-
-1. **Start Small**
-   - Begin with just 5 minutes daily
-   - Gradually increase to 15-20 minutes as you become comfortable
-
-2. **Find a Quiet Space**
-   - Choose a spot with minimal distractions
-   - You don't need a special setup - just a comfortable place to sit
-
-3. **Get Comfortable**
-   - Sit on a chair, cushion, or mat with your back straight but not rigid
-   - You can also lie down if sitting is uncomfortable (but you might fall asleep!)
-
-4. **Basic Technique**
-   - Focus on your breath - the sensation of air entering and leaving your nostrils
-   - When your mind wanders (it will!), gently bring attention back to your breath
-   - No need to clear your mind completely - just practice returning to your focus
-
-5. **Try Guided Meditation**
-   - Apps like Headspace, Calm, or Insight Timer offer free guided sessions
-   - These are helpful for beginners who benefit from instructions
-
-6. **Be Consistent**
-   - Meditate at the same time each day to build a habit
-   - Morning works well for many people before the day gets busy
-
-7. **Be Kind to Yourself**
-   - Don't judge yourself when your mind wanders
-   - Each time you notice and return focus is a success, not a failure
-
-Remember, meditation is a practice - benefits come with consistency rather than perfection."""
-
-    elif category == "progress":
-        if "track" in user_message_lower and ("progress" in user_message_lower or "fitness" in user_message_lower):
-            return """Here's how to effectively track your fitness progress:
-
-1. **Body Measurements**
-   - Weight: Weigh yourself at the same time of day (morning is best)
-   - Measurements: Track waist, hips, chest, arms, and thighs monthly
-   - Body fat percentage: Consider using calipers or a smart scale
-
-2. **Performance Metrics**
-   - Strength: Record weights, sets, and reps for key exercises
-   - Endurance: Track distance, time, or pace for cardio activities
-   - Flexibility: Note how far you can stretch in specific positions
-
-3. **Daily Habits**
-   - Steps: Aim for 7,000-10,000 steps daily
-   - Water intake: Track ounces or glasses consumed
-   - Sleep: Record hours and quality
-
-4. **Photo Documentation**
-   - Take progress photos monthly in the same lighting, poses, and clothing
-   - These can reveal changes that numbers don't show
-
-5. **Subjective Measures**
-   - Energy levels: Rate on a scale of 1-10
-   - Mood: Note how exercise affects your mental state
-   - Recovery: Track soreness and recovery time
-
-6. **Digital Tools**
-   - Use our chat feature to log data (e.g., "Weight: 75kg" or "Ran 5km in 30 minutes")
-   - Connect fitness trackers or apps for automated tracking
-
-Remember to track consistently but don't become obsessive. The goal is to gather useful data to guide your journey, not to create another source of stress."""
-
-        if "goal" in user_message_lower and ("set" in user_message_lower or "setting" in user_message_lower):
-            return """**SMART Goal Setting for Fitness Success:**
-
-1. **Specific**
-   - Instead of "get fit," try "be able to run 5km without stopping"
-   - Define exactly what you want to accomplish
-
-2. **Measurable**
-   - Include metrics to track progress
-   - Example: "Increase squat weight from 50kg to 70kg"
-
-3. **Achievable**
-   - Set challenging but realistic goals based on your starting point
-   - Consider your schedule, resources, and current fitness level
-
-4. **Relevant**
-   - Choose goals that align with your values and long-term vision
-   - Ask: "Why does this matter to me personally?"
-
-5. **Time-bound**
-   - Set a deadline to create urgency
-   - Example: "Complete a pull-up by December 31st"
-
-**Types of Goals to Consider:**
-- **Process goals:** Daily actions (exercise 4x/week)
-- **Performance goals:** Specific achievements (run 5km in under 30 minutes)
-- **Outcome goals:** End results (lose 5kg of fat)
-
-**Pro Tips:**
-- Write your goals down and review them regularly
-- Share goals with someone for accountability
-- Break big goals into smaller milestones
-- Celebrate progress along the way
-- Adjust goals as needed - flexibility is key
-
-Would you like help setting a specific SMART goal based on your current situation?"""
+    kind, value = get_answer(normalize_message(user_message), category)
+    if kind == 'intent':
+        # Rendered per request from only the profile fields the intent's response reads
+        return intent_router.render(intent_router.intents_by_name[value], category, user)
+    if kind == 'text':
+        return value
+    return intent_router.default_response.format(category=category)
 
-    # Default response if no specific match is found
-    return f"Thank you for your question about {category}. I'm currently operating in offline mode with limited responses. Could you try asking something more specific about {category} routines, best practices, or recommendations? I have information about common topics in this area."
+# The rule engine above, and the backend replying to messages (CHATBOT_BACKEND)
+rule_backend = RuleBackend(generate_ai_response)
+chat_backend = create_backend(CHATBOT_BACKEND, rule_backend)
 
 def extract_progress_data(message):
     """Extract progress data from a user message."""
@@ -672,7 +519,7 @@ def save_progress_data(user, progress_data):
         else:
             health_stat.notes = f"Workout: {progress_data['workout']}"
 
-    db.session.commit()
+    commit_health_stats()
 
 def generate_progress_response(progress_data, user):
     """Generate a response for progress tracking."""
@@ -0,0 +1,218 @@
+"""
+Chatbot Backends Module
+This module provides the engines that produce chatbot replies as a stream of
+text chunks: the built-in rule engine, or a local model running in its own
+process and reached over a socket.
+
+The model protocol is newline-delimited JSON. The client sends one request
+line, {"message", "history", "category", "profile"}, and the model answers with
+{"chunk": text} lines as it generates, ending with {"done": true} or
+{"error": message}. StubModelServer speaks the protocol with canned replies,
+for trying the streaming endpoint without a model:
+
+    python chatbot_backends.py --stub [host:port | unix:/path] [--delay seconds] [--fail-after words]
+"""
+
+import json
+import os
+import socket
+import socketserver
+import sys
+import time
+
+# Which backend replies to chat messages: 'rules' or 'model'
+CHATBOT_BACKEND = os.getenv('CHATBOT_BACKEND', 'rules')
+
+# Where the local model listens, as host:port or unix:/path, and how long to wait for each chunk
+CHATBOT_MODEL_ADDRESS = os.getenv('CHATBOT_MODEL_ADDRESS', '127.0.0.1:8765')
+CHATBOT_MODEL_TIMEOUT = float(os.getenv('CHATBOT_MODEL_TIMEOUT', 30))
+
+# User profile fields sent to the model with each message
+PROFILE_FIELDS = ('name', 'age', 'gender', 'height_cm', 'weight_kg', 'activity_level', 'diet_goal', 'diet_type')
+
+
+class BackendError(Exception):
+    """A backend could not produce a reply."""
+
+
+class ChatBackend:
+    """Produces the reply to a chat message."""
+
+    name = None
+
+    def stream(self, message, history, category, user):
+        """Yield the reply to a message in text chunks."""
+        raise NotImplementedError
+
+    def generate(self, message, history, category, user):
+        """Get the whole reply to a message."""
+        return ''.join(self.stream(message, history, category, user))
+
+
+class RuleBackend(ChatBackend):
+    """The rule engine, whose reply is ready at once and is sent a line at a time."""
+
+    name = 'rules'
+
+    def __init__(self, respond):
+        """
+        Args:
+            respond (callable): Called with (message, history, category, user) to get a reply
+        """
+        self.respond = respond
+
+    def stream(self, message, history, category, user):
+        """Yield the rule engine's reply line by line."""
+        yield from self.respond(message, history, category, user).splitlines(keepends=True)
+
+
+def parse_address(address):
+    """Split a host:port or unix:/path address into a socket family and address."""
+    if address.startswith('unix:'):
+        return socket.AF_UNIX, address[len('unix:'):]
+    host, _, port = address.rpartition(':')
+    return socket.AF_INET, (host or '127.0.0.1', int(port))
+
+
+def user_profile(user):
+    """Get the profile fields of a user sent along with their message."""
+    if user is None:
+        return {}
+    return {field: getattr(user, field, None) for field in PROFILE_FIELDS}
+
+
+class SocketModelBackend(ChatBackend):
+    """A local model in another process, relaying its chunks as they are generated."""
+
+    name = 'model'
+
+    def __init__(self, address=CHATBOT_MODEL_ADDRESS, timeout=CHATBOT_MODEL_TIMEOUT):
+        self.family, self.address = parse_address(address)
+        self.timeout = timeout
+
+    def stream(self, message, history, category, user):
+        """Send a message to the model and yield its reply chunks."""
+        request_line = json.dumps({
+            'message': message,
+            'history': history,
+            'category': category,
+            'profile': user_profile(user)
+        }) + '\n'
+
+        try:
+            with socket.socket(self.family, socket.SOCK_STREAM) as connection:
+                connection.settimeout(self.timeout)
+                connection.connect(self.address)
+                connection.sendall(request_line.encode('utf-8'))
+
+                with connection.makefile('r', encoding='utf-8') as lines:
+                    for line in lines:
+                        reply = json.loads(line)
+                        if 'chunk' in reply:
+                            yield reply['chunk']
+                        elif reply.get('done'):
+                            return
+                        elif 'error' in reply:
+                            raise BackendError(f"Model error: {reply['error']}")
+        except (OSError, ValueError) as e:
+            raise BackendError(f"Model unavailable: {str(e)}") from e
+
+        raise BackendError("Model closed the connection before finishing its reply")
+
+
+def create_backend(name, rule_backend):
+    """Get the backend configured by name, the rule engine being the default."""
+    if name == SocketModelBackend.name:
+        return SocketModelBackend()
+    return rule_backend
+
+
+class _StubModelHandler(socketserver.StreamRequestHandler):
+    """Answer one protocol request with a canned reply, a word at a time."""
+
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+        reply = self.server.reply or f"Stub model reply to your {request.get('category')} question: {request.get('message')}"
+
+        for position, word in enumerate(reply.split(' ')):
+            if position == self.server.fail_after:
+                self.wfile.write((json.dumps({'error': 'Stub model failed mid-reply'}) + '\n').encode('utf-8'))
+                return
+            time.sleep(self.server.delay)
+            self.wfile.write((json.dumps({'chunk': word + ' '}) + '\n').encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write((json.dumps({'done': True}) + '\n').encode('utf-8'))
+
+
+class _StubModelServerMixin:
+    """Canned reply settings shared by the TCP and Unix socket stubs."""
+
+    daemon_threads = True
+
+    def __init__(self, address, reply=None, delay=0.05, fail_after=None):
+        """
+        Args:
+            address: Address to listen on
+            reply (str, optional): Reply to every message. Defaults to echoing the message.
+            delay (float): Seconds before each word is sent, like a model generating it
+            fail_after (int, optional): Words sent before answering with an error instead
+        """
+        self.reply = reply
+        self.delay = delay
+        self.fail_after = fail_after
+        super().__init__(address, _StubModelHandler)
+
+
+class StubModelServer(_StubModelServerMixin, socketserver.ThreadingTCPServer):
+    """Stand-in for a local model process that streams canned replies over TCP."""
+
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), reply=None, delay=0.05, fail_after=None):
+        """Listen on a (host, port) address; port 0 picks a free one."""
+        super().__init__(address, reply, delay, fail_after)
+
+
+class UnixStubModelServer(_StubModelServerMixin, socketserver.ThreadingUnixStreamServer):
+    """Stand-in for a local model process that streams canned replies on a Unix socket."""
+
+    def __init__(self, path, reply=None, delay=0.05, fail_after=None):
+        """Listen on a socket file, replacing one left by an earlier run."""
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, reply, delay, fail_after)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def create_stub_server(address, reply=None, delay=0.05, fail_after=None):
+    """Create the stub model server for a host:port or unix:/path address."""
+    family, address = parse_address(address)
+    if family == socket.AF_UNIX:
+        return UnixStubModelServer(address, reply, delay, fail_after)
+    return StubModelServer(address, reply, delay, fail_after)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if '--stub' not in args:
+        print("Usage: python chatbot_backends.py --stub [host:port | unix:/path] [--delay seconds] [--fail-after words]")
+        sys.exit(1)
+
+    position = args.index('--stub')
+    listen = args[position + 1] if len(args) > position + 1 and not args[position + 1].startswith('--') else CHATBOT_MODEL_ADDRESS
+    stub_delay = float(args[args.index('--delay') + 1]) if '--delay' in args else 0.05
+    stub_fail_after = int(args[args.index('--fail-after') + 1]) if '--fail-after' in args else None
+
+    server = create_stub_server(listen, delay=stub_delay, fail_after=stub_fail_after)
+    if isinstance(server.server_address, str):
+        print(f"Stub model listening on unix:{server.server_address}")
+    else:
+        print(f"Stub model listening on {server.server_address[0]}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,629 @@
+"""
+Chatbot Intent Module
+This module declares the rule-based chatbot's intents as data and compiles them
+into a single matcher.
+
+An intent matches a message when every one of its keyword groups has at least
+one keyword in the lowercased message, as a plain substring. All keywords are
+compiled into one Aho-Corasick automaton, so a message is scanned once, in time
+linear in its length however many intents exist, and intents are then checked
+against the set of keywords found in the order they are declared.
+
+Usage: python chatbot_intents.py [corpus.json]   (check the regression corpus)
+"""
+
+import json
+import os
+import sys
+from collections import deque
+
+from diet_plan import ACTIVITY_MULTIPLIERS
+
+# Regression corpus of messages and the intent each must route to
+INTENT_CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chatbot_intent_corpus.json')
+
+BEGINNER_WORKOUT_RESPONSE = """Here's a beginner workout routine you can try:
+
+1. **Monday**: Full Body
+   - Bodyweight squats: 3 sets of 12
+   - Push-ups (or knee push-ups): 3 sets of 10
+   - Walking lunges: 3 sets of 10 per leg
+   - Plank: 3 sets, hold for 30 seconds
+
+2. **Wednesday**: Cardio
+   - 30 minutes of brisk walking or light jogging
+   - 10 minutes of jumping jacks and high knees (alternate 30 seconds each)
+
+3. **Friday**: Full Body
+   - Glute bridges: 3 sets of 15
+   - Dumbbell rows (or doorway rows): 3 sets of 12
+   - Bicycle crunches: 3 sets of 20
+   - Wall sit: 3 sets, hold for 30 seconds
+
+Start with this for 2-3 weeks, then gradually increase intensity. Remember to warm up before and stretch after each workout!"""
+
+WEIGHT_LOSS_WORKOUT_RESPONSE = """For weight loss, combine these workouts with a calorie deficit diet:
+
+1. **HIIT Workout** (3x per week):
+   - 30 seconds jumping jacks
+   - 30 seconds mountain climbers
+   - 30 seconds burpees
+   - 30 seconds high knees
+   - 30 seconds rest
+   - Repeat 5 times
+
+2. **Strength Training** (2x per week):
+   - Squats: 3 sets of 15
+   - Push-ups: 3 sets of 10-15
+   - Lunges: 3 sets of 12 per leg
+   - Dumbbell rows: 3 sets of 12
+   - Plank: 3 sets of 45 seconds
+
+3. **Low-Intensity Cardio** (1-2x per week):
+   - 45-60 minutes of brisk walking, swimming, or cycling
+
+Remember, consistency is key for weight loss. Aim to be active most days of the week!"""
+
+BUILD_MUSCLE_RESPONSE = """To build muscle, focus on progressive overload and adequate protein intake:
+
+**4-Day Split Routine:**
+
+1. **Day 1: Chest & Triceps**
+   - Bench press: 4 sets of 8-10 reps
+   - Incline dumbbell press: 3 sets of 10-12 reps
+   - Chest flies: 3 sets of 12-15 reps
+   - Tricep dips: 3 sets of 10-12 reps
+   - Tricep pushdowns: 3 sets of 12-15 reps
+
+2. **Day 2: Back & Biceps**
+   - Pull-ups or lat pulldowns: 4 sets of 8-10 reps
+   - Bent-over rows: 3 sets of 10-12 reps
+   - Seated cable rows: 3 sets of 12 reps
+   - Bicep curls: 3 sets of 10-12 reps
+   - Hammer curls: 3 sets of 12-15 reps
+
+3. **Day 3: Rest or Light Cardio**
+
+4. **Day 4: Legs & Shoulders**
+   - Squats: 4 sets of 8-10 reps
+   - Leg press: 3 sets of 10-12 reps
+   - Romanian deadlifts: 3 sets of 10-12 reps
+   - Shoulder press: 3 sets of 10-12 reps
+   - Lateral raises: 3 sets of 12-15 reps
+
+5. **Day 5: Core & Arms**
+   - Weighted crunches: 3 sets of 15-20 reps
+   - Russian twists: 3 sets of 20 reps
+   - Plank: 3 sets of 45-60 seconds
+   - Skull crushers: 3 sets of 12 reps
+   - Concentration curls: 3 sets of 12 reps
+
+Ensure you're eating in a slight caloric surplus with 1.6-2g of protein per kg of bodyweight!"""
+
+CALORIES_BURNED_GENERIC_RESPONSE = "The number of calories you burn depends on your weight, height, age, gender, and activity level. A moderately active adult typically burns between 1,800 and 2,400 calories per day. For a personalized estimate, please update your profile with your weight, height, age, and gender."
+
+MEAL_PLAN_TEMPLATE = """Here's a sample {diet_type_desc} meal plan for {focus}:
+
+**Breakfast:**
+- Overnight oats with berries and nuts
+- Greek yogurt with honey
+- Green tea or black coffee
+
+**Mid-morning Snack:**
+- Apple with 1 tablespoon almond butter
+- Small handful of mixed nuts
+
+**Lunch:**
+- Grilled chicken or tofu salad with mixed greens
+- Quinoa or brown rice (½ cup)
+- Olive oil and lemon dressing
+- Water with lemon
+
+**Afternoon Snack:**
+- Protein smoothie with banana and spinach
+- Carrot sticks with hummus
+
+**Dinner:**
+- Baked salmon or lentils
+- Roasted vegetables (broccoli, bell peppers, zucchini)
+- Sweet potato (medium)
+- Herbal tea
+
+This is a {calorie_target} plan that follows {diet_type_desc} principles. Adjust portion sizes based on your specific calorie needs and preferences."""
+
+PROTEIN_GENERIC_RESPONSE = "The recommended protein intake is typically 1.2-2.0g per kg of body weight, depending on your goals. For general health, aim for at least 0.8g/kg. For muscle building, aim for 1.6-2.0g/kg. For weight loss while preserving muscle, aim for 1.4-1.8g/kg. Update your profile with your weight for a more personalized recommendation."
+
+BREAKFAST_IDEAS_RESPONSE = """Here are some healthy breakfast ideas:
+
+1. **Greek Yogurt Parfait**
+   - Greek yogurt, mixed berries, granola, and a drizzle of honey
+
+2. **Avocado Toast**
+   - Whole grain toast, mashed avocado, poached egg, and a sprinkle of red pepper flakes
+
+3. **Protein Smoothie**
+   - Blend protein powder, banana, spinach, almond milk, and a tablespoon of nut butter
+
+4. **Overnight Oats**
+   - Oats soaked in milk or yogurt with chia seeds, cinnamon, and topped with fruit and nuts
+
+5. **Veggie Omelette**
+   - Eggs with spinach, bell peppers, onions, and a small amount of cheese
+
+6. **Breakfast Burrito**
+   - Whole grain wrap with scrambled eggs, black beans, salsa, and avocado
+
+Choose options that align with your dietary preferences and goals!"""
+
+STRESS_RESPONSE = """Here are effective stress management techniques:
+
+1. **Deep Breathing**
+   - Practice 4-7-8 breathing: Inhale for 4 seconds, hold for 7, exhale for 8
+   - Do this for 5 minutes whenever you feel stressed
+
+2. **Progressive Muscle Relaxation**
+   - Tense and then release each muscle group from toes to head
+   - This helps identify and release physical tension
+
+3. **Mindfulness Meditation**
+   - Start with just 5 minutes daily
+   - Focus on your breath and gently return attention when your mind wanders
+
+4. **Physical Activity**
+   - Even a 10-minute walk can reduce stress hormones
+   - Find movement you enjoy rather than forcing yourself to exercise
+
+5. **Nature Time**
+   - Spend 20 minutes outdoors daily
+   - "Forest bathing" has been shown to lower cortisol levels
+
+6. **Digital Detox**
+   - Set boundaries for technology use
+   - Try a 1-hour phone-free period before bed
+
+Remember, stress management is personal - experiment to find what works best for you!"""
+
+SLEEP_RESPONSE = """To improve your sleep quality:
+
+1. **Consistent Schedule**
+   - Go to bed and wake up at the same time daily, even on weekends
+   - This regulates your body's internal clock
+
+2. **Bedtime Routine**
+   - Create a 30-minute wind-down ritual
+   - Try reading, gentle stretching, or meditation
+
+3. **Optimize Your Environment**
+   - Keep your bedroom cool (65-68°F/18-20°C)
+   - Ensure it's dark and quiet (use blackout curtains and white noise if needed)
+   - Invest in a comfortable mattress and pillows
+
+4. **Limit Screen Time**
+   - Avoid screens 1 hour before bed (blue light blocks melatonin)
+   - Use night mode on devices if you must use them
+
+5. **Watch What You Consume**
+   - Avoid caffeine after 2pm
+   - Limit alcohol (it disrupts REM sleep)
+   - Don't eat heavy meals within 3 hours of bedtime
+
+6. **Daytime Habits**
+   - Get natural sunlight exposure during the day
+   - Exercise regularly, but not too close to bedtime
+   - Limit naps to 20 minutes early in the day
+
+If sleep problems persist for more than a month, consider consulting a healthcare provider."""
+
+MEDITATION_RESPONSE = """**Beginner's Guide to Meditation:**
+
+1. **Start Small**
+   - Begin with just 5 minutes daily
+   - Gradually increase to 15-20 minutes as you become comfortable
+
+2. **Find a Quiet Space**
+   - Choose a spot with minimal distractions
+   - You don't need a special setup - just a comfortable place to sit
+
+3. **Get Comfortable**
+   - Sit on a chair, cushion, or mat with your back straight but not rigid
+   - You can also lie down if sitting is uncomfortable (but you might fall asleep!)
+
+4. **Basic Technique**
+   - Focus on your breath - the sensation of air entering and leaving your nostrils
+   - When your mind wanders (it will!), gently bring attention back to your breath
+   - No need to clear your mind completely - just practice returning to your focus
+
+5. **Try Guided Meditation**
+   - Apps like Headspace, Calm, or Insight Timer offer free guided sessions
+   - These are helpful for beginners who benefit from instructions
+
+6. **Be Consistent**
+   - Meditate at the same time each day to build a habit
+   - Morning works well for many people before the day gets busy
+
+7. **Be Kind to Yourself**
+   - Don't judge yourself when your mind wanders
+   - Each time you notice and return focus is a success, not a failure
+
+Remember, meditation is a practice - benefits come with consistency rather than perfection."""
+
+TRACK_PROGRESS_RESPONSE = """Here's how to effectively track your fitness progress:
+
+1. **Body Measurements**
+   - Weight: Weigh yourself at the same time of day (morning is best)
+   - Measurements: Track waist, hips, chest, arms, and thighs monthly
+   - Body fat percentage: Consider using calipers or a smart scale
+
+2. **Performance Metrics**
+   - Strength: Record weights, sets, and reps for key exercises
+   - Endurance: Track distance, time, or pace for cardio activities
+   - Flexibility: Note how far you can stretch in specific positions
+
+3. **Daily Habits**
+   - Steps: Aim for 7,000-10,000 steps daily
+   - Water intake: Track ounces or glasses consumed
+   - Sleep: Record hours and quality
+
+4. **Photo Documentation**
+   - Take progress photos monthly in the same lighting, poses, and clothing
+   - These can reveal changes that numbers don't show
+
+5. **Subjective Measures**
+   - Energy levels: Rate on a scale of 1-10
+   - Mood: Note how exercise affects your mental state
+   - Recovery: Track soreness and recovery time
+
+6. **Digital Tools**
+   - Use our chat feature to log data (e.g., "Weight: 75kg" or "Ran 5km in 30 minutes")
+   - Connect fitness trackers or apps for automated tracking
+
+Remember to track consistently but don't become obsessive. The goal is to gather useful data to guide your journey, not to create another source of stress."""
+
+GOAL_SETTING_RESPONSE = """**SMART Goal Setting for Fitness Success:**
+
+1. **Specific**
+   - Instead of "get fit," try "be able to run 5km without stopping"
+   - Define exactly what you want to accomplish
+
+2. **Measurable**
+   - Include metrics to track progress
+   - Example: "Increase squat weight from 50kg to 70kg"
+
+3. **Achievable**
+   - Set challenging but realistic goals based on your starting point
+   - Consider your schedule, resources, and current fitness level
+
+4. **Relevant**
+   - Choose goals that align with your values and long-term vision
+   - Ask: "Why does this matter to me personally?"
+
+5. **Time-bound**
+   - Set a deadline to create urgency
+   - Example: "Complete a pull-up by December 31st"
+
+**Types of Goals to Consider:**
+- **Process goals:** Daily actions (exercise 4x/week)
+- **Performance goals:** Specific achievements (run 5km in under 30 minutes)
+- **Outcome goals:** End results (lose 5kg of fat)
+
+**Pro Tips:**
+- Write your goals down and review them regularly
+- Share goals with someone for accountability
+- Break big goals into smaller milestones
+- Celebrate progress along the way
+- Adjust goals as needed - flexibility is key
+
+Would you like help setting a specific SMART goal based on your current situation?"""
+
+DEFAULT_RESPONSE = "Thank you for your question about {category}. I'm currently operating in offline mode with limited responses. Could you try asking something more specific about {category} routines, best practices, or recommendations? I have information about common topics in this area."
+
+
+def _calories_burned_response(user, category):
+    """Estimate daily calories burned from the user's profile."""
+    user_weight = user.weight_kg if user and user.weight_kg else None
+    user_height = user.height_cm if user and user.height_cm else None
+    user_gender = user.gender if user and user.gender else None
+    user_age = user.age if user and user.age else None
+    user_activity = user.activity_level if user and user.activity_level else "moderate"
+
+    if not (user_weight and user_height and user_gender and user_age):
+        return CALORIES_BURNED_GENERIC_RESPONSE
+
+    # Basic calculation for demonstration purposes
+    if user_gender.lower() == "male":
+        bmr = 10 * user_weight + 6.25 * user_height - 5 * user_age + 5
+    else:
+        bmr = 10 * user_weight + 6.25 * user_height - 5 * user_age - 161
+
+    multiplier = ACTIVITY_MULTIPLIERS.get(user_activity, 1.55)
+    daily_calories = int(bmr * multiplier)
+
+    return f"Based on your profile (weight: {user_weight}kg, height: {user_height}cm, age: {user_age}, gender: {user_gender}, activity level: {user_activity}), you burn approximately {daily_calories} calories per day. To lose weight, aim for a deficit of 500 calories per day through diet and exercise."
+
+
+def _meal_plan_response(user, category):
+    """Fill the sample meal plan in for the user's diet goal and type."""
+    user_diet_goal = user.diet_goal if user and user.diet_goal else "maintain"
+    user_diet_type = user.diet_type if user and user.diet_type else "balanced"
+
+    if user_diet_goal == "lose":
+        calorie_target = "lower-calorie"
+        focus = "weight loss"
+    elif user_diet_goal == "gain":
+        calorie_target = "higher-calorie"
+        focus = "muscle gain"
+    else:
+        calorie_target = "balanced"
+        focus = "maintenance"
+
+    return MEAL_PLAN_TEMPLATE.format(
+        diet_type_desc=user_diet_type.capitalize(),
+        focus=focus,
+        calorie_target=calorie_target
+    )
+
+
+def _protein_response(user, category):
+    """Recommend a daily protein intake from the user's weight and goal."""
+    user_weight = user.weight_kg if user and user.weight_kg else None
+    user_diet_goal = user.diet_goal if user and user.diet_goal else "maintain"
+
+    if not user_weight:
+        return PROTEIN_GENERIC_RESPONSE
+
+    if user_diet_goal == "gain":
+        protein_g = round(user_weight * 1.8)
+        return f"For muscle building, you should aim for approximately {protein_g}g of protein daily (about 1.8g per kg of body weight). With your weight of {user_weight}kg, this is your target. Spread your protein intake throughout the day for optimal muscle protein synthesis."
+
+    protein_g = round(user_weight * 1.4)
+    return f"Based on your weight of {user_weight}kg, you should aim for approximately {protein_g}g of protein daily (about 1.4g per kg of body weight). This will help maintain muscle mass while supporting your overall health."
+
+
+# Intents in priority order; the first whose keyword groups all match wins.
+# A category of None applies to every category. A string response is a
+# template filled with user_name and category; a callable one is called
+# with the user and category.
+INTENTS = [
+    {
+        'name': 'greeting',
+        'category': None,
+        'keywords': [['hello', 'hi', 'hey']],
+        'response': "Hello {user_name}! How can I help you with your {category} goals today?"
+    },
+    {
+        'name': 'thanks',
+        'category': None,
+        'keywords': [['thank']],
+        'response': "You're welcome! I'm here to help with all your {category} needs. Is there anything else you'd like to know?"
+    },
+    {
+        'name': 'goodbye',
+        'category': None,
+        'keywords': [['bye', 'goodbye']],
+        'response': "Goodbye! Remember to stay consistent with your {category} routine. Come back anytime you need advice!"
+    },
+    {
+        'name': 'beginner_workout',
+        'category': 'fitness',
+        'keywords': [['beginner'], ['workout', 'routine']],
+        'response': BEGINNER_WORKOUT_RESPONSE
+    },
+    {
+        'name': 'weight_loss_workout',
+        'category': 'fitness',
+        'keywords': [['lose weight'], ['workout']],
+        'response': WEIGHT_LOSS_WORKOUT_RESPONSE
+    },
+    {
+        'name': 'build_muscle',
+        'category': 'fitness',
+        'keywords': [['build muscle']],
+        'response': BUILD_MUSCLE_RESPONSE
+    },
+    {
+        'name': 'calories_burned',
+        'category': 'fitness',
+        'keywords': [['how many'], ['calories'], ['burn']],
+        'response': _calories_burned_response
+    },
+    {
+        'name': 'meal_plan',
+        'category': 'diet',
+        'keywords': [['meal plan', 'diet plan']],
+        'response': _meal_plan_response
+    },
+    {
+        'name': 'protein_intake',
+        'category': 'diet',
+        'keywords': [['protein'], ['how much', 'how many']],
+        'response': _protein_response
+    },
+    {
+        'name': 'breakfast_ideas',
+        'category': 'diet',
+        'keywords': [['breakfast'], ['idea', 'suggestion']],
+        'response': BREAKFAST_IDEAS_RESPONSE
+    },
+    {
+        'name': 'stress_management',
+        'category': 'wellness',
+        'keywords': [['stress'], ['reduce', 'manage']],
+        'response': STRESS_RESPONSE
+    },
+    {
+        'name': 'better_sleep',
+        'category': 'wellness',
+        'keywords': [['sleep'], ['better', 'improve']],
+        'response': SLEEP_RESPONSE
+    },
+    {
+        'name': 'meditation',
+        'category': 'wellness',
+        'keywords': [['meditat'], ['how', 'beginner']],
+        'response': MEDITATION_RESPONSE
+    },
+    {
+        'name': 'track_progress',
+        'category': 'progress',
+        'keywords': [['track'], ['progress', 'fitness']],
+        'response': TRACK_PROGRESS_RESPONSE
+    },
+    {
+        'name': 'goal_setting',
+        'category': 'progress',
+        'keywords': [['goal'], ['set', 'setting']],
+        'response': GOAL_SETTING_RESPONSE
+    }
+]
+
+
+def build_automaton(keywords):
+    """
+    Compile keywords into an Aho-Corasick automaton with a full transition table.
+
+    Args:
+        keywords (list): Keywords; keyword i is reported as bit i
+
+    Returns:
+        tuple: (transitions, outputs) where transitions[state] maps a character
+        to the next state (missing characters lead back to state 0) and
+        outputs[state] is the bitmask of keywords ending at that state
+    """
+    goto = [{}]
+    outputs = [0]
+    for index, keyword in enumerate(keywords):
+        state = 0
+        for char in keyword:
+            next_state = goto[state].get(char)
+            if next_state is None:
+                goto.append({})
+                outputs.append(0)
+                next_state = len(goto) - 1
+                goto[state][char] = next_state
+            state = next_state
+        outputs[state] |= 1 << index
+
+    # Breadth-first, so a state's failure state is complete before the state itself
+    transitions = [None] * len(goto)
+    fail = [0] * len(goto)
+    transitions[0] = dict(goto[0])
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        transitions[state] = {**transitions[fail[state]], **goto[state]}
+        for char, child in goto[state].items():
+            fail[child] = transitions[fail[state]].get(char, 0) if state else 0
+            outputs[child] |= outputs[fail[child]]
+            queue.append(child)
+
+    return transitions, outputs
+
+
+class IntentRouter:
+    """Intents compiled into one keyword automaton, matched per category in priority order."""
+
+    def __init__(self, intents, default_response=DEFAULT_RESPONSE):
+        self.intents = intents
+        self.intents_by_name = {intent['name']: intent for intent in intents}
+        self.default_response = default_response
+        self.keywords = sorted({keyword for intent in intents for group in intent['keywords'] for keyword in group})
+        bits = {keyword: 1 << index for index, keyword in enumerate(self.keywords)}
+        self._transitions, self._outputs = build_automaton(self.keywords)
+
+        # Each intent becomes one bitmask per keyword group
+        self._compiled = [
+            (intent, [sum(bits[keyword] for keyword in set(group)) for group in intent['keywords']])
+            for intent in intents
+        ]
+
+        # An intent can only match when a keyword of its first group was found, so only those
+        # intents are checked; keyword index -> priorities of the intents it can trigger
+        categories = {intent['category'] for intent in intents if intent['category'] is not None}
+        self._common_index = {}
+        self._index = {category: {} for category in categories}
+        for priority, intent in enumerate(intents):
+            if intent['category'] is None:
+                indexes = [self._common_index] + list(self._index.values())
+            else:
+                indexes = [self._index[intent['category']]]
+            for keyword in set(intent['keywords'][0]):
+                keyword_index = bits[keyword].bit_length() - 1
+                for index in indexes:
+                    index.setdefault(keyword_index, []).append(priority)
+
+    def scan(self, text):
+        """Get the bitmask of keywords occurring in already lowercased text."""
+        transitions = self._transitions
+        outputs = self._outputs
+        state = 0
+        found = 0
+        for char in text:
+            state = transitions[state].get(char, 0)
+            found |= outputs[state]
+        return found
+
+    def match(self, message, category):
+        """Get the first intent of a category matching a message, or None."""
+        found = self.scan(message.lower())
+        if not found:
+            return None
+
+        index = self._index.get(category, self._common_index)
+        candidates = set()
+        remaining = found
+        while remaining:
+            lowest = remaining & -remaining
+            candidates.update(index.get(lowest.bit_length() - 1, ()))
+            remaining ^= lowest
+
+        for priority in sorted(candidates):
+            intent, groups = self._compiled[priority]
+            if all(found & group for group in groups):
+                return intent
+        return None
+
+    def render(self, intent, category, user):
+        """Get an intent's response for a user."""
+        response = intent['response']
+        if callable(response):
+            return response(user, category)
+
+        user_name = user.name if user and user.name else "there"
+        return response.format(user_name=user_name, category=category)
+
+    def respond(self, message, category, user):
+        """Get the response to a message, falling back to the default response."""
+        intent = self.match(message, category)
+        if intent is None:
+            return self.default_response.format(category=category)
+        return self.render(intent, category, user)
+
+
+router = IntentRouter(INTENTS)
+
+
+def check_corpus(path=INTENT_CORPUS_PATH):
+    """
+    Route every message of a regression corpus and collect the mismatches.
+
+    Returns:
+        tuple: (number of cases, list of (case, intent name routed to) mismatches)
+    """
+    with open(path) as f:
+        cases = json.load(f)
+
+    mismatches = []
+    for case in cases:
+        intent = router.match(case['message'], case['category'])
+        name = intent['name'] if intent else None
+        if name != case['intent']:
+            mismatches.append((case, name))
+    return len(cases), mismatches
+
+
+if __name__ == '__main__':
+    total, failures = check_corpus(sys.argv[1] if len(sys.argv) > 1 else INTENT_CORPUS_PATH)
+    for failed_case, routed in failures:
+        print(f"{failed_case['category']}: {failed_case['message']!r} routed to {routed}, expected {failed_case['intent']}")
+    print(f"{total - len(failures)}/{total} corpus messages routed as expected")
+    sys.exit(1 if failures else 0)
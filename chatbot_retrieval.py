@@ -0,0 +1,422 @@
+"""
+Chatbot Retrieval Module
+This module answers chatbot messages no intent matches by retrieving the
+closest document from an offline knowledge base with BM25 ranking.
+
+The knowledge base is the intents' canned responses plus the documents in
+chatbot_knowledge.json. It is indexed into segments of compressed sparse rows
+(one row of document ids and term frequencies per term) saved as .npy files
+and memory-mapped when the index is opened, so startup reads no postings.
+Scores are computed at query time from the stored term frequencies, which
+keeps segments valid as the collection grows: adding documents writes one new
+segment instead of rebuilding the index, and segments are merged once there
+are too many.
+
+Each process brings the index up to date the first time it opens it, so
+edits to the knowledge file or the intents take effect on restart.
+
+Usage: python chatbot_retrieval.py [--rebuild] [--query "message" [category]]
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import threading
+from collections import Counter
+
+import numpy as np
+
+from chatbot_intents import INTENTS
+
+INDEX_DIR = os.getenv(
+    'CHATBOT_INDEX_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'chatbot_index')
+)
+KNOWLEDGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'chatbot_knowledge.json')
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Minimum BM25 score for a retrieved document to be used as an answer
+MIN_ANSWER_SCORE = 3.0
+
+# Segments and deleted-document share above which update_index merges everything into one segment
+MAX_SEGMENTS = 8
+MAX_DELETED_RATIO = 0.2
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Version of tokenize(); an index built by another version is rebuilt
+TOKENIZER_VERSION = 2
+
+# Endings after which a plural adds 'es' rather than 's' (boxes, lunches, glasses)
+ES_PLURAL_ENDINGS = ('ss', 'x', 'z', 'ch', 'sh')
+
+STOPWORDS = frozenset("""
+a about am an and any are as at be been but by can could do does for from get give had has have how i i'm if in
+into is it its just me more most my no not of on or our should so some such tell than that the their them then
+there these they this to too up us want was we what when where which who why will with would you your
+""".split())
+
+_index = None
+_index_lock = threading.Lock()
+_updated_directories = set()
+
+
+def _stem(token):
+    """Strip a common inflection, so 'sleeping' and 'sleep', or 'calories' and 'calorie', index alike."""
+    for suffix in ('ing', 'ed'):
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            return token[:-len(suffix)]
+    if token.endswith('es') and token[:-2].endswith(ES_PLURAL_ENDINGS) and len(token) >= 5:
+        return token[:-2]
+    if token.endswith('s') and not token.endswith(('ss', 'us', 'is')) and len(token) >= 4:
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Split text into lowercase, stemmed terms without stopwords."""
+    return [_stem(token) for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def knowledge_documents(path=KNOWLEDGE_PATH):
+    """
+    Collect the documents of the knowledge base.
+
+    Category-specific intents become documents answered by the intent itself,
+    indexed by their keywords and canned text; the knowledge file adds
+    free-standing documents.
+
+    Returns:
+        list: Document dictionaries with id, category, title, text and intent
+    """
+    documents = []
+    for intent in INTENTS:
+        if intent['category'] is None:
+            continue
+        response = intent['response']
+        text = response if isinstance(response, str) else (response.__doc__ or '')
+        documents.append({
+            'id': f"intent:{intent['name']}",
+            'category': intent['category'],
+            'title': ' '.join(keyword for group in intent['keywords'] for keyword in group),
+            'text': text,
+            'intent': intent['name']
+        })
+
+    if os.path.exists(path):
+        with open(path) as f:
+            for document in json.load(f):
+                documents.append({
+                    'id': document['id'],
+                    'category': document.get('category'),
+                    'title': document.get('title', ''),
+                    'text': document['text'],
+                    'intent': None
+                })
+    return documents
+
+
+def _document_hash(document):
+    """Hash the indexed content of a document, to tell when it changed."""
+    content = json.dumps([document.get('category'), document.get('title'), document['text'], document.get('intent')])
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _read_manifest(directory):
+    """Read an index manifest, or None if there is no index."""
+    path = os.path.join(directory, 'manifest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json_atomic(path, data):
+    """Write JSON through a temporary file, so readers never see a partial file."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _write_segment(directory, name, documents):
+    """
+    Index documents into a segment of sparse term rows.
+
+    Files:
+        <name>.vocab.npy: Sorted terms
+        <name>.indptr.npy: Start of each term's postings, plus the end
+        <name>.docs.npy: Segment-local document positions of every posting
+        <name>.tf.npy: Term frequency of every posting
+        <name>.lengths.npy: Term count of every document
+
+    Returns:
+        int: The total term count of the documents
+    """
+    counts = [Counter(tokenize(f"{document.get('title', '')} {document['text']}")) for document in documents]
+    vocabulary = sorted({term for document_counts in counts for term in document_counts})
+    term_rows = {term: row for row, term in enumerate(vocabulary)}
+
+    postings = [[] for _ in vocabulary]
+    for position, document_counts in enumerate(counts):
+        for term, frequency in document_counts.items():
+            postings[term_rows[term]].append((position, frequency))
+
+    indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(row) for row in postings])
+    docs = np.array([position for row in postings for position, _ in row], dtype=np.int32)
+    frequencies = np.array([frequency for row in postings for _, frequency in row], dtype=np.float32)
+    lengths = np.array([sum(document_counts.values()) for document_counts in counts], dtype=np.float32)
+    vocab = np.array(vocabulary) if vocabulary else np.array([], dtype='<U1')
+
+    for suffix, array in (('vocab', vocab), ('indptr', indptr), ('docs', docs), ('tf', frequencies), ('lengths', lengths)):
+        np.save(os.path.join(directory, f'{name}.{suffix}.npy'), array)
+    return int(lengths.sum())
+
+
+def _remove_unreferenced(directory, manifest):
+    """Delete segment and document files a new manifest no longer references."""
+    keep = {'manifest.json', manifest['documents_file']}
+    keep.update(f"{segment['name']}.{suffix}.npy" for segment in manifest['segments']
+                for suffix in ('vocab', 'indptr', 'docs', 'tf', 'lengths'))
+    for filename in os.listdir(directory):
+        if filename not in keep and not filename.endswith('.tmp'):
+            os.remove(os.path.join(directory, filename))
+
+
+def _build(directory, documents, generation):
+    """Index every document into a single fresh segment."""
+    documents = [dict(document, hash=_document_hash(document)) for document in documents]
+    name = f'segment-{generation}-0'
+    total_length = _write_segment(directory, name, documents)
+
+    manifest = {
+        'generation': generation,
+        'tokenizer': TOKENIZER_VERSION,
+        'k1': BM25_K1,
+        'b': BM25_B,
+        'documents_file': f'documents-{generation}.json',
+        'document_count': len(documents),
+        'total_length': total_length,
+        'segments': [{'name': name, 'doc_offset': 0, 'doc_count': len(documents)}],
+        'deleted': []
+    }
+    _write_json_atomic(os.path.join(directory, manifest['documents_file']), documents)
+    _write_json_atomic(os.path.join(directory, 'manifest.json'), manifest)
+    _remove_unreferenced(directory, manifest)
+    return manifest
+
+
+def update_index(documents=None, directory=INDEX_DIR, rebuild=False):
+    """
+    Bring the index in line with the knowledge base, indexing only what changed.
+
+    New and changed documents are written as one new segment; changed and
+    removed documents are marked deleted. The index is rebuilt into a single
+    segment when it doesn't exist, when ``rebuild`` is set, when it was
+    tokenized differently, or when segments or deleted documents have piled up.
+
+    Args:
+        documents (list, optional): Documents to index. Defaults to knowledge_documents().
+        directory (str): Index directory
+        rebuild (bool): Whether to rebuild from scratch
+
+    Returns:
+        dict: Counts of 'added' and 'deleted' documents, the number of
+        'segments' and whether the index was 'rebuilt'
+    """
+    documents = knowledge_documents() if documents is None else documents
+    os.makedirs(directory, exist_ok=True)
+    manifest = _read_manifest(directory)
+
+    if manifest is None or rebuild or manifest.get('tokenizer') != TOKENIZER_VERSION:
+        _build(directory, documents, manifest['generation'] + 1 if manifest else 1)
+        return {'added': len(documents), 'deleted': 0, 'segments': 1, 'rebuilt': True}
+
+    with open(os.path.join(directory, manifest['documents_file'])) as f:
+        indexed = json.load(f)[:manifest['document_count']]
+
+    deleted = set(manifest['deleted'])
+    live = {document['id']: (position, document['hash'])
+            for position, document in enumerate(indexed) if position not in deleted}
+    wanted = {document['id']: document for document in documents}
+
+    added = [document for document in documents
+             if document['id'] not in live or live[document['id']][1] != _document_hash(document)]
+    added_ids = {document['id'] for document in added}
+    removed = [position for document_id, (position, _) in live.items()
+               if document_id not in wanted or document_id in added_ids]
+
+    if not added and not removed:
+        return {'added': 0, 'deleted': 0, 'segments': len(manifest['segments']), 'rebuilt': False}
+
+    deleted_count = len(deleted) + len(removed)
+    if len(manifest['segments']) >= MAX_SEGMENTS or \
+            deleted_count > MAX_DELETED_RATIO * (manifest['document_count'] + len(added)):
+        _build(directory, documents, manifest['generation'] + 1)
+        return {'added': len(documents), 'deleted': 0, 'segments': 1, 'rebuilt': True}
+
+    added = [dict(document, hash=_document_hash(document)) for document in added]
+    name = f"segment-{manifest['generation']}-{len(manifest['segments'])}"
+    total_length = _write_segment(directory, name, added) if added else 0
+
+    indexed.extend(added)
+    if added:
+        manifest['segments'].append({'name': name, 'doc_offset': manifest['document_count'], 'doc_count': len(added)})
+    manifest['document_count'] += len(added)
+    manifest['total_length'] += total_length
+    manifest['deleted'] = sorted(deleted | set(removed))
+
+    # The documents file is only appended to, so readers of the old manifest still find their documents
+    _write_json_atomic(os.path.join(directory, manifest['documents_file']), indexed)
+    _write_json_atomic(os.path.join(directory, 'manifest.json'), manifest)
+    return {'added': len(added), 'deleted': len(removed), 'segments': len(manifest['segments']), 'rebuilt': False}
+
+
+class _Segment:
+    """A memory-mapped index segment."""
+
+    def __init__(self, directory, segment):
+        def load(suffix):
+            return np.load(os.path.join(directory, f"{segment['name']}.{suffix}.npy"), mmap_mode='r')
+
+        self.vocab = load('vocab')
+        self.indptr = load('indptr')
+        self.docs = load('docs')
+        self.tf = load('tf')
+        self.lengths = load('lengths')
+        self.doc_offset = segment['doc_offset']
+
+    def postings(self, term):
+        """Get the global document ids and term frequencies of a term, or None."""
+        row = int(np.searchsorted(self.vocab, term))
+        if row >= len(self.vocab) or self.vocab[row] != term:
+            return None
+        start, end = self.indptr[row], self.indptr[row + 1]
+        docs = self.docs[start:end]
+        return (docs + self.doc_offset if self.doc_offset else docs), self.tf[start:end]
+
+
+class RetrievalIndex:
+    """A BM25 index opened from disk, with postings memory-mapped."""
+
+    def __init__(self, directory=INDEX_DIR):
+        manifest = _read_manifest(directory)
+        if manifest is None:
+            raise FileNotFoundError(f"No chatbot index in {directory}")
+
+        self.directory = directory
+        self.mtime = os.path.getmtime(os.path.join(directory, 'manifest.json'))
+        self.k1 = manifest['k1']
+        self.b = manifest['b']
+        with open(os.path.join(directory, manifest['documents_file'])) as f:
+            self.documents = json.load(f)[:manifest['document_count']]
+
+        self.segments = [_Segment(directory, segment) for segment in manifest['segments']]
+        self.count = manifest['document_count']
+        self.average_length = manifest['total_length'] / self.count if self.count else 0.0
+
+        # Per-document length normalization is fixed for this view of the index
+        lengths = np.concatenate([segment.lengths for segment in self.segments]) if self.segments else np.zeros(0)
+        self.norms = (self.k1 * (1 - self.b + self.b * lengths / max(self.average_length, 1e-9))).astype(np.float32)
+
+        live = np.ones(self.count, dtype=bool)
+        live[manifest['deleted']] = False
+        categories = np.array([document.get('category') or '' for document in self.documents])
+        self.masks = {
+            category: live & ((categories == category) | (categories == ''))
+            for category in set(categories.tolist()) | {''}
+        }
+        self.masks[None] = live
+
+    def search(self, query, k=5, category=None):
+        """
+        Rank documents against a query with BM25.
+
+        Args:
+            query (str): Query text
+            k (int): Number of results
+            category (str, optional): Only rank documents of this category or of none
+
+        Returns:
+            list: (score, document) pairs, best first, with positive scores only
+        """
+        mask = self.masks[None] if category is None else self.masks.get(category, self.masks[''])
+        scores = np.zeros(self.count, dtype=np.float32)
+
+        for term in set(tokenize(query)):
+            postings = [hit for hit in (segment.postings(term) for segment in self.segments) if hit is not None]
+            document_frequency = sum(len(docs) for docs, _ in postings)
+            if not document_frequency:
+                continue
+
+            idf = math.log(1 + (self.count - document_frequency + 0.5) / (document_frequency + 0.5))
+            for docs, tf in postings:
+                # idf * tf * (k1 + 1) / (tf + norm), in place to spare temporaries on long postings
+                weights = self.norms[docs]
+                weights += tf
+                np.divide(tf, weights, out=weights)
+                weights *= idf * (self.k1 + 1)
+                scores[docs] += weights
+
+        candidates = np.flatnonzero(scores)
+        candidates = candidates[mask[candidates]]
+        if candidates.size > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates], kind='stable')]
+        return [(float(scores[position]), self.documents[position]) for position in candidates]
+
+
+def get_index(directory=INDEX_DIR):
+    """Get the open index, updating it on first use in the process and reopening it after it is updated."""
+    global _index
+    index = _index
+    mtime = index_version(directory)
+    if index is not None and index.directory == directory and index.mtime == mtime:
+        return index
+
+    with _index_lock:
+        if directory not in _updated_directories:
+            update_index(directory=directory)
+            _updated_directories.add(directory)
+        _index = RetrievalIndex(directory)
+        return _index
+
+
+def index_version(directory=INDEX_DIR):
+    """Get the modification time of the index manifest, which changes whenever the index is updated."""
+    try:
+        return os.path.getmtime(os.path.join(directory, 'manifest.json'))
+    except OSError:
+        return None
+
+
+def find_document(message, category, min_score=MIN_ANSWER_SCORE):
+    """
+    Get the knowledge base document best answering a message, or None when nothing is close enough.
+
+    Errors opening or searching the index are raised, so callers can tell them from a miss.
+    """
+    results = get_index().search(message, k=1, category=category)
+    if not results or results[0][0] < min_score:
+        return None
+    return results[0][1]
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if '--query' in args:
+        position = args.index('--query')
+        query_category = args[position + 2] if len(args) > position + 2 else None
+        for result_score, result in get_index().search(args[position + 1], k=5, category=query_category):
+            print(f"{result_score:6.2f}  {result['id']}  {result.get('title', '')}")
+    else:
+        summary = update_index(rebuild='--rebuild' in args)
+        print(f"Chatbot index: {summary['added']} documents added, {summary['deleted']} deleted, "
+              f"{summary['segments']} segments{' (rebuilt)' if summary['rebuilt'] else ''}")
@@ -43,6 +43,9 @@ class User(db.Model):
     diet_type = db.Column(db.String(20), default='balanced')  # balanced, high_protein, low_carb, etc.
     allergies = db.Column(db.String(200))  # Stored as JSON string
 
+    # Last FitnessData/HealthStat write, used to validate cached health-AI responses
+    health_data_updated_at = db.Column(db.DateTime)
+
     # Relationships
     diet_plans = db.relationship('DietPlan', backref='user', lazy=True)
     health_stats = db.relationship('HealthStat', backref='user', lazy=True)
@@ -137,16 +140,48 @@ class DietPlan(db.Model):
     end_date = db.Column(db.Date, nullable=False)
     plan_data = db.Column(db.Text, nullable=False)  # Stored as JSON string
 
+    # Summary fields copied out of plan_data so listing plans never decodes it
+    daily_calories = db.Column(db.Integer)
+    diet_type = db.Column(db.String(20))
+    num_days = db.Column(db.Integer)
+
+    __table_args__ = (
+        db.Index('ix_diet_plan_user_created', 'user_id', 'created_at', 'id'),
+    )
+
     def get_plan(self):
-        """Get the diet plan as a dictionary."""
+        """Get the diet plan as a dictionary, rehydrating compact plans from the food catalog."""
+        # Imported here so importing the models doesn't load the food catalog
+        from diet_plan import expand_plan, is_compact_plan
+
         try:
-            return json.loads(self.plan_data)
+            plan_data = json.loads(self.plan_data)
         except:
             return {}
 
+        if is_compact_plan(plan_data):
+            return expand_plan(plan_data)
+        return plan_data
+
     def set_plan(self, plan_dict):
-        """Set the diet plan from a dictionary."""
-        self.plan_data = json.dumps(plan_dict)
+        """Set the diet plan from a dictionary, storing catalog meals as compact references."""
+        from diet_plan import compact_plan
+
+        compact = compact_plan(plan_dict)
+        self.plan_data = json.dumps(compact if compact is not None else plan_dict, separators=(',', ':'))
+        self.set_summary(plan_dict)
+
+    def set_compact_plan(self, compact):
+        """Set the diet plan from an already compacted plan, such as one accumulated while streaming."""
+        self.plan_data = json.dumps(compact, separators=(',', ':'))
+        self.set_summary(compact)
+
+    def set_summary(self, plan_dict):
+        """Copy the summary fields out of a diet plan dictionary."""
+        user_info = plan_dict.get('user_info', {})
+        self.daily_calories = user_info.get('daily_calories', 0)
+        self.diet_type = user_info.get('diet_type', 'balanced')
+        self.num_days = len(plan_dict.get('days', []))
 
 
 class HealthStat(db.Model):
@@ -162,6 +197,90 @@ class HealthStat(db.Model):
     notes = db.Column(db.Text)
 
 
+class HealthStatRollup(db.Model):
+    """Running aggregates of a user's HealthStat rows over a trailing window of days."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    window_days = db.Column(db.Integer, nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+
+    # Welford running count, mean and sum of squared deviations per metric
+    steps_count = db.Column(db.Integer, default=0, nullable=False)
+    steps_mean = db.Column(db.Float, default=0.0, nullable=False)
+    steps_m2 = db.Column(db.Float, default=0.0, nullable=False)
+    sleep_count = db.Column(db.Integer, default=0, nullable=False)
+    sleep_mean = db.Column(db.Float, default=0.0, nullable=False)
+    sleep_m2 = db.Column(db.Float, default=0.0, nullable=False)
+    calories_count = db.Column(db.Integer, default=0, nullable=False)
+    calories_mean = db.Column(db.Float, default=0.0, nullable=False)
+    calories_m2 = db.Column(db.Float, default=0.0, nullable=False)
+
+    # Threshold day counts
+    consistent_days = db.Column(db.Integer, default=0, nullable=False)
+    good_sleep_days = db.Column(db.Integer, default=0, nullable=False)
+    active_days = db.Column(db.Integer, default=0, nullable=False)
+
+    # Best, first and last step days; recomputed from history when a removal invalidates them
+    steps_max = db.Column(db.Integer)
+    steps_first = db.Column(db.Integer)
+    steps_first_date = db.Column(db.Date)
+    steps_last = db.Column(db.Integer)
+    steps_last_date = db.Column(db.Date)
+    extremes_stale = db.Column(db.Boolean, default=False, nullable=False)
+
+    # Bumped on every update, so a write based on an outdated read fails instead of losing changes
+    version = db.Column(db.Integer, nullable=False, default=1)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'window_days', name='uq_health_stat_rollup_user_window'),
+    )
+    __mapper_args__ = {'version_id_col': version}
+
+
+class HealthStatBucket(db.Model):
+    """Aggregates of one HealthStat metric over a day, week or month of a user's history."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    metric = db.Column(db.String(20), nullable=False)  # HealthStat column name
+    resolution = db.Column(db.String(10), nullable=False)  # day, week, month
+    bucket_start = db.Column(db.Date, nullable=False)  # Day, Monday of the week or first of the month
+
+    count = db.Column(db.Integer, default=0, nullable=False)
+    total = db.Column(db.Float, default=0.0, nullable=False)
+
+    # Recomputed from history when a removal invalidates them
+    min_value = db.Column(db.Float)
+    max_value = db.Column(db.Float)
+    extremes_stale = db.Column(db.Boolean, default=False, nullable=False)
+
+    __table_args__ = (
+        # Also serves the range scans of a metric's chart
+        db.UniqueConstraint('user_id', 'metric', 'resolution', 'bucket_start', name='uq_health_stat_bucket'),
+    )
+
+
+class HealthMetricBaseline(db.Model):
+    """Exponentially weighted baseline of one of a user's daily health metrics, for anomaly detection."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    metric = db.Column(db.String(20), nullable=False)  # heart_rate, weight, sleep
+
+    # EWMA mean and variance over the days before current_date
+    days = db.Column(db.Integer, default=0, nullable=False)
+    mean = db.Column(db.Float, default=0.0, nullable=False)
+    variance = db.Column(db.Float, default=0.0, nullable=False)
+
+    # Latest day's value; folded into the baseline once a later day arrives
+    current_date = db.Column(db.Date)
+    current_value = db.Column(db.Float)
+    alerted_date = db.Column(db.Date)  # Last day an anomaly notification was created
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'metric', name='uq_health_metric_baseline_user_metric'),
+    )
+
+
 class Reminder(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -193,6 +312,43 @@ class ChatMessage(db.Model):
     category = db.Column(db.String(20), nullable=False)  # fitness, diet, wellness, progress
     timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
+    # Serve history pages and conversation context newest-first without a sort.
+    # Both select content, so these are not covering: SQLite walks the index and
+    # then reads each row of the page from the table, one lookup per message
+    # returned. Covering them would mean copying content into the index.
+    __table_args__ = (
+        db.Index('ix_chat_message_user_category_timestamp', 'user_id', 'category', 'timestamp'),
+        db.Index('ix_chat_message_user_timestamp', 'user_id', 'timestamp'),
+    )
+
+
+class ChatSummary(db.Model):
+    """Counts and topics of a user's chat messages in one category that retention has compacted."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    category = db.Column(db.String(20), nullable=False)
+    message_count = db.Column(db.Integer, nullable=False, default=0)
+    user_message_count = db.Column(db.Integer, nullable=False, default=0)
+    first_message_at = db.Column(db.DateTime)
+    last_message_at = db.Column(db.DateTime)
+    topics = db.Column(db.Text)  # JSON string of intent name -> number of user messages asking about it
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'category', name='uq_chat_summary_user_category'),
+    )
+
+    def get_topics(self):
+        """Get the topic counts as a dictionary."""
+        try:
+            return json.loads(self.topics) if self.topics else {}
+        except:
+            return {}
+
+    def set_topics(self, topics_dict):
+        """Set the topic counts from a dictionary."""
+        self.topics = json.dumps(topics_dict)
+
 
 class Exercise(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -299,7 +455,11 @@ class Trainer(db.Model):
 
     # Relationships
     clients = db.relationship('TrainerClient', backref='trainer', lazy=True, cascade="all, delete-orphan")
-    workout_plans = db.relationship('WorkoutPlan', backref='creator', lazy=True, foreign_keys=[WorkoutPlan.creator_id])
+    # Plans record their creator's user id, not the trainer id
+    workout_plans = db.relationship(
+        'WorkoutPlan', lazy=True, viewonly=True,
+        primaryjoin='Trainer.user_id == foreign(WorkoutPlan.creator_id)'
+    )
 
 
 class TrainerClient(db.Model):
@@ -552,3 +712,33 @@ class FitnessData(db.Model):
 
     # Relationship
     user = db.relationship('User', backref='fitness_data', lazy=True)
+
+
+class RecommendationCache(db.Model):
+    """Health recommendations precomputed for a user, date and hour of the day."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    for_date = db.Column(db.Date, nullable=False)
+    hour = db.Column(db.Integer, nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False)  # Hash of the inputs the result was computed from
+    recommendations = db.Column(db.Text, nullable=False)  # Stored as JSON string
+    health_data = db.Column(db.Text, nullable=False)  # Stored as JSON string
+    computed_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'for_date', 'hour', name='uq_recommendation_cache_user_date_hour'),
+    )
+
+    def get_recommendations(self):
+        """Get the cached recommendations as a dictionary."""
+        try:
+            return json.loads(self.recommendations)
+        except:
+            return {}
+
+    def get_health_data(self):
+        """Get the health data the recommendations were computed from as a dictionary."""
+        try:
+            return json.loads(self.health_data)
+        except:
+            return {}
@@ -3,15 +3,142 @@ Diet Plan API Module
 This module provides API endpoints for generating and managing diet plans.
 """
 
-from flask import Blueprint, request, jsonify, render_template, session
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from db import db, User, DietPlan, HealthStat
-from diet_plan import generate_diet_plan, get_meal_suggestion
+from flask import Blueprint, request, jsonify, render_template, session, Response, stream_with_context, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from db import db, User, DietPlan, HealthStat, Trainer, TrainerClient
+from diet_plan import (generate_diet_plan, start_diet_plan, get_meal_suggestion, search_meals, plan_cache_key,
+                       compact_day, COMPACT_PLAN_FORMAT)
+from cache import LRUCache, get_cache_stats
+import base64
+import copy
 import datetime
 import json
+import os
+import queue
+import threading
 
 diet_bp = Blueprint('diet', __name__)
 
+# Preferences used when no user profile is available
+DEFAULT_DIET_PREFERENCES = {
+    'weight_kg': 70,
+    'height_cm': 170,
+    'age': 30,
+    'gender': 'male',
+    'activity_level': 'moderate',
+    'goal': 'maintain',
+    'diet_type': 'balanced',
+    'allergies': [],
+    'num_days': 7
+}
+
+# Anonymous plans keyed by plan_cache_key; identical inputs share one generated plan
+anonymous_plan_cache = LRUCache(
+    'anonymous_diet_plans',
+    maxsize=int(os.getenv('DIET_PLAN_CACHE_SIZE', 256)),
+    ttl=int(os.getenv('DIET_PLAN_CACHE_TTL', 3600))
+)
+
+# Upper bound on the number of plans a single batch request may generate
+MAX_BATCH_PLANS = 500
+
+# Page sizes for listing a user's diet plans
+DIET_PLANS_PAGE_SIZE = 50
+MAX_DIET_PLANS_PAGE_SIZE = 200
+
+# Upper bound on the horizon of any generated diet plan
+MAX_PLAN_DAYS = 365
+
+# Process pool for batch generation, created on first use
+_batch_executor = None
+
+def get_batch_executor():
+    """Get the process pool used for batch diet plan generation."""
+    global _batch_executor
+    if _batch_executor is None:
+        max_workers = int(os.getenv('DIET_BATCH_WORKERS', os.cpu_count() or 1))
+        _batch_executor = ProcessPoolExecutor(max_workers=max_workers)
+    return _batch_executor
+
+def encode_plan_cursor(diet_plan):
+    """Encode the (created_at, id) position of a diet plan as an opaque cursor."""
+    position = f"{diet_plan.created_at.isoformat()}|{diet_plan.id}"
+    return base64.urlsafe_b64encode(position.encode('utf-8')).decode('ascii')
+
+def decode_plan_cursor(cursor):
+    """Decode a cursor into its (created_at, id) position, raising ValueError if malformed."""
+    created_at, plan_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+    created_at, plan_id = datetime.datetime.fromisoformat(created_at), int(plan_id)
+    # Ids SQLite can't bind would otherwise fail later, in the query
+    if not 0 < plan_id < 2 ** 63:
+        raise ValueError(f"Cursor id out of range: {plan_id}")
+    return created_at, plan_id
+
+def get_request_user():
+    """Get the user of an optional bearer token, or None for anonymous requests."""
+    auth_header = request.headers.get('Authorization')
+    if not (auth_header and auth_header.startswith('Bearer ')):
+        return None
+
+    try:
+        current_user_identity = get_jwt_identity()
+        return User.query.filter_by(email=current_user_identity['email']).first()
+    except Exception as e:
+        # If there's an error with authentication, continue without a user
+        print(f"Authentication error: {e}")
+        return None
+
+def parse_bool(value):
+    """Parse a JSON boolean, 1/0 or a "true"/"false"/"1"/"0" string, raising ValueError for anything else."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ('true', '1', 'false', '0'):
+        return value.strip().lower() in ('true', '1')
+    raise ValueError(f"Invalid boolean: {value!r}")
+
+def parse_num_days(value):
+    """Parse a plan horizon of 1 to MAX_PLAN_DAYS days, raising ValueError for anything else."""
+    error = f"num_days must be an integer between 1 and {MAX_PLAN_DAYS}"
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(error)
+    try:
+        num_days = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(error) from None
+    if num_days < 1 or num_days > MAX_PLAN_DAYS:
+        raise ValueError(error)
+    return num_days
+
+def apply_preference_overrides(user_preferences, overrides):
+    """Override known preference keys with values from request data, raising ValueError for invalid values."""
+    for key, value in overrides.items():
+        if key in user_preferences:
+            user_preferences[key] = value
+
+    # Opt in to macro-target optimized meal selection
+    if 'optimize' in overrides:
+        try:
+            user_preferences['optimize'] = parse_bool(overrides['optimize'])
+        except ValueError:
+            raise ValueError("optimize must be true or false") from None
+
+    # Every plan's horizon is bounded, so one request can't generate (or cache) an unbounded plan
+    user_preferences['num_days'] = parse_num_days(overrides.get('num_days', user_preferences.get('num_days', 7)))
+
+    # Seed for reproducible meal selection
+    if overrides.get('seed') is not None:
+        seed = overrides['seed']
+        if isinstance(seed, bool) or not isinstance(seed, (int, str)):
+            raise ValueError("seed must be an integer or a string")
+        user_preferences['seed'] = seed
+
+    return user_preferences
+
 @diet_bp.route('/api/diet-plan', methods=['POST'])
 def create_diet_plan():
     """Create a new diet plan for the user."""
@@ -58,25 +185,28 @@ def create_diet_plan():
             user_preferences = user.get_diet_preferences()
         else:
             # Use default preferences if user is not authenticated
-            user_preferences = {
-                'weight_kg': 70,
-                'height_cm': 170,
-                'age': 30,
-                'gender': 'male',
-                'activity_level': 'moderate',
-                'goal': 'maintain',
-                'diet_type': 'balanced',
-                'allergies': [],
-                'num_days': 7
-            }
+            user_preferences = dict(DEFAULT_DIET_PREFERENCES)
 
         # Override with request data if provided
-        for key, value in data.items():
-            if key in user_preferences:
-                user_preferences[key] = value
+        try:
+            apply_preference_overrides(user_preferences, data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
         # Generate the diet plan
-        diet_plan_data = generate_diet_plan(user_preferences)
+        if user:
+            diet_plan_data = generate_diet_plan(user_preferences)
+        else:
+            # Anonymous plans are deterministic for a seed, so identical inputs share a cached plan
+            user_preferences.setdefault('seed', 0)
+            cache_key = plan_cache_key(user_preferences)
+            # The cache keeps its own copy, so a caller changing its plan can't change other callers'
+            cached_plan = anonymous_plan_cache.get(cache_key)
+            if cached_plan is None:
+                diet_plan_data = generate_diet_plan(user_preferences)
+                anonymous_plan_cache.set(cache_key, copy.deepcopy(diet_plan_data))
+            else:
+                diet_plan_data = copy.deepcopy(cached_plan)
 
         # If user is authenticated, save the diet plan to the database
         if user:
@@ -86,9 +216,9 @@ def create_diet_plan():
             diet_plan = DietPlan(
                 user_id=user.id,
                 start_date=start_date,
-                end_date=end_date,
-                plan_data=json.dumps(diet_plan_data)
+                end_date=end_date
             )
+            diet_plan.set_plan(diet_plan_data)
 
             # Save to database
             db.session.add(diet_plan)
@@ -112,9 +242,98 @@ def create_diet_plan():
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@diet_bp.route('/api/diet-plan/stream', methods=['POST'])
+def stream_diet_plan():
+    """
+    Generate a diet plan day by day as newline-delimited JSON.
+
+    The first line carries the plan's user_info, each following line one day,
+    and the last line a summary. Days are compacted as they are sent, so
+    authenticated plans are saved from the same stream without ever holding
+    the full plan in memory.
+    """
+    try:
+        data = request.get_json() or {}
+        user = get_request_user()
+
+        if user:
+            user_preferences = user.get_diet_preferences()
+        else:
+            user_preferences = dict(DEFAULT_DIET_PREFERENCES)
+
+        try:
+            apply_preference_overrides(user_preferences, data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # Parsed and bounded by apply_preference_overrides
+        num_days = user_preferences['num_days']
+
+        user_info, days = start_diet_plan(user_preferences)
+        user_id = user.id if user else None
+
+        def generate():
+            yield json.dumps({"user_info": user_info, "num_days": num_days}) + "\n"
+
+            compact_days = []
+            start_date = None
+            for day_num, day in enumerate(days):
+                if start_date is None:
+                    start_date = day['date']
+                if compact_days is not None:
+                    compact = compact_day(day)
+                    # A None means the catalog changed mid-stream and the plan can't be stored compactly
+                    if compact is None:
+                        compact_days = None
+                    else:
+                        compact_days.append(compact)
+                yield json.dumps({"day": day_num, **day}) + "\n"
+
+            if user_id is None:
+                yield json.dumps({"summary": True, "generated": num_days, "saved": False}) + "\n"
+                return
+
+            if compact_days is None:
+                yield json.dumps({"summary": True, "generated": num_days, "saved": False,
+                                  "error": "Food catalog changed while generating; plan not saved"}) + "\n"
+                return
+
+            try:
+                plan_start = datetime.date.fromisoformat(start_date)
+                diet_plan = DietPlan(
+                    user_id=user_id,
+                    start_date=plan_start,
+                    end_date=plan_start + datetime.timedelta(days=num_days - 1)
+                )
+                diet_plan.set_compact_plan({
+                    'format': COMPACT_PLAN_FORMAT,
+                    'user_info': user_info,
+                    'start_date': start_date,
+                    'days': compact_days
+                })
+                db.session.add(diet_plan)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                yield json.dumps({"summary": True, "generated": num_days, "saved": False,
+                                  "error": f"Failed to save diet plan: {e}"}) + "\n"
+                return
+
+            yield json.dumps({
+                "summary": True,
+                "generated": num_days,
+                "saved": True,
+                "diet_plan_id": diet_plan.id
+            }) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @diet_bp.route('/api/diet-plans', methods=['GET'])
 def get_diet_plans():
-    """Get all diet plans for the user."""
+    """Get the user's diet plans, newest first, one keyset-paginated page at a time."""
     try:
         # Check if user is authenticated
         auth_header = request.headers.get('Authorization')
@@ -123,38 +342,227 @@ def get_diet_plans():
 
         try:
             # Get the current user
+            verify_jwt_in_request()
             current_user_identity = get_jwt_identity()
             user = User.query.filter_by(email=current_user_identity['email']).first()
+        except Exception as e:
+            return jsonify({"error": "Authentication error"}), 401
 
-            if not user:
-                return jsonify({"error": "User not found"}), 404
+        if not user:
+            return jsonify({"error": "User not found"}), 404
 
-            # Get all diet plans for the user
-            diet_plans = DietPlan.query.filter_by(user_id=user.id).order_by(DietPlan.created_at.desc()).all()
-
-            # Format the response
-            result = []
-            for plan in diet_plans:
-                plan_data = plan.get_plan()
-                result.append({
-                    "id": plan.id,
-                    "created_at": plan.created_at.isoformat(),
-                    "start_date": plan.start_date.isoformat(),
-                    "end_date": plan.end_date.isoformat(),
-                    "summary": {
-                        "daily_calories": plan_data.get('user_info', {}).get('daily_calories', 0),
-                        "diet_type": plan_data.get('user_info', {}).get('diet_type', 'balanced'),
-                        "num_days": len(plan_data.get('days', []))
-                    }
-                })
+        # Get query parameters for keyset pagination
+        limit = min(max(request.args.get('limit', DIET_PLANS_PAGE_SIZE, type=int), 1), MAX_DIET_PLANS_PAGE_SIZE)
+        cursor = request.args.get('cursor')
 
-            return jsonify(result), 200
-        except Exception as e:
-            return jsonify({"error": "Authentication error"}), 401
+        # Only the summary columns are loaded; plan_data is never read here
+        query = DietPlan.query.options(load_only(
+            DietPlan.id, DietPlan.created_at, DietPlan.start_date, DietPlan.end_date,
+            DietPlan.daily_calories, DietPlan.diet_type, DietPlan.num_days
+        )).filter(DietPlan.user_id == user.id)
+
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = decode_plan_cursor(cursor)
+            except ValueError:
+                return jsonify({"error": "Invalid cursor"}), 400
+            query = query.filter(or_(
+                DietPlan.created_at < cursor_created_at,
+                and_(DietPlan.created_at == cursor_created_at, DietPlan.id < cursor_id)
+            ))
+
+        diet_plans = query.order_by(DietPlan.created_at.desc(), DietPlan.id.desc()).limit(limit + 1).all()
+        has_more = len(diet_plans) > limit
+        diet_plans = diet_plans[:limit]
+
+        # Format the response
+        result = []
+        for plan in diet_plans:
+            result.append({
+                "id": plan.id,
+                "created_at": plan.created_at.isoformat(),
+                "start_date": plan.start_date.isoformat(),
+                "end_date": plan.end_date.isoformat(),
+                "summary": {
+                    "daily_calories": plan.daily_calories or 0,
+                    "diet_type": plan.diet_type or 'balanced',
+                    "num_days": plan.num_days or 0
+                }
+            })
+
+        return jsonify({
+            "diet_plans": result,
+            "next_cursor": encode_plan_cursor(diet_plans[-1]) if has_more else None
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@diet_bp.route('/api/diet-plans/batch', methods=['POST'])
+@jwt_required()
+def create_diet_plans_batch():
+    """
+    Generate many diet plans in one request, e.g. a trainer refreshing all clients.
+
+    The request body holds an ``items`` list. Each item is either a client id, a
+    dict with a ``client_id`` plus preference overrides, or a plain preference
+    dict. Plans for the trainer's active clients are saved; plain preference
+    dicts are only generated. Shared overrides can be passed in ``defaults``.
+
+    Plans are generated across a process pool and streamed back as NDJSON, one
+    line per item as it completes, followed by a summary line once every client
+    plan has been saved in a single bulk insert. Generating and saving run on a
+    background thread, so the plans are saved even if the client disconnects.
+    """
+    try:
+        # Get the current user
+        current_user_identity = get_jwt_identity()
+        user = User.query.filter_by(email=current_user_identity['email']).first()
+
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        data = request.get_json() or {}
+        items = data.get('items')
+        defaults = data.get('defaults') or {}
+
+        if not isinstance(items, list) or not items:
+            return jsonify({"error": "items must be a non-empty list"}), 400
+
+        if len(items) > MAX_BATCH_PLANS:
+            return jsonify({"error": f"A batch can contain at most {MAX_BATCH_PLANS} items"}), 400
+
+        # Normalize items into (index, client_id, overrides)
+        entries = []
+        for index, item in enumerate(items):
+            if isinstance(item, int) and not isinstance(item, bool):
+                entries.append((index, item, {}))
+            elif isinstance(item, dict):
+                entries.append((index, item.get('client_id'), item))
+            else:
+                return jsonify({"error": f"Invalid item at index {index}"}), 400
+
+        # Only active clients of the requesting trainer can have plans generated and saved
+        requested_client_ids = {client_id for _, client_id, _ in entries if client_id is not None}
+        clients = {}
+        if requested_client_ids:
+            trainer = Trainer.query.filter_by(user_id=user.id).first()
+            if not trainer:
+                return jsonify({"error": "Only trainers can generate plans for clients"}), 403
+
+            allowed_client_ids = [
+                trainer_client.client_id for trainer_client in TrainerClient.query.filter(
+                    TrainerClient.trainer_id == trainer.id,
+                    TrainerClient.client_id.in_(requested_client_ids),
+                    TrainerClient.status == 'active'
+                ).all()
+            ]
+            if allowed_client_ids:
+                clients = {client.id: client for client in User.query.filter(User.id.in_(allowed_client_ids)).all()}
+
+        jobs = []
+        rejected = []
+        for index, client_id, overrides in entries:
+            if client_id is None:
+                user_preferences = dict(DEFAULT_DIET_PREFERENCES)
+            elif client_id in clients:
+                user_preferences = clients[client_id].get_diet_preferences()
+            else:
+                rejected.append({"index": index, "client_id": client_id, "error": "Client not found"})
+                continue
+
+            try:
+                apply_preference_overrides(user_preferences, defaults)
+                apply_preference_overrides(user_preferences, overrides)
+            except ValueError as e:
+                return jsonify({"error": f"{e} (index {index})"}), 400
+
+            jobs.append((index, client_id, user_preferences))
+
+        lines = queue.Queue()
+        threading.Thread(
+            target=run_diet_plan_batch,
+            args=(current_app._get_current_object(), jobs, rejected, lines),
+            name='diet-plan-batch',
+            daemon=True
+        ).start()
+
+        def generate():
+            while True:
+                line = lines.get()
+                if line is None:
+                    return
+                yield json.dumps(line) + "\n"
+
+        return Response(generate(), mimetype='application/x-ndjson')
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def run_diet_plan_batch(app, jobs, rejected, lines):
+    """
+    Generate a batch of diet plans and save the client plans, putting each NDJSON
+    line on a queue as it is ready and None once the batch is done.
+    """
+    try:
+        with app.app_context():
+            for line in rejected:
+                lines.put(line)
+
+            executor = get_batch_executor()
+            futures = {
+                executor.submit(generate_diet_plan, user_preferences): (index, client_id, user_preferences)
+                for index, client_id, user_preferences in jobs
+            }
+
+            start_date = datetime.datetime.now().date()
+            diet_plans = []
+            failed = 0
+            for future in as_completed(futures):
+                index, client_id, user_preferences = futures[future]
+                try:
+                    diet_plan_data = future.result()
+                except Exception as e:
+                    failed += 1
+                    lines.put({"index": index, "client_id": client_id, "error": str(e)})
+                    continue
+
+                if client_id is not None:
+                    diet_plan = DietPlan(
+                        user_id=client_id,
+                        start_date=start_date,
+                        end_date=start_date + datetime.timedelta(days=user_preferences['num_days'] - 1)
+                    )
+                    diet_plan.set_plan(diet_plan_data)
+                    diet_plans.append((client_id, diet_plan))
+
+                lines.put({"index": index, "client_id": client_id, "diet_plan": diet_plan_data})
+
+            # Save every client plan in one bulk insert
+            saved_plan_ids = {}
+            try:
+                if diet_plans:
+                    db.session.add_all([diet_plan for _, diet_plan in diet_plans])
+                    db.session.commit()
+                    saved_plan_ids = {client_id: diet_plan.id for client_id, diet_plan in diet_plans}
+            except Exception as e:
+                db.session.rollback()
+                lines.put({"summary": True, "error": f"Failed to save diet plans: {e}"})
+                return
+
+            lines.put({
+                "summary": True,
+                "generated": len(jobs) - failed,
+                "failed": failed + len(rejected),
+                "saved": len(saved_plan_ids),
+                "diet_plan_ids": saved_plan_ids
+            })
+    except Exception as e:
+        print(f"Error generating diet plan batch: {str(e)}")
+        lines.put({"summary": True, "error": str(e)})
+    finally:
+        lines.put(None)
+
 @diet_bp.route('/api/diet-plans/<int:plan_id>', methods=['GET'])
 def get_diet_plan(plan_id):
     """Get a specific diet plan."""
@@ -212,21 +620,33 @@ def suggest_meal():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@diet_bp.route('/api/meal-search', methods=['GET'])
+def search_meal():
+    """Search the food catalog by meal name and ingredients."""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({"error": "Query parameter 'q' is required"}), 400
+
+        meal_type = request.args.get('meal_type')
+        limit = min(request.args.get('limit', 20, type=int), 100)
+
+        meals = search_meals(query, meal_type=meal_type, limit=limit)
+        return jsonify({"meals": meals, "count": len(meals)}), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@diet_bp.route('/api/diet-plan/cache-stats', methods=['GET'])
+def diet_plan_cache_stats():
+    """Get hit/miss counters for every named cache, the diet plan caches among them."""
+    return jsonify(get_cache_stats()), 200
+
 @diet_bp.route('/diet-plan-generator')
 def diet_plan_generator_page():
     """Render the diet plan generator page."""
     # Create default preferences
-    default_preferences = {
-        'weight_kg': 70,
-        'height_cm': 170,
-        'age': 30,
-        'gender': 'male',
-        'activity_level': 'moderate',
-        'goal': 'maintain',
-        'diet_type': 'balanced',
-        'allergies': [],
-        'num_days': 7
-    }
+    default_preferences = dict(DEFAULT_DIET_PREFERENCES)
 
     return render_template(
         'diet_plan_generator.html',
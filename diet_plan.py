@@ -5,9 +5,15 @@ This module provides functionality to generate personalized diet plans based on
 
 import random
 import json
+import hashlib
 import os
 from datetime import datetime, timedelta
 
+import numpy as np
+
+from food_catalog import FoodCatalog, MEAL_TYPES, MACRO_FIELDS, normalize_allergens
+from meal_optimizer import MealPlanOptimizer
+
 # Food database - In a real application, this would be stored in a database
 FOOD_DATABASE = {
     "breakfast": [
@@ -260,20 +266,140 @@ DIET_TYPES = {
     "vegan": {"protein": 0.2, "carbs": 0.6, "fat": 0.2}
 }
 
+FOOD_DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'food_database.json')
+
+# Marker for plans stored as catalog meal references instead of full meal dicts
+COMPACT_PLAN_FORMAT = 'compact-v1'
+
+# SQLite catalog built with sqlite_catalog.py; when unset the JSON file is used
+FOOD_CATALOG_DB = os.getenv('FOOD_CATALOG_DB')
+
+def create_food_catalog():
+    """Create the catalog backend: SQLite when FOOD_CATALOG_DB is set, otherwise food_database.json."""
+    if FOOD_CATALOG_DB:
+        from sqlite_catalog import SQLiteFoodCatalog
+        return SQLiteFoodCatalog(FOOD_CATALOG_DB)
+
+    # In-memory catalog, reloaded only when food_database.json changes on disk
+    return FoodCatalog(FOOD_DATABASE_PATH, default_data=FOOD_DATABASE)
+
+# Shared catalog used for plan generation, meal suggestions and stored plan references
+food_catalog = create_food_catalog()
+
 def save_food_database():
     """Save the food database to a JSON file."""
-    with open(os.path.join(os.path.dirname(__file__), 'food_database.json'), 'w') as f:
+    with open(FOOD_DATABASE_PATH, 'w') as f:
         json.dump(FOOD_DATABASE, f, indent=4)
 
 def load_food_database():
-    """Load the food database from a JSON file."""
-    try:
-        with open(os.path.join(os.path.dirname(__file__), 'food_database.json'), 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
+    """Load the food database from the in-memory catalog."""
+    if not os.path.exists(FOOD_DATABASE_PATH):
         # If the file doesn't exist, create it with the default database
         save_food_database()
-        return FOOD_DATABASE
+    return food_catalog.as_dict()
+
+# Activity level -> TDEE multiplier
+ACTIVITY_MULTIPLIERS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "moderate": 1.55,
+    "active": 1.725,
+    "very_active": 1.9
+}
+
+# Goal -> daily calorie adjustment
+GOAL_ADJUSTMENTS = {
+    "maintain": 0,
+    "lose": -500,
+    "gain": 500
+}
+
+def _category_codes(values, labels):
+    """Map an array of category labels to their index in ``labels``, or ``len(labels)`` if unknown."""
+    values = np.asarray(values)
+    codes = np.full(values.shape, len(labels), dtype=np.intp)
+    for code, label in enumerate(labels):
+        codes[values == label] = code
+    return codes
+
+def _lookup_batch(values, mapping, default):
+    """Map an array of category labels to numbers, with ``default`` for unknown labels."""
+    table = np.array(list(mapping.values()) + [default], dtype=np.float64)
+    return table[_category_codes(values, list(mapping))]
+
+def _gender_masks_batch(gender):
+    """Get case-insensitive male and female masks for an array of gender labels."""
+    gender = np.asarray(gender)
+    is_male = np.asarray(gender == 'male')
+    is_female = np.asarray(gender == 'female')
+
+    # Only labels that aren't already lowercase need the slower string pass
+    other = ~(is_male | is_female)
+    if other.any():
+        lowered = np.char.lower(gender[other].astype(str))
+        is_male[other] = lowered == 'male'
+        is_female[other] = lowered == 'female'
+
+    return is_male, is_female
+
+def calculate_daily_calories_batch(weight_kg, height_cm, age, gender, activity_level, goal):
+    """
+    Calculate daily calorie needs for many users at once.
+
+    Applies the same Mifflin-St Jeor equation, activity multipliers, goal
+    adjustments and minimums as calculate_daily_calories, element-wise over
+    NumPy arrays. Every argument may also be a scalar, which is broadcast.
+
+    Args:
+        weight_kg (array-like): Weights in kilograms
+        height_cm (array-like): Heights in centimeters
+        age (array-like): Ages in years
+        gender (array-like): Gender labels, compared case-insensitively
+        activity_level (array-like): Keys of ACTIVITY_MULTIPLIERS (unknown levels count as sedentary)
+        goal (array-like): Keys of GOAL_ADJUSTMENTS (unknown goals count as maintain)
+
+    Returns:
+        np.ndarray: Daily calorie needs as float64
+    """
+    weight_kg = np.asarray(weight_kg, dtype=np.float64)
+    height_cm = np.asarray(height_cm, dtype=np.float64)
+    age = np.asarray(age, dtype=np.float64)
+    is_male, is_female = _gender_masks_batch(gender)
+
+    activity_multiplier = _lookup_batch(activity_level, ACTIVITY_MULTIPLIERS, ACTIVITY_MULTIPLIERS['sedentary'])
+    goal_adjustment = _lookup_batch(goal, GOAL_ADJUSTMENTS, 0)
+
+    # Calculate BMR (Basal Metabolic Rate)
+    bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age + np.where(is_male, 5.0, -161.0)
+
+    # Calculate TDEE (Total Daily Energy Expenditure) and adjust based on goal
+    daily_calories = bmr * activity_multiplier + goal_adjustment
+
+    # Ensure minimum healthy calories
+    min_calories = np.where(is_female, 1200.0, 1500.0)
+    return np.maximum(daily_calories, min_calories)
+
+def calculate_macro_targets_batch(daily_calories, diet_type):
+    """
+    Calculate protein, carbs and fat targets in grams for many users at once.
+
+    Args:
+        daily_calories (array-like): Daily calorie needs
+        diet_type (array-like): Keys of DIET_TYPES (unknown types count as balanced)
+
+    Returns:
+        tuple: Protein, carbs and fat targets as float64 arrays
+    """
+    daily_calories = np.asarray(daily_calories, dtype=np.float64)
+    codes = _category_codes(diet_type, list(DIET_TYPES))
+
+    targets = []
+    for macro, calories_per_gram in (('protein', 4), ('carbs', 4), ('fat', 9)):
+        shares = np.array(
+            [distribution[macro] for distribution in DIET_TYPES.values()] + [DIET_TYPES['balanced'][macro]]
+        )
+        targets.append((daily_calories * shares[codes]) / calories_per_gram)
+    return tuple(targets)
 
 def calculate_daily_calories(weight_kg, height_cm, age, gender, activity_level, goal):
     """
@@ -290,43 +416,34 @@ def calculate_daily_calories(weight_kg, height_cm, age, gender, activity_level,
     - maintain: 0
     - lose: -500
     - gain: +500
-    """
-    # Convert activity level to multiplier
-    activity_multipliers = {
-        "sedentary": 1.2,
-        "light": 1.375,
-        "moderate": 1.55,
-        "active": 1.725,
-        "very_active": 1.9
-    }
 
-    activity_multiplier = activity_multipliers.get(activity_level, 1.2)
+    Delegates to calculate_daily_calories_batch so single users and cohorts
+    get identical results.
+    """
+    return float(calculate_daily_calories_batch(weight_kg, height_cm, age, gender, activity_level, goal))
 
-    # Calculate BMR (Basal Metabolic Rate)
-    if gender.lower() == "male":
-        bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age + 5
-    else:
-        bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age - 161
-
-    # Calculate TDEE (Total Daily Energy Expenditure)
-    tdee = bmr * activity_multiplier
-
-    # Adjust based on goal
-    goal_adjustments = {
-        "maintain": 0,
-        "lose": -500,
-        "gain": 500
-    }
+def generate_diet_plan(user_preferences):
+    """
+    Generate a personalized diet plan based on user preferences.
 
-    daily_calories = tdee + goal_adjustments.get(goal, 0)
+    Args:
+        user_preferences (dict): User preferences, see start_diet_plan
 
-    # Ensure minimum healthy calories
-    min_calories = 1200 if gender.lower() == "female" else 1500
-    return max(daily_calories, min_calories)
+    Returns:
+        dict: A personalized diet plan
+    """
+    user_info, days = start_diet_plan(user_preferences)
+    return {
+        'user_info': user_info,
+        'days': list(days)
+    }
 
-def generate_diet_plan(user_preferences):
+def start_diet_plan(user_preferences):
     """
-    Generate a personalized diet plan based on user preferences.
+    Set up a personalized diet plan whose days are generated lazily.
+
+    Long plans can be streamed and persisted day by day through the returned
+    generator without holding every day in memory at once.
 
     Args:
         user_preferences (dict): User preferences including:
@@ -340,13 +457,14 @@ def generate_diet_plan(user_preferences):
             - allergies: List of food allergies
             - num_days: Number of days to generate the plan for
             - budget_friendly: Whether to include only budget-friendly options
+            - optimize: Whether to pick the meals closest to the calorie and macro
+              targets instead of picking them at random
+            - seed: Seed for random meal selection; the same seed, preferences and
+              catalog always produce the same plan
 
     Returns:
-        dict: A personalized diet plan
+        tuple: The plan's user info dict and a generator of day dicts
     """
-    # Load the food database
-    food_db = load_food_database()
-
     # Extract user preferences
     weight_kg = user_preferences.get('weight_kg', 70)
     height_cm = user_preferences.get('height_cm', 170)
@@ -358,54 +476,57 @@ def generate_diet_plan(user_preferences):
     allergies = user_preferences.get('allergies', [])
     num_days = user_preferences.get('num_days', 7)
     budget_friendly = user_preferences.get('budget_friendly', False)
+    optimize = user_preferences.get('optimize', False)
+    rng = random.Random(user_preferences.get('seed'))
 
     # Calculate daily calorie needs
     daily_calories = calculate_daily_calories(weight_kg, height_cm, age, gender, activity_level, goal)
 
-    # Get macronutrient distribution based on diet type
-    macro_distribution = DIET_TYPES.get(diet_type, DIET_TYPES['balanced'])
-
-    # Calculate macronutrient targets in grams
-    protein_target = (daily_calories * macro_distribution['protein']) / 4  # 4 calories per gram of protein
-    carbs_target = (daily_calories * macro_distribution['carbs']) / 4  # 4 calories per gram of carbs
-    fat_target = (daily_calories * macro_distribution['fat']) / 9  # 9 calories per gram of fat
-
-    # Filter out foods with allergens (in a real app, this would be more sophisticated)
-    filtered_food_db = {}
-    for meal_type, meals in food_db.items():
-        filtered_food_db[meal_type] = []
-        for meal in meals:
-            # Check if any allergen is in the ingredients
-            allergen_found = False
-            for allergen in allergies:
-                if any(allergen.lower() in ingredient.lower() for ingredient in meal['ingredients']):
-                    allergen_found = True
-                    break
-
-            # Check if meal should be included based on diet type, allergens, and budget preference
-            include_meal = (
-                not allergen_found and
-                diet_type in meal['diet_types'] and
-                (not budget_friendly or meal.get('budget_friendly', False))
-            )
-
-            if include_meal:
-                filtered_food_db[meal_type].append(meal)
-
-    # Generate the diet plan
-    diet_plan = {
-        'user_info': {
-            'daily_calories': round(daily_calories),
-            'protein_target': round(protein_target),
-            'carbs_target': round(carbs_target),
-            'fat_target': round(fat_target),
-            'diet_type': diet_type,
-            'budget_friendly': budget_friendly
-        },
-        'days': []
+    # Calculate macronutrient targets in grams based on diet type
+    protein_target, carbs_target, fat_target = (
+        float(target) for target in calculate_macro_targets_batch(daily_calories, diet_type)
+    )
+
+    # One catalog version for the whole plan, so the filtered ids keep naming the same meals
+    catalog = food_catalog.snapshot()
+
+    # Filter out foods by diet type, allergens and budget preference using the catalog indexes
+    filtered_meal_ids = {}
+    for meal_type in MEAL_TYPES:
+        filtered_meal_ids[meal_type] = catalog.filter_ids(
+            meal_type,
+            diet_type=diet_type,
+            budget_friendly=budget_friendly,
+            allergens=allergies
+        )
+
+    optimizer = None
+    if optimize:
+        candidate_ids = np.unique(np.concatenate(
+            [np.asarray(meal_ids, dtype=np.int64) for meal_ids in filtered_meal_ids.values()]
+        ))
+        optimizer = MealPlanOptimizer(
+            catalog.macros(candidate_ids),
+            filtered_meal_ids,
+            (daily_calories, protein_target, carbs_target, fat_target),
+            meal_ids=candidate_ids
+        )
+
+    # Summary of the targets the plan was built for
+    user_info = {
+        'daily_calories': round(daily_calories),
+        'protein_target': round(protein_target),
+        'carbs_target': round(carbs_target),
+        'fat_target': round(fat_target),
+        'diet_type': diet_type,
+        'budget_friendly': budget_friendly,
+        'optimized': bool(optimize)
     }
 
-    # Generate meal plan for each day
+    return user_info, iter_plan_days(catalog, filtered_meal_ids, num_days, optimizer, rng)
+
+def iter_plan_days(catalog, filtered_meal_ids, num_days, optimizer, rng):
+    """Generate the days of a diet plan one at a time, from the catalog snapshot its meal ids came from."""
     today = datetime.now()
     for day_num in range(num_days):
         day_date = today + timedelta(days=day_num)
@@ -415,17 +536,19 @@ def generate_diet_plan(user_preferences):
             'meals': {}
         }
 
-        # Note: In a more sophisticated system, we would distribute calories across meals
-        # based on the following percentages:
-        # breakfast: 25%, lunch: 35%, dinner: 30%, snacks: 10%
+        # Select meals for each meal type, either optimized against the macro targets
+        # (meal slots cover roughly 25/35/30/10% of the day) or at random
+        if optimizer:
+            selected_ids = optimizer.next_day()
+        else:
+            selected_ids = {
+                meal_type: rng.choice(meal_ids)
+                for meal_type, meal_ids in filtered_meal_ids.items() if meal_ids
+            }
 
-        # Select meals for each meal type
-        for meal_type in ['breakfast', 'lunch', 'dinner', 'snacks']:
-            if filtered_food_db.get(meal_type) and len(filtered_food_db[meal_type]) > 0:
-                # In a more sophisticated system, we would optimize meal selection
-                # based on calorie and macronutrient targets
-                selected_meal = random.choice(filtered_food_db[meal_type])
-                day_plan['meals'][meal_type] = selected_meal
+        for meal_type in MEAL_TYPES:
+            if meal_type in selected_ids:
+                day_plan['meals'][meal_type] = catalog.get_meal(selected_ids[meal_type])
 
         # Calculate daily totals
         daily_totals = {
@@ -436,9 +559,100 @@ def generate_diet_plan(user_preferences):
         }
 
         day_plan['totals'] = daily_totals
-        diet_plan['days'].append(day_plan)
+        yield day_plan
+
+def plan_cache_key(user_preferences):
+    """
+    Get a content-addressed cache key for a diet plan.
+
+    The key is a hash of the canonical preferences (including the seed), the
+    catalog version and today's date, since generated plans start today.
+    """
+    canonical = dict(user_preferences)
+    canonical['allergies'] = list(normalize_allergens(canonical.get('allergies') or []))
+    payload = json.dumps({
+        'preferences': canonical,
+        'catalog_version': food_catalog.snapshot().version,
+        'date': datetime.now().strftime('%Y-%m-%d')
+    }, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def compact_day(day, catalog=None):
+    """
+    Convert one day of a diet plan into its compact storage form.
+
+    Returns None when a meal is not in the current catalog, or in ``catalog``
+    when a snapshot is given.
+    """
+    if catalog is None:
+        catalog = food_catalog.snapshot()
+    meal_keys = []
+    for meal_type in MEAL_TYPES:
+        meal = day.get('meals', {}).get(meal_type)
+        if meal is None:
+            meal_keys.append(None)
+            continue
+        meal_id = catalog.find_meal_id(meal_type, meal)
+        if meal_id is None:
+            return None
+        meal_keys.append(catalog.get_meal_key(meal_id))
+
+    totals = day.get('totals', {})
+    return [meal_keys, [totals.get(field, 0) for field in MACRO_FIELDS]]
+
+def compact_plan(diet_plan):
+    """
+    Convert a generated diet plan into its compact storage form.
+
+    Meals are stored as catalog keys and each day as its meal keys plus
+    totals; dates are derived from the first day on expansion. Returns None
+    when a meal is not in the current catalog, in which case the plan has to
+    be stored in full.
+    """
+    catalog = food_catalog.snapshot()
+    days = diet_plan.get('days', [])
+    compact_days = []
+    for day in days:
+        compact = compact_day(day, catalog)
+        if compact is None:
+            return None
+        compact_days.append(compact)
+
+    return {
+        'format': COMPACT_PLAN_FORMAT,
+        'user_info': diet_plan.get('user_info', {}),
+        'start_date': days[0]['date'] if days else None,
+        'days': compact_days
+    }
+
+def expand_plan(compact):
+    """Rebuild the full diet plan layout from its compact storage form."""
+    catalog = food_catalog.snapshot()
+    start_date = datetime.strptime(compact['start_date'], '%Y-%m-%d') if compact.get('start_date') else None
+
+    days = []
+    for day_num, (meal_keys, totals) in enumerate(compact.get('days', [])):
+        day_date = start_date + timedelta(days=day_num)
+        meals = {}
+        for meal_type, key in zip(MEAL_TYPES, meal_keys):
+            if key is None:
+                continue
+            meal_id = catalog.meal_id_for_key(key)
+            # Meals removed from the catalog since the plan was saved keep their slot
+            meals[meal_type] = catalog.get_meal(meal_id) if meal_id is not None else {'name': key, 'unavailable': True}
+
+        days.append({
+            'date': day_date.strftime('%Y-%m-%d'),
+            'day_of_week': day_date.strftime('%A'),
+            'meals': meals,
+            'totals': dict(zip(MACRO_FIELDS, totals))
+        })
 
-    return diet_plan
+    return {'user_info': compact.get('user_info', {}), 'days': days}
+
+def is_compact_plan(plan_data):
+    """Check whether stored plan data is in the compact storage form."""
+    return isinstance(plan_data, dict) and plan_data.get('format') == COMPACT_PLAN_FORMAT
 
 def get_meal_suggestion(meal_type, diet_type=None, exclude_ingredients=None):
     """
@@ -452,37 +666,33 @@ def get_meal_suggestion(meal_type, diet_type=None, exclude_ingredients=None):
     Returns:
         dict: A meal suggestion
     """
-    # Load the food database
-    food_db = load_food_database()
-
-    if meal_type not in food_db:
+    catalog = food_catalog.snapshot()
+    if not catalog.has_meal_type(meal_type):
         return None
 
-    meals = food_db[meal_type]
-
-    # Filter by diet type if specified
-    if diet_type:
-        meals = [meal for meal in meals if diet_type in meal.get('diet_types', [])]
-
-    # Filter out meals with excluded ingredients
-    if exclude_ingredients:
-        filtered_meals = []
-        for meal in meals:
-            exclude = False
-            for ingredient in exclude_ingredients:
-                if any(ingredient.lower() in meal_ingredient.lower() for meal_ingredient in meal['ingredients']):
-                    exclude = True
-                    break
-            if not exclude:
-                filtered_meals.append(meal)
-        meals = filtered_meals
+    # Filter by diet type and excluded ingredients using the catalog indexes
+    meal_ids = catalog.filter_ids(meal_type, diet_type=diet_type, allergens=exclude_ingredients)
 
     # Return a random meal suggestion
-    if meals:
-        return random.choice(meals)
+    if meal_ids:
+        return catalog.get_meal(random.choice(meal_ids))
 
     return None
 
+def search_meals(query, meal_type=None, limit=20):
+    """
+    Search the catalog by meal name and ingredients.
+
+    Args:
+        query (str): Words that must all appear in the name or ingredients
+        meal_type (str, optional): Only search this meal type. Defaults to None.
+        limit (int, optional): Maximum number of meals returned. Defaults to 20.
+
+    Returns:
+        list: Matching meals
+    """
+    return food_catalog.search(query, meal_type=meal_type, limit=limit)
+
 # Initialize the food database if it doesn't exist
-if not os.path.exists(os.path.join(os.path.dirname(__file__), 'food_database.json')):
+if not os.path.exists(FOOD_DATABASE_PATH):
     save_food_database()
@@ -9,6 +9,9 @@ from db import db, User, HealthStat
 import datetime
 import json
 import google_fit
+import health_anomalies  # Registers anomaly detection on health-stat writes
+from health_rollups import commit_health_stats
+from health_timeseries import TIMESERIES_METRICS, DEFAULT_POINTS, MAX_POINTS, get_timeseries
 
 fitness_bp = Blueprint('fitness', __name__)
 
@@ -172,7 +175,7 @@ def add_health_stat():
             if 'notes' in data:
                 existing_stat.notes = data['notes']
 
-            db.session.commit()
+            commit_health_stats()
 
             return jsonify({
                 "message": "Health stat updated successfully",
@@ -193,7 +196,7 @@ def add_health_stat():
             )
 
             db.session.add(new_stat)
-            db.session.commit()
+            commit_health_stats()
 
             return jsonify({
                 "message": "Health stat added successfully",
@@ -204,6 +207,42 @@ def add_health_stat():
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+@fitness_bp.route('/api/fitness/timeseries', methods=['GET'])
+@jwt_required()
+def get_health_timeseries():
+    """Get one health metric over a date range, pre-aggregated to fit a point budget."""
+    try:
+        # Get the current user
+        current_user_identity = get_jwt_identity()
+        user = User.query.filter_by(email=current_user_identity['email']).first()
+
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        metric = request.args.get('metric', 'steps')
+        if metric not in TIMESERIES_METRICS:
+            return jsonify({"error": f"Invalid metric. Use one of: {', '.join(TIMESERIES_METRICS)}"}), 400
+
+        # Parse date range, defaulting to the last year
+        try:
+            end_date = request.args.get('end')
+            end_date = datetime.datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else datetime.datetime.now().date()
+            start_date = request.args.get('start')
+            start_date = datetime.datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else end_date - datetime.timedelta(days=365)
+        except ValueError:
+            return jsonify({"error": "Invalid date format. Use YYYY-MM-DD"}), 400
+
+        if start_date > end_date:
+            return jsonify({"error": "start must not be after end"}), 400
+
+        points = min(max(request.args.get('points', DEFAULT_POINTS, type=int), 1), MAX_POINTS)
+        downsample = request.args.get('downsample') == 'lttb'
+
+        return jsonify(get_timeseries(user.id, metric, start_date, end_date, points, downsample)), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @fitness_bp.route('/api/fitness/notifications/settings', methods=['GET', 'PUT'])
 @jwt_required()
 def notification_settings():
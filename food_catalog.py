@@ -0,0 +1,393 @@
+"""
+Food Catalog Module
+This module keeps the food database in memory with precomputed lookup indexes,
+so meal filtering does not have to re-read and re-scan the JSON file on every request.
+"""
+
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+MEAL_TYPES = ['breakfast', 'lunch', 'dinner', 'snacks']
+
+# Nutrition fields stored column-wise in the catalog's macro matrix
+MACRO_FIELDS = ('calories', 'protein', 'carbs', 'fat')
+
+# Common allergy keywords precomputed into a per-meal bitmask (at most 64)
+ALLERGEN_KEYWORDS = [
+    'egg', 'milk', 'yogurt', 'cheese', 'butter', 'cream', 'honey',
+    'peanut', 'almond', 'walnut', 'cashew', 'nut', 'coconut',
+    'soy', 'wheat', 'bread', 'oat', 'gluten', 'sesame', 'tahini',
+    'fish', 'salmon', 'tuna', 'cod', 'shrimp', 'shellfish',
+    'chicken', 'turkey', 'beef', 'pork', 'chickpea', 'lentil', 'quinoa'
+]
+
+# Upper bound on distinct allergy lists remembered per catalog version
+MATCH_CACHE_SIZE = 512
+
+SLUG_PATTERN = re.compile(r"[^a-z0-9]+")
+
+# Words a catalog search query is split into
+SEARCH_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def meal_key(meal_type, meal):
+    """Get the stable key a meal is referenced by in stored plans."""
+    if meal.get('id'):
+        return str(meal['id'])
+    return f"{meal_type}/{SLUG_PATTERN.sub('-', meal.get('name', '').lower()).strip('-')}"
+
+
+def normalize_allergens(allergens):
+    """Lowercase, strip and de-duplicate an allergy list into a hashable cache key."""
+    return tuple(sorted({allergen.strip().lower() for allergen in allergens if allergen and allergen.strip()}))
+
+
+class AllergenMatcher:
+    """
+    Aho-Corasick automaton over a fixed list of lowercase patterns.
+
+    ``scan`` walks the text once, whatever the number of patterns, and returns
+    a bitmask with bit ``i`` set when ``patterns[i]`` occurs anywhere in it.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self.transitions = [{}]
+        self.outputs = [0]
+        fail = [0]
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self.transitions[state].get(char)
+                if next_state is None:
+                    next_state = len(self.transitions)
+                    self.transitions[state][char] = next_state
+                    self.transitions.append({})
+                    self.outputs.append(0)
+                    fail.append(0)
+                state = next_state
+            self.outputs[state] |= 1 << index
+
+        # Breadth-first pass to link every state to its longest proper suffix state
+        queue = list(self.transitions[0].values())
+        for state in queue:
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = self.transitions[fallback].get(char, 0)
+                if fail[next_state] == next_state:
+                    fail[next_state] = 0
+                self.outputs[next_state] |= self.outputs[fail[next_state]]
+
+        self.fail = fail
+
+    def scan(self, text):
+        """Get the bitmask of patterns occurring in ``text``."""
+        transitions = self.transitions
+        fail = self.fail
+        outputs = self.outputs
+        state = 0
+        found = 0
+
+        for char in text:
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            found |= outputs[state]
+
+        return found
+
+
+# Shared automaton for the keywords baked into each meal's allergen bitmask
+KEYWORD_MATCHER = AllergenMatcher(ALLERGEN_KEYWORDS)
+KEYWORD_BITS = {keyword: 1 << index for index, keyword in enumerate(ALLERGEN_KEYWORDS)}
+
+
+class CatalogSnapshot:
+    """
+    One version of the catalog's meals and lookup indexes.
+
+    A snapshot is never changed once built. Reloading the catalog builds a new
+    snapshot and publishes it with a single assignment, so a reader holding a
+    snapshot sees meals and indexes from the same version, and meal ids taken
+    from it keep pointing at the same meals.
+    """
+
+    def __init__(self, food_db, version):
+        meals = []
+        meal_types = []
+        by_key = {}
+        meal_keys = []
+        ingredient_text = []
+        by_meal_type = {}
+        by_diet_type = {}
+        budget_friendly = set()
+        allergen_masks = []
+
+        for meal_type, type_meals in food_db.items():
+            by_meal_type.setdefault(meal_type, set())
+            for meal in type_meals:
+                meal_id = len(meals)
+                meals.append(meal)
+                meal_types.append(meal_type)
+                by_meal_type[meal_type].add(meal_id)
+
+                key = meal_key(meal_type, meal)
+                if key in by_key:
+                    key = f"{key}-{meal_id}"
+                by_key[key] = meal_id
+                meal_keys.append(key)
+
+                for diet_type in meal.get('diet_types', []):
+                    by_diet_type.setdefault(diet_type, set()).add(meal_id)
+
+                if meal.get('budget_friendly', False):
+                    budget_friendly.add(meal_id)
+
+                # Newline-joined so no pattern can match across two ingredients
+                text = '\n'.join(ingredient.lower() for ingredient in meal.get('ingredients', []))
+                ingredient_text.append(text)
+                allergen_masks.append(KEYWORD_MATCHER.scan(text))
+
+        self.version = version
+        self.meals = meals
+        self.meal_types = meal_types
+        self.by_key = by_key
+        self.meal_keys = meal_keys
+        self.ingredient_text = ingredient_text
+        self.by_meal_type = {meal_type: frozenset(ids) for meal_type, ids in by_meal_type.items()}
+        self.by_diet_type = {diet_type: frozenset(ids) for diet_type, ids in by_diet_type.items()}
+        self.budget_friendly = frozenset(budget_friendly)
+        self.allergen_masks = np.array(allergen_masks, dtype=np.uint64)
+        self.all_ids = frozenset(range(len(meals)))
+        self.macro_matrix = np.array(
+            [[meal.get(field, 0) or 0 for field in MACRO_FIELDS] for meal in meals],
+            dtype=np.float64
+        ).reshape(len(meals), len(MACRO_FIELDS))
+        self.macro_matrix.flags.writeable = False
+
+        # Allergy lists already matched against this version, most recently used last
+        self._allergen_matches = OrderedDict()
+        self._lock = threading.Lock()
+
+    def as_dict(self):
+        """Return the meals in the original ``{meal_type: [meal, ...]}`` layout."""
+        food_db = {meal_type: [] for meal_type in self.by_meal_type}
+        for meal_id, meal in enumerate(self.meals):
+            food_db[self.meal_types[meal_id]].append(meal)
+        return food_db
+
+    def meal_ids_with_allergens(self, allergens):
+        """
+        Get the ids of meals whose ingredients mention any of the given allergens.
+
+        Matching keeps the substring semantics of the original filter ("egg" also
+        matches "eggs"). Keywords from ALLERGEN_KEYWORDS are answered from the
+        precomputed per-meal bitmask; anything else is compiled into one
+        Aho-Corasick automaton that scans each meal's ingredients once. Results
+        are cached per distinct allergy list for the life of the snapshot.
+        """
+        key = normalize_allergens(allergens)
+        if not key:
+            return frozenset()
+
+        matches = self._allergen_matches
+        with self._lock:
+            if key in matches:
+                matches.move_to_end(key)
+                return matches[key]
+
+        keyword_bits = 0
+        other_patterns = []
+        for allergen in key:
+            if allergen in KEYWORD_BITS:
+                keyword_bits |= KEYWORD_BITS[allergen]
+            else:
+                other_patterns.append(allergen)
+
+        matched = set()
+        if keyword_bits:
+            matched.update(np.flatnonzero(self.allergen_masks & np.uint64(keyword_bits)).tolist())
+
+        if other_patterns:
+            matcher = AllergenMatcher(other_patterns)
+            for meal_id, text in enumerate(self.ingredient_text):
+                if meal_id not in matched and matcher.scan(text):
+                    matched.add(meal_id)
+
+        result = frozenset(matched)
+        with self._lock:
+            matches[key] = result
+            if len(matches) > MATCH_CACHE_SIZE:
+                matches.popitem(last=False)
+        return result
+
+    def filter_ids(self, meal_type=None, diet_type=None, budget_friendly=False, allergens=None):
+        """Get the sorted ids of meals matching all of the given criteria."""
+        if meal_type is not None:
+            ids = set(self.by_meal_type.get(meal_type, ()))
+        else:
+            ids = set(self.all_ids)
+
+        if diet_type:
+            ids &= self.by_diet_type.get(diet_type, frozenset())
+
+        if budget_friendly:
+            ids &= self.budget_friendly
+
+        if allergens:
+            ids -= self.meal_ids_with_allergens(allergens)
+
+        return sorted(ids)
+
+    def filter(self, meal_type=None, diet_type=None, budget_friendly=False, allergens=None):
+        """Get the meals matching all of the given criteria, in catalog order."""
+        ids = self.filter_ids(meal_type, diet_type, budget_friendly, allergens)
+        return [self.meals[meal_id] for meal_id in ids]
+
+    def get_meal(self, meal_id):
+        """Get a meal dict by id."""
+        return self.meals[meal_id]
+
+    def get_meal_key(self, meal_id):
+        """Get the stable key of a meal by id."""
+        return self.meal_keys[meal_id]
+
+    def meal_id_for_key(self, key):
+        """Get the id of the meal with a stable key, or None if there is no such meal."""
+        return self.by_key.get(key)
+
+    def macros(self, meal_ids):
+        """Get the ``(len(meal_ids), 4)`` macro matrix rows of the given meal ids."""
+        return self.macro_matrix[np.asarray(meal_ids, dtype=np.int64)]
+
+    def search(self, query, meal_type=None, limit=20):
+        """Get the meals whose name or ingredients contain every word of ``query``."""
+        words = SEARCH_WORD_PATTERN.findall(query.lower())
+        if not words:
+            return []
+
+        ids = self.by_meal_type.get(meal_type, ()) if meal_type is not None else self.all_ids
+        results = []
+        for meal_id in sorted(ids):
+            text = f"{self.meals[meal_id].get('name', '').lower()}\n{self.ingredient_text[meal_id]}"
+            if all(word in text for word in words):
+                results.append(self.meals[meal_id])
+                if len(results) >= limit:
+                    break
+        return results
+
+    def find_meal_id(self, meal_type, meal):
+        """Get the id of the catalog meal identical to ``meal``, or None if there is no such meal."""
+        meal_id = self.by_key.get(meal_key(meal_type, meal))
+        if meal_id is None or self.meals[meal_id] != meal:
+            return None
+        return meal_id
+
+    def has_meal_type(self, meal_type):
+        """Check whether the catalog knows about a meal type."""
+        return meal_type in self.by_meal_type
+
+
+class FoodCatalog:
+    """
+    In-memory food catalog backed by a JSON file.
+
+    The file is parsed once and only reloaded when its modification time changes.
+    Meals are addressed by their position in the current CatalogSnapshot and
+    indexed by meal type, diet type and budget flag, and carry a bitmask of the
+    ALLERGEN_KEYWORDS their ingredients mention, so filtering is a handful of
+    set intersections instead of nested loops over every meal. Calories and
+    macros are also kept as a ``(meals, 4)`` NumPy matrix for the plan optimizer.
+
+    Ids are only meaningful within one snapshot, so callers that look up meals
+    by id after filtering take a ``snapshot()`` once and use it throughout.
+    """
+
+    def __init__(self, path, default_data=None):
+        self.path = path
+        self.default_data = default_data or {}
+        self._mtime = None
+        self._lock = threading.Lock()
+        self._snapshot = CatalogSnapshot(self.default_data, 1)
+
+    @property
+    def version(self):
+        """Version of the current snapshot, bumped on every reload."""
+        return self._snapshot.version
+
+    def refresh(self):
+        """Reload the catalog if the backing file changed since the last load."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+
+        if mtime == self._mtime:
+            return
+
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self.path, 'r') as f:
+                food_db = json.load(f)
+            # Built aside and published in one assignment; a bad file keeps the previous snapshot
+            self._snapshot = CatalogSnapshot(food_db, self._snapshot.version + 1)
+            self._mtime = mtime
+
+    def snapshot(self):
+        """Get the current catalog version, reloading it first if the file changed."""
+        self.refresh()
+        return self._snapshot
+
+    def as_dict(self):
+        """Return the catalog in the original ``{meal_type: [meal, ...]}`` layout."""
+        return self.snapshot().as_dict()
+
+    def meal_ids_with_allergens(self, allergens):
+        """Get the ids of meals whose ingredients mention any of the given allergens."""
+        return self._snapshot.meal_ids_with_allergens(allergens)
+
+    def filter_ids(self, meal_type=None, diet_type=None, budget_friendly=False, allergens=None):
+        """Get the sorted ids of meals matching all of the given criteria."""
+        return self.snapshot().filter_ids(meal_type, diet_type, budget_friendly, allergens)
+
+    def filter(self, meal_type=None, diet_type=None, budget_friendly=False, allergens=None):
+        """Get the meals matching all of the given criteria, in catalog order."""
+        return self.snapshot().filter(meal_type, diet_type, budget_friendly, allergens)
+
+    def get_meal(self, meal_id):
+        """Get a meal dict by id."""
+        return self._snapshot.get_meal(meal_id)
+
+    def get_meal_key(self, meal_id):
+        """Get the stable key of a meal by id."""
+        return self._snapshot.get_meal_key(meal_id)
+
+    def meal_id_for_key(self, key):
+        """Get the id of the meal with a stable key, or None if there is no such meal."""
+        return self.snapshot().meal_id_for_key(key)
+
+    def macros(self, meal_ids):
+        """Get the ``(len(meal_ids), 4)`` macro matrix rows of the given meal ids."""
+        return self._snapshot.macros(meal_ids)
+
+    def search(self, query, meal_type=None, limit=20):
+        """Get the meals whose name or ingredients contain every word of ``query``."""
+        return self.snapshot().search(query, meal_type, limit)
+
+    def find_meal_id(self, meal_type, meal):
+        """Get the id of the catalog meal identical to ``meal``, or None if there is no such meal."""
+        return self.snapshot().find_meal_id(meal_type, meal)
+
+    def has_meal_type(self, meal_type):
+        """Check whether the catalog knows about a meal type."""
+        return self.snapshot().has_meal_type(meal_type)
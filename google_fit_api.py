@@ -9,6 +9,8 @@ import google.oauth2.credentials
 import google_auth_oauthlib.flow
 from db import db, User, FitnessData, HealthStat, Notification
 import google_fit
+import health_anomalies  # Registers anomaly detection on synced health data
+from health_rollups import commit_health_stats
 import datetime
 import json
 import requests
@@ -329,7 +331,7 @@ def store_health_data_to_db(user_id: int, health_data: Dict) -> bool:
         if metrics.get('weight_kg'):
             health_stat.weight_kg = metrics['weight_kg']
 
-        db.session.commit()
+        commit_health_stats()
         return True
 
     except Exception as e:
@@ -0,0 +1,105 @@
+"""
+Health AI Response Cache Module
+This module caches the health-AI route payloads per user and serves them with
+ETag and Last-Modified validators, so clients polling for unchanged data get a
+304 instead of a full recomputation.
+
+Entries are invalidated by writes: inserting, updating or deleting a user's
+FitnessData or HealthStat stamps User.health_data_updated_at, and a cached
+payload is only reused while that stamp is unchanged. The stamp lives in the
+database, so writes made by other worker processes invalidate entries too.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+
+from flask import request, jsonify
+from sqlalchemy import event
+
+from cache import LRUCache
+from db import db, User, FitnessData, HealthStat
+
+# Route payloads keyed by (route, user_id, date, hour); advice depends on the time of day
+payload_cache = LRUCache('health_ai_payloads', maxsize=int(os.getenv('HEALTH_AI_CACHE_SIZE', 4096)))
+
+
+def _stamp_health_data_changed(mapper, connection, target):
+    """Record that a user's health data changed, from inside the flush that changes it."""
+    if target.user_id is None:
+        return
+
+    users = User.__table__
+    connection.execute(
+        users.update()
+        .where(users.c.id == target.user_id)
+        .values(health_data_updated_at=datetime.datetime.now(datetime.timezone.utc))
+    )
+
+
+for model in (FitnessData, HealthStat):
+    for event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(model, event_name, _stamp_health_data_changed)
+
+
+def get_health_data_version(user_id):
+    """Get the time a user's health data last changed, or None if it never changed."""
+    return db.session.query(User.health_data_updated_at).filter(User.id == user_id).scalar()
+
+
+def payload_etag(payload):
+    """Hash a payload into a strong ETag that matches across worker processes for equal content."""
+    body = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode('utf-8')).hexdigest()
+
+
+def cached_payload_response(route, user_id, build):
+    """
+    Serve a health-AI payload from the cache, rebuilding it when the user's data changed.
+
+    The response carries ETag and Last-Modified headers and becomes a 304 when
+    the request's If-None-Match or If-Modified-Since already match it.
+
+    Args:
+        route (str): Name of the route the payload belongs to
+        user_id (int): ID of the user
+        build (callable): Called with the current datetime; returns (payload, status)
+
+    Returns:
+        Response: The JSON response
+    """
+    now = datetime.datetime.now()
+    version = get_health_data_version(user_id)
+    key = (route, user_id, now.date(), now.hour)
+
+    entry = payload_cache.get(key)
+    if entry is None or entry['version'] != version:
+        payload, status = build(now)
+        if status != 200:
+            return jsonify(payload), status
+
+        etag = payload_etag(payload)
+        last_modified = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        if entry is not None:
+            if entry['etag'] == etag:
+                last_modified = entry['last_modified']
+            elif last_modified <= entry['last_modified']:
+                # Last-Modified has one second resolution; a changed payload must still look newer
+                last_modified = entry['last_modified'] + datetime.timedelta(seconds=1)
+
+        entry = {
+            'version': version,
+            'payload': payload,
+            'etag': etag,
+            'last_modified': last_modified
+        }
+        payload_cache.set(key, entry)
+
+    response = jsonify(entry['payload'])
+    response.set_etag(entry['etag'])
+    response.last_modified = entry['last_modified']
+    # Clients may keep the payload but must revalidate it before reuse
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
@@ -3,13 +3,20 @@ AI Health Recommendation Engine for FitGent 2.0
 Provides personalized health recommendations based on smartwatch data and user patterns.
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from db import db, User, FitnessData, HealthStat, Notification
+from db import db, User, FitnessData, HealthStat, HealthStatRollup, Notification, RecommendationCache
 import datetime
+import hashlib
 import json
 from typing import Dict, List, Optional
 import statistics
+from health_rollups import ROLLUP_WINDOWS, get_rollup_trends
+from health_ai_cache import cached_payload_response
+from admin_api import admin_required
+from cache import get_cache_stats
+from instrumentation import SAMPLE_RATE, timed, get_stage_stats, render_prometheus
+from wellness_scoring import WELLNESS_GRADES, WELLNESS_MAX_SCORE, score_wellness_batch, load_wellness_cohorts
 
 health_ai_bp = Blueprint('health_ai', __name__)
 
@@ -17,9 +24,16 @@ class HealthAIEngine:
     """AI-powered health recommendation engine."""
 
     @staticmethod
-    def generate_personalized_recommendations(user_id: int, health_data: Dict) -> Dict:
+    @timed('health_ai.recommendations')
+    def generate_personalized_recommendations(user_id: int, health_data: Dict,
+                                              now: Optional[datetime.datetime] = None,
+                                              context: Optional['HealthContext'] = None) -> Dict:
         """
         Generate comprehensive personalized health recommendations.
+
+        Time-of-day advice is given for ``now``, which defaults to the current time.
+        The user and trends are taken from ``context`` when it is given instead
+        of being queried.
         """
         try:
             recommendations = {
@@ -34,29 +48,33 @@ class HealthAIEngine:
             }
 
             metrics = health_data.get('metrics', {})
-            user = User.query.get(user_id)
+            if context is not None:
+                user = context.user
+                historical_data = context.trends
+            else:
+                user = User.query.get(user_id)
 
-            # Get historical data for trend analysis
-            historical_data = HealthAIEngine._get_historical_trends(user_id)
+                # Get historical data for trend analysis
+                historical_data = HealthAIEngine._get_historical_trends(user_id)
 
             # Generate movement recommendations
             recommendations['movement'] = HealthAIEngine._generate_movement_recommendations(
-                metrics, historical_data, user
+                metrics, historical_data, user, now
             )
 
             # Generate hydration recommendations
             recommendations['hydration'] = HealthAIEngine._generate_hydration_recommendations(
-                metrics, user
+                metrics, user, now
             )
 
             # Generate nutrition recommendations
             recommendations['nutrition'] = HealthAIEngine._generate_nutrition_recommendations(
-                metrics, historical_data, user
+                metrics, historical_data, user, now
             )
 
             # Generate sleep recommendations
             recommendations['sleep'] = HealthAIEngine._generate_sleep_recommendations(
-                metrics, historical_data
+                metrics, historical_data, now
             )
 
             # Generate stress management recommendations
@@ -66,7 +84,7 @@ class HealthAIEngine:
 
             # Generate study break recommendations
             recommendations['study_breaks'] = HealthAIEngine._generate_study_break_recommendations(
-                metrics, user
+                metrics, user, now
             )
 
             # Generate achievements
@@ -86,9 +104,17 @@ class HealthAIEngine:
             return {'error': str(e)}
 
     @staticmethod
-    def _get_historical_trends(user_id: int, days: int = 7) -> Dict:
-        """Get historical health data trends."""
+    @timed('health_ai.trends')
+    def _get_historical_trends(user_id: int, days: int = 7, rollup: Optional[HealthStatRollup] = None) -> Dict:
+        """
+        Get historical health data trends, from the rollup table for the maintained windows.
+
+        A rollup already loaded for the window can be passed to skip looking it up.
+        """
         try:
+            if days in ROLLUP_WINDOWS:
+                return get_rollup_trends(user_id, days, rollup)
+
             end_date = datetime.date.today()
             start_date = end_date - datetime.timedelta(days=days-1)
 
@@ -129,13 +155,14 @@ class HealthAIEngine:
             return {}
 
     @staticmethod
-    def _generate_movement_recommendations(metrics: Dict, trends: Dict, user) -> List[Dict]:
+    @timed('health_ai.movement')
+    def _generate_movement_recommendations(metrics: Dict, trends: Dict, user, now: Optional[datetime.datetime] = None) -> List[Dict]:
         """Generate personalized movement recommendations."""
         recommendations = []
         steps = metrics.get('steps', 0)
         avg_steps = trends.get('avg_steps', 0)
 
-        current_hour = datetime.datetime.now().hour
+        current_hour = (now or datetime.datetime.now()).hour
 
         # Morning recommendations (6-12)
         if 6 <= current_hour <= 12:
@@ -187,7 +214,8 @@ class HealthAIEngine:
         return recommendations
 
     @staticmethod
-    def _generate_hydration_recommendations(metrics: Dict, user) -> List[Dict]:
+    @timed('health_ai.hydration')
+    def _generate_hydration_recommendations(metrics: Dict, user, now: Optional[datetime.datetime] = None) -> List[Dict]:
         """Generate smart hydration recommendations."""
         recommendations = []
         weight_kg = metrics.get('weight_kg', user.weight_kg if user else 70)
@@ -201,7 +229,7 @@ class HealthAIEngine:
         activity_water = (steps / 1000) * 50 + (calories_burned / 100) * 100
         total_recommended = base_water_ml + activity_water
 
-        current_hour = datetime.datetime.now().hour
+        current_hour = (now or datetime.datetime.now()).hour
 
         if 6 <= current_hour <= 10:
             recommendations.append({
@@ -235,12 +263,13 @@ class HealthAIEngine:
         return recommendations
 
     @staticmethod
-    def _generate_nutrition_recommendations(metrics: Dict, trends: Dict, user) -> List[Dict]:
+    @timed('health_ai.nutrition')
+    def _generate_nutrition_recommendations(metrics: Dict, trends: Dict, user, now: Optional[datetime.datetime] = None) -> List[Dict]:
         """Generate intelligent nutrition recommendations."""
         recommendations = []
         calories_burned = metrics.get('calories_burned', 0)
         steps = metrics.get('steps', 0)
-        current_hour = datetime.datetime.now().hour
+        current_hour = (now or datetime.datetime.now()).hour
 
         # Pre-workout nutrition (if high activity detected)
         if calories_burned > 200 and 6 <= current_hour <= 10:
@@ -289,14 +318,15 @@ class HealthAIEngine:
         return recommendations
 
     @staticmethod
-    def _generate_sleep_recommendations(metrics: Dict, trends: Dict) -> List[Dict]:
+    @timed('health_ai.sleep')
+    def _generate_sleep_recommendations(metrics: Dict, trends: Dict, now: Optional[datetime.datetime] = None) -> List[Dict]:
         """Generate personalized sleep recommendations."""
         recommendations = []
         sleep_hours = metrics.get('sleep_hours', 0)
         avg_sleep = trends.get('avg_sleep', 0)
         sleep_consistency = trends.get('sleep_consistency', 0)
 
-        current_hour = datetime.datetime.now().hour
+        current_hour = (now or datetime.datetime.now()).hour
 
         # Sleep quality analysis
         if sleep_hours > 0:
@@ -344,6 +374,7 @@ class HealthAIEngine:
         return recommendations
 
     @staticmethod
+    @timed('health_ai.stress')
     def _generate_stress_recommendations(metrics: Dict, trends: Dict) -> List[Dict]:
         """Generate stress management recommendations."""
         recommendations = []
@@ -382,10 +413,11 @@ class HealthAIEngine:
         return recommendations
 
     @staticmethod
-    def _generate_study_break_recommendations(metrics: Dict, user) -> List[Dict]:
+    @timed('health_ai.study_breaks')
+    def _generate_study_break_recommendations(metrics: Dict, user, now: Optional[datetime.datetime] = None) -> List[Dict]:
         """Generate smart study break recommendations."""
         recommendations = []
-        current_hour = datetime.datetime.now().hour
+        current_hour = (now or datetime.datetime.now()).hour
         steps = metrics.get('steps', 0)
 
         # Study hours detection (9 AM - 6 PM)
@@ -414,6 +446,7 @@ class HealthAIEngine:
         return recommendations
 
     @staticmethod
+    @timed('health_ai.achievements')
     def _generate_achievements(metrics: Dict, trends: Dict, user) -> List[Dict]:
         """Generate achievement badges and recognition."""
         achievements = []
@@ -481,103 +514,28 @@ class HealthAIEngine:
         return achievements
 
     @staticmethod
+    @timed('health_ai.wellness_score')
     def _calculate_wellness_score(metrics: Dict, trends: Dict) -> Dict:
-        """Calculate comprehensive wellness score."""
+        """Calculate comprehensive wellness score using the shared wellness threshold tables."""
         try:
-            score = 0
-            max_score = 100
-            breakdown = {}
-
-            # Steps score (25 points)
-            steps = metrics.get('steps', 0)
-            if steps >= 12000:
-                steps_score = 25
-            elif steps >= 10000:
-                steps_score = 22
-            elif steps >= 8000:
-                steps_score = 18
-            elif steps >= 5000:
-                steps_score = 12
-            else:
-                steps_score = max(0, steps / 5000 * 12)
-
-            score += steps_score
-            breakdown['steps'] = round(steps_score)
-
-            # Sleep score (25 points)
-            sleep_hours = metrics.get('sleep_hours', 0)
-            if sleep_hours > 0:
-                if 7 <= sleep_hours <= 9:
-                    sleep_score = 25
-                elif 6 <= sleep_hours < 7 or 9 < sleep_hours <= 10:
-                    sleep_score = 18
-                elif 5 <= sleep_hours < 6 or 10 < sleep_hours <= 11:
-                    sleep_score = 10
-                else:
-                    sleep_score = 5
-            else:
-                sleep_score = 0
-
-            score += sleep_score
-            breakdown['sleep'] = round(sleep_score)
-
-            # Activity score (20 points)
-            calories_burned = metrics.get('calories_burned', 0)
-            if calories_burned >= 600:
-                activity_score = 20
-            elif calories_burned >= 400:
-                activity_score = 16
-            elif calories_burned >= 250:
-                activity_score = 12
-            else:
-                activity_score = max(0, calories_burned / 250 * 12)
-
-            score += activity_score
-            breakdown['activity'] = round(activity_score)
-
-            # Consistency score (15 points)
-            consistent_days = trends.get('consistent_days', 0)
-            consistency_score = min(15, (consistent_days / 7) * 15)
-            score += consistency_score
-            breakdown['consistency'] = round(consistency_score)
-
-            # Heart health score (15 points)
-            heart_rate = metrics.get('heart_rate_avg', 0)
-            if heart_rate > 0:
-                if 60 <= heart_rate <= 80:
-                    heart_score = 15
-                elif 50 <= heart_rate < 60 or 80 < heart_rate <= 90:
-                    heart_score = 12
-                elif 90 < heart_rate <= 100:
-                    heart_score = 8
-                else:
-                    heart_score = 5
-            else:
-                heart_score = 10  # Neutral if no data
-
-            score += heart_score
-            breakdown['heart_health'] = round(heart_score)
-
-            # Determine grade and recommendations
-            percentage = (score / max_score) * 100
-
-            if percentage >= 85:
-                grade = 'Excellent'
-                grade_message = 'Outstanding wellness! You\'re crushing your health goals! 🌟'
-            elif percentage >= 70:
-                grade = 'Good'
-                grade_message = 'Great job! You\'re on the right track to optimal health! 💪'
-            elif percentage >= 55:
-                grade = 'Fair'
-                grade_message = 'Good progress! A few improvements can boost your wellness significantly! 📈'
-            else:
-                grade = 'Needs Improvement'
-                grade_message = 'Let\'s work together to improve your health! Small steps lead to big changes! 🎯'
+            result = score_wellness_batch(
+                [metrics.get('steps', 0)],
+                [metrics.get('sleep_hours', 0)],
+                [metrics.get('calories_burned', 0)],
+                [trends.get('consistent_days', 0)],
+                [metrics.get('heart_rate_avg', 0)]
+            )
+
+            breakdown = {
+                component: round(float(result[component][0]))
+                for component in ('steps', 'sleep', 'activity', 'consistency', 'heart_health')
+            }
+            _, grade, grade_message = WELLNESS_GRADES[int(result['grade'][0])]
 
             return {
-                'score': round(score),
-                'max_score': max_score,
-                'percentage': round(percentage),
+                'score': round(float(result['score'][0])),
+                'max_score': WELLNESS_MAX_SCORE,
+                'percentage': round(float(result['percentage'][0])),
                 'grade': grade,
                 'grade_message': grade_message,
                 'breakdown': breakdown,
@@ -607,11 +565,195 @@ class HealthAIEngine:
         return improvement_areas
 
 
+def build_health_data(fitness_data) -> Dict:
+    """Build the health data recommendations are generated from out of a FitnessData row."""
+    return {
+        'metrics': {
+            'steps': fitness_data.steps or 0,
+            'calories_burned': fitness_data.calories_burned or 0,
+            'heart_rate_avg': fitness_data.heart_rate or 0,
+            'sleep_hours': fitness_data.sleep_hours or 0,
+            'weight_kg': fitness_data.weight_kg or 0,
+            'distance_km': fitness_data.distance_km or 0,
+            'active_minutes': fitness_data.active_minutes or 0,
+            'bmi': fitness_data.bmi or 0
+        }
+    }
+
+
+# User profile fields the recommendation generators read
+RECOMMENDATION_PROFILE_FIELDS = ('age', 'gender', 'height_cm', 'weight_kg', 'activity_level', 'diet_goal', 'diet_type')
+
+
+def recommendation_fingerprint(health_data: Dict, trends: Dict, user) -> str:
+    """Hash the inputs of a recommendation run, so cached results are reused only while they are unchanged."""
+    profile = {field: getattr(user, field, None) for field in RECOMMENDATION_PROFILE_FIELDS}
+    payload = json.dumps({'health_data': health_data, 'trends': trends, 'profile': profile},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class HealthContext:
+    """The data a health-AI request reads, loaded together by load_health_context."""
+
+    def __init__(self, user_id: int, now: datetime.datetime, user, fitness_data, rollup, cached,
+                 trends: Optional[Dict] = None):
+        self.user_id = user_id
+        self.now = now
+        self.user = user
+        self.fitness_data = fitness_data
+        self.rollup = rollup
+        self.cached = cached
+        self._trends = trends
+
+    @property
+    def trends(self) -> Dict:
+        """The 7-day trends, from the preloaded rollup."""
+        if self._trends is None:
+            self._trends = HealthAIEngine._get_historical_trends(self.user_id, 7, self.rollup)
+        return self._trends
+
+
+@timed('health_ai.load_context')
+def load_health_context(user_id: int, now: datetime.datetime) -> Optional[HealthContext]:
+    """
+    Load a user, their FitnessData for the day of ``now``, their 7-day rollup
+    and their cached recommendations for the hour in a single joined query.
+
+    Returns:
+        HealthContext: The loaded data, or None if the user doesn't exist
+    """
+    today = now.date()
+    row = db.session.query(User, FitnessData, HealthStatRollup, RecommendationCache).outerjoin(
+        FitnessData, (FitnessData.user_id == User.id) & (FitnessData.date == today)
+    ).outerjoin(
+        HealthStatRollup, (HealthStatRollup.user_id == User.id) & (HealthStatRollup.window_days == 7)
+    ).outerjoin(
+        RecommendationCache,
+        (RecommendationCache.user_id == User.id) &
+        (RecommendationCache.for_date == today) &
+        (RecommendationCache.hour == now.hour)
+    ).filter(
+        User.id == user_id
+    ).order_by(FitnessData.id).first()  # The first FitnessData row of the day, like filter_by().first()
+
+    if row is None:
+        return None
+
+    user, fitness_data, rollup, cached = row
+    return HealthContext(user_id, now, user, fitness_data, rollup, cached)
+
+
+def store_cached_recommendations(user_id: int, for_date: datetime.date, hour: int, fingerprint: str,
+                                 recommendations: Dict, health_data: Dict,
+                                 entry: Optional[RecommendationCache] = None) -> None:
+    """Save recommendations to the cache table, replacing the entry for the same user, date and hour."""
+    try:
+        if entry is None:
+            entry = RecommendationCache(user_id=user_id, for_date=for_date, hour=hour)
+            db.session.add(entry)
+
+        entry.fingerprint = fingerprint
+        entry.recommendations = json.dumps(recommendations)
+        entry.health_data = json.dumps(health_data)
+        entry.computed_at = datetime.datetime.now(datetime.timezone.utc)
+        db.session.commit()
+
+    except Exception as e:
+        # A concurrent request may have cached the same entry; the response doesn't depend on it
+        db.session.rollback()
+        print(f"Error caching recommendations: {str(e)}")
+
+
+@timed('health_ai.recommendations_payload')
+def build_recommendations_payload(user_id: int, now: datetime.datetime):
+    """Build the /recommendations payload for a user at a given time."""
+    # Get latest health data
+    today = now.date()
+    context = load_health_context(user_id, now)
+
+    if not context or not context.fitness_data:
+        return {
+            "msg": "No health data available for today",
+            "recommendations": {
+                'message': 'Connect your smartwatch to get personalized recommendations!'
+            }
+        }, 200
+
+    # Prepare health data
+    health_data = build_health_data(context.fitness_data)
+    fingerprint = recommendation_fingerprint(health_data, context.trends, context.user)
+
+    # Serve the precomputed recommendations unless new data arrived since they were computed
+    cached = context.cached
+    if cached and cached.fingerprint == fingerprint:
+        return {
+            "success": True,
+            "timestamp": cached.computed_at.isoformat(),
+            "recommendations": cached.get_recommendations(),
+            "health_data": health_data,
+            "cached": True
+        }, 200
+
+    # Generate AI recommendations
+    recommendations = HealthAIEngine.generate_personalized_recommendations(user_id, health_data, now, context)
+    if 'error' not in recommendations:
+        store_cached_recommendations(user_id, today, now.hour, fingerprint, recommendations, health_data, cached)
+
+    return {
+        "success": True,
+        "timestamp": now.isoformat(),
+        "recommendations": recommendations,
+        "health_data": health_data,
+        "cached": False
+    }, 200
+
+
+@timed('health_ai.wellness_payload')
+def build_wellness_payload(user_id: int, now: datetime.datetime):
+    """Build the /wellness-score payload for a user at a given time."""
+    # Get current health data
+    today = now.date()
+    context = load_health_context(user_id, now)
+
+    if not context or not context.fitness_data:
+        return {
+            "msg": "No health data available",
+            "wellness_score": {"score": 0, "grade": "No Data"}
+        }, 200
+
+    # Prepare metrics
+    fitness_data = context.fitness_data
+    metrics = {
+        'steps': fitness_data.steps or 0,
+        'calories_burned': fitness_data.calories_burned or 0,
+        'heart_rate_avg': fitness_data.heart_rate or 0,
+        'sleep_hours': fitness_data.sleep_hours or 0
+    }
+
+    # Get trends
+    trends = context.trends
+
+    # Calculate wellness score
+    wellness_score = HealthAIEngine._calculate_wellness_score(metrics, trends)
+
+    # Rank the score against other users of the same age
+    cohort = load_wellness_cohorts(today).rank(wellness_score.get('score', 0), context.user.age)
+
+    return {
+        "success": True,
+        "wellness_score": wellness_score,
+        "cohort": cohort,
+        "metrics": metrics,
+        "trends": trends
+    }, 200
+
+
 # API Routes for Health AI Engine
 @health_ai_bp.route('/recommendations')
 @jwt_required()
 def get_ai_recommendations():
-    """Get AI-powered health recommendations."""
+    """Get AI-powered health recommendations, answering 304 when the client's copy is current."""
     try:
         current_user = get_jwt_identity()
         user_id = current_user.get('user_id')
@@ -619,41 +761,10 @@ def get_ai_recommendations():
         if not user_id:
             return jsonify({"msg": "User ID not found in token"}), 400
 
-        # Get latest health data
-        today = datetime.date.today()
-        fitness_data = FitnessData.query.filter_by(user_id=user_id, date=today).first()
-
-        if not fitness_data:
-            return jsonify({
-                "msg": "No health data available for today",
-                "recommendations": {
-                    'message': 'Connect your smartwatch to get personalized recommendations!'
-                }
-            }), 200
-
-        # Prepare health data
-        health_data = {
-            'metrics': {
-                'steps': fitness_data.steps or 0,
-                'calories_burned': fitness_data.calories_burned or 0,
-                'heart_rate_avg': fitness_data.heart_rate or 0,
-                'sleep_hours': fitness_data.sleep_hours or 0,
-                'weight_kg': fitness_data.weight_kg or 0,
-                'distance_km': fitness_data.distance_km or 0,
-                'active_minutes': fitness_data.active_minutes or 0,
-                'bmi': fitness_data.bmi or 0
-            }
-        }
-
-        # Generate AI recommendations
-        recommendations = HealthAIEngine.generate_personalized_recommendations(user_id, health_data)
-
-        return jsonify({
-            "success": True,
-            "timestamp": datetime.datetime.now().isoformat(),
-            "recommendations": recommendations,
-            "health_data": health_data
-        }), 200
+        return cached_payload_response(
+            'recommendations', user_id,
+            lambda now: build_recommendations_payload(user_id, now)
+        )
 
     except Exception as e:
         print(f"Error getting AI recommendations: {str(e)}")
@@ -663,7 +774,7 @@ def get_ai_recommendations():
 @health_ai_bp.route('/wellness-score')
 @jwt_required()
 def get_wellness_score():
-    """Get current wellness score and analysis."""
+    """Get current wellness score and analysis, answering 304 when the client's copy is current."""
     try:
         current_user = get_jwt_identity()
         user_id = current_user.get('user_id')
@@ -671,37 +782,37 @@ def get_wellness_score():
         if not user_id:
             return jsonify({"msg": "User ID not found in token"}), 400
 
-        # Get current health data
-        today = datetime.date.today()
-        fitness_data = FitnessData.query.filter_by(user_id=user_id, date=today).first()
-
-        if not fitness_data:
-            return jsonify({
-                "msg": "No health data available",
-                "wellness_score": {"score": 0, "grade": "No Data"}
-            }), 200
+        return cached_payload_response(
+            'wellness-score', user_id,
+            lambda now: build_wellness_payload(user_id, now)
+        )
 
-        # Prepare metrics
-        metrics = {
-            'steps': fitness_data.steps or 0,
-            'calories_burned': fitness_data.calories_burned or 0,
-            'heart_rate_avg': fitness_data.heart_rate or 0,
-            'sleep_hours': fitness_data.sleep_hours or 0
-        }
-
-        # Get trends
-        trends = HealthAIEngine._get_historical_trends(user_id)
+    except Exception as e:
+        print(f"Error getting wellness score: {str(e)}")
+        return jsonify({"msg": f"An error occurred: {str(e)}"}), 500
 
-        # Calculate wellness score
-        wellness_score = HealthAIEngine._calculate_wellness_score(metrics, trends)
 
+@health_ai_bp.route('/admin/timings')
+@admin_required
+def get_engine_timings():
+    """Get per-stage wall time and query count summaries of the engine, and cache hit rates."""
+    try:
         return jsonify({
-            "success": True,
-            "wellness_score": wellness_score,
-            "metrics": metrics,
-            "trends": trends
+            "sample_rate": SAMPLE_RATE,
+            "stages": get_stage_stats(),
+            "caches": get_cache_stats()
         }), 200
 
     except Exception as e:
-        print(f"Error getting wellness score: {str(e)}")
-        return jsonify({"msg": f"An error occurred: {str(e)}"}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+
+@health_ai_bp.route('/admin/metrics')
+@admin_required
+def get_engine_metrics():
+    """Export the stage histograms in the Prometheus text format."""
+    try:
+        return Response(render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,180 @@
+"""
+Health Anomaly Detection Module
+This module watches incoming health metrics for abnormal values (an elevated
+heart rate, a sudden weight jump, a collapse in sleep) and creates a
+Notification when one arrives.
+
+Each user and metric has a HealthMetricBaseline holding an exponentially
+weighted mean and variance of past days. A new value is scored against it and
+folded in with O(1) work, so detection never reads a user's history. Values
+are written through the ORM by store_health_data_to_db and the health-stat
+route, and are picked up from the session before they are flushed.
+
+Baselines are per day: repeated syncs of the same day replace that day's value
+instead of counting it again, and values for days before the latest one are
+ignored.
+"""
+
+import datetime
+import math
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from db import HealthStat, FitnessData, HealthMetricBaseline, Notification
+
+# Metric -> source column, EWMA smoothing factor, z-score threshold, minimum
+# absolute deviation, standard deviation floor and which direction alerts
+ANOMALY_METRICS = {
+    'heart_rate': {
+        'model': FitnessData, 'column': 'heart_rate',
+        'alpha': 0.1, 'threshold': 3.0, 'min_change': 10, 'min_std': 2.0, 'direction': 'high'
+    },
+    'weight': {
+        'model': HealthStat, 'column': 'weight_kg',
+        'alpha': 0.2, 'threshold': 3.0, 'min_change': 2.0, 'min_std': 0.3, 'direction': 'both'
+    },
+    'sleep': {
+        'model': HealthStat, 'column': 'sleep_hours',
+        'alpha': 0.15, 'threshold': 2.5, 'min_change': 2.0, 'min_std': 0.5, 'direction': 'low'
+    }
+}
+
+# Days folded into a baseline before it is trusted to flag anomalies
+ANOMALY_WARMUP_DAYS = 7
+
+NOTIFICATION_TYPE = 'health_alert'
+
+
+def _ewm_update(baseline, value, alpha):
+    """Fold a day's value into a baseline's exponentially weighted mean and variance."""
+    if baseline.days == 0:
+        baseline.mean, baseline.variance = value, 0.0
+    else:
+        delta = value - baseline.mean
+        increment = alpha * delta
+        baseline.mean += increment
+        baseline.variance = (1 - alpha) * (baseline.variance + delta * increment)
+    baseline.days += 1
+
+
+def score_value(baseline, value, config):
+    """
+    Score a value against a baseline.
+
+    Returns:
+        float: The z-score if the value is anomalous, otherwise None
+    """
+    if baseline.days < ANOMALY_WARMUP_DAYS:
+        return None
+
+    deviation = value - baseline.mean
+    if abs(deviation) < config['min_change']:
+        return None
+    if config['direction'] == 'high' and deviation < 0:
+        return None
+    if config['direction'] == 'low' and deviation > 0:
+        return None
+
+    z_score = deviation / max(math.sqrt(baseline.variance), config['min_std'])
+    return z_score if abs(z_score) >= config['threshold'] else None
+
+
+def observe(baseline, day, value, config):
+    """
+    Record a day's value in a baseline.
+
+    Returns:
+        float: The z-score if the value is anomalous, otherwise None
+    """
+    if baseline.current_date is not None:
+        if day < baseline.current_date:
+            return None
+        if day > baseline.current_date and baseline.current_value is not None:
+            _ewm_update(baseline, baseline.current_value, config['alpha'])
+
+    baseline.current_date = day
+    baseline.current_value = value
+    return score_value(baseline, value, config)
+
+
+def _anomaly_message(metric, value, baseline):
+    """Get the title and message of an anomaly notification."""
+    if metric == 'heart_rate':
+        return ('Unusual heart rate',
+                f"Your average heart rate today is {value:.0f} bpm, well above your usual {baseline.mean:.0f} bpm. "
+                "Take it easy and consider checking in with a doctor if it persists.")
+    if metric == 'weight':
+        change = value - baseline.mean
+        return ('Sudden weight change',
+                f"Your weight of {value:.1f} kg is {change:+.1f} kg from your recent average of {baseline.mean:.1f} kg. "
+                "Double-check the reading, and keep an eye on it over the next few days.")
+    return ('Sleep drop',
+            f"You slept {value:.1f} hours, far below your usual {baseline.mean:.1f} hours. "
+            "Try to rest early tonight.")
+
+
+def _pending_observations(session):
+    """Collect (user_id, date, metric, value) for metric values about to be written."""
+    observations = []
+    with session.no_autoflush:
+        for obj in list(session.new) + list(session.dirty):
+            for metric, config in ANOMALY_METRICS.items():
+                if not isinstance(obj, config['model']) or obj.user_id is None:
+                    continue
+                if not inspect(obj).attrs[config['column']].history.has_changes():
+                    continue
+
+                value = getattr(obj, config['column'])
+                # Zero is how integrations report a metric they have no reading for
+                if value is None or value <= 0:
+                    continue
+
+                # Rows default to today when they are inserted
+                day = obj.date or datetime.datetime.now(datetime.timezone.utc).date()
+                observations.append((obj.user_id, day, metric, float(value)))
+    return observations
+
+
+@event.listens_for(Session, 'before_flush')
+def _detect_anomalies(session, flush_context, instances):
+    """Score pending health metric values against their baselines and notify on anomalies."""
+    observations = _pending_observations(session)
+    if not observations:
+        return
+
+    user_ids = {user_id for user_id, _, _, _ in observations}
+    with session.no_autoflush:
+        baselines = {
+            (baseline.user_id, baseline.metric): baseline
+            for baseline in session.query(HealthMetricBaseline).filter(HealthMetricBaseline.user_id.in_(user_ids))
+        }
+
+    for user_id, day, metric, value in sorted(observations, key=lambda observation: observation[1]):
+        baseline = baselines.get((user_id, metric))
+        if baseline is None:
+            baseline = HealthMetricBaseline(user_id=user_id, metric=metric, days=0, mean=0.0, variance=0.0)
+            session.add(baseline)
+            baselines[(user_id, metric)] = baseline
+
+        z_score = observe(baseline, day, value, ANOMALY_METRICS[metric])
+        if z_score is None or baseline.alerted_date == day:
+            continue
+
+        baseline.alerted_date = day
+        title, message = _anomaly_message(metric, value, baseline)
+        notification = Notification(
+            user_id=user_id,
+            notification_type=NOTIFICATION_TYPE,
+            title=title,
+            message=message,
+            scheduled_for=datetime.datetime.now()
+        )
+        notification.set_data({
+            'metric': metric,
+            'date': day.isoformat(),
+            'value': value,
+            'baseline_mean': round(baseline.mean, 2),
+            'z_score': round(z_score, 2)
+        })
+        session.add(notification)
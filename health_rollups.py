@@ -0,0 +1,468 @@
+"""
+Health Rollups Module
+This module keeps per-user rolling aggregates of HealthStat rows over trailing
+7, 30 and 90 day windows, so trend lookups read a single HealthStatRollup row
+instead of recomputing statistics over the window on every request.
+
+Rollups are updated incrementally, with Welford running means and variances,
+whenever a HealthStat is inserted, updated or deleted through the ORM, and
+their windows are advanced then and by rebuilds. Reading trends never writes.
+
+Each update is a read-modify-write of the rollup row, guarded by its version
+column: when two sessions update the same rollup concurrently, the later flush
+fails with StaleDataError rather than overwriting the other's changes. Writers
+commit HealthStat changes with commit_health_stats, which rolls such a
+conflict on derived rows (rollups, time-series buckets, anomaly baselines)
+back and retries, so the health stat itself is never rejected.
+
+Usage: python health_rollups.py [user_id ...]   (rebuild rollups from history)
+"""
+
+import datetime
+import math
+import re
+import sys
+
+from sqlalchemy import event, inspect, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+from db import db, app, User, HealthStat, HealthStatRollup, HealthStatBucket, HealthMetricBaseline
+
+# Trailing windows, in days, a rollup is maintained for
+ROLLUP_WINDOWS = (7, 30, 90)
+
+# Rollup metric -> HealthStat column
+ROLLUP_METRICS = {
+    'steps': 'steps',
+    'sleep': 'sleep_hours',
+    'calories': 'calories_burned'
+}
+
+# Number of users rebuilt per commit by rebuild_rollups
+REBUILD_BATCH_SIZE = 100
+
+# Tables maintained by before_flush listeners from HealthStat writes
+DERIVED_TABLES = tuple(model.__table__.name for model in (HealthStatRollup, HealthStatBucket, HealthMetricBaseline))
+
+# Commits tried by commit_health_stats while derived rows conflict with a concurrent writer
+DERIVED_COMMIT_ATTEMPTS = 3
+
+
+def _stat_values(row):
+    """Get the metric values of a HealthStat row, with missing and zero values as None like the trend queries."""
+    return {metric: getattr(row, column) or None for metric, column in ROLLUP_METRICS.items()}
+
+
+def _threshold_counts(values):
+    """Get the threshold day counts a single day contributes."""
+    steps = values.get('steps')
+    sleep = values.get('sleep')
+    calories = values.get('calories')
+    return {
+        'consistent_days': int(bool(steps) and steps >= 8000),
+        'good_sleep_days': int(bool(sleep) and 7 <= sleep <= 9),
+        'active_days': int(bool(calories) and calories >= 300)
+    }
+
+
+def _welford_add(rollup, metric, value):
+    """Add a value to a metric's running count, mean and sum of squared deviations."""
+    count = getattr(rollup, f'{metric}_count') + 1
+    mean = getattr(rollup, f'{metric}_mean')
+    delta = value - mean
+    mean += delta / count
+    setattr(rollup, f'{metric}_count', count)
+    setattr(rollup, f'{metric}_mean', mean)
+    setattr(rollup, f'{metric}_m2', getattr(rollup, f'{metric}_m2') + delta * (value - mean))
+
+
+def _welford_remove(rollup, metric, value):
+    """Remove a previously added value from a metric's running statistics."""
+    count = getattr(rollup, f'{metric}_count') - 1
+    if count <= 0:
+        setattr(rollup, f'{metric}_count', 0)
+        setattr(rollup, f'{metric}_mean', 0.0)
+        setattr(rollup, f'{metric}_m2', 0.0)
+        return
+
+    mean = getattr(rollup, f'{metric}_mean')
+    new_mean = (mean * (count + 1) - value) / count
+    m2 = getattr(rollup, f'{metric}_m2') - (value - mean) * (value - new_mean)
+    setattr(rollup, f'{metric}_count', count)
+    setattr(rollup, f'{metric}_mean', new_mean)
+    setattr(rollup, f'{metric}_m2', max(m2, 0.0))
+
+
+def _reset(rollup, end_date):
+    """Empty a rollup and anchor its window to end on ``end_date``."""
+    rollup.start_date = end_date - datetime.timedelta(days=rollup.window_days - 1)
+    rollup.end_date = end_date
+    for metric in ROLLUP_METRICS:
+        setattr(rollup, f'{metric}_count', 0)
+        setattr(rollup, f'{metric}_mean', 0.0)
+        setattr(rollup, f'{metric}_m2', 0.0)
+    rollup.consistent_days = 0
+    rollup.good_sleep_days = 0
+    rollup.active_days = 0
+    rollup.steps_max = None
+    rollup.steps_first = rollup.steps_first_date = None
+    rollup.steps_last = rollup.steps_last_date = None
+    rollup.extremes_stale = False
+
+
+def _apply_change(rollup, day, old_values, new_values):
+    """
+    Apply one day's change to a rollup whose window contains that day.
+
+    ``old_values`` is None for a new row and ``new_values`` is None for a
+    deleted one. The best, first and last step days are kept up to date
+    when possible and flagged stale when a removal invalidates them.
+    """
+    old_values = old_values or {}
+    new_values = new_values or {}
+
+    for metric in ROLLUP_METRICS:
+        old = old_values.get(metric)
+        new = new_values.get(metric)
+        if old is not None:
+            _welford_remove(rollup, metric, old)
+        if new is not None:
+            _welford_add(rollup, metric, new)
+
+    old_counts = _threshold_counts(old_values)
+    for name, count in _threshold_counts(new_values).items():
+        setattr(rollup, name, getattr(rollup, name) + count - old_counts[name])
+
+    old_steps = old_values.get('steps')
+    new_steps = new_values.get('steps')
+    if old_steps is not None:
+        if new_steps is None and day in (rollup.steps_first_date, rollup.steps_last_date):
+            rollup.extremes_stale = True
+        if old_steps == rollup.steps_max and (new_steps is None or new_steps < old_steps):
+            rollup.extremes_stale = True
+
+    if new_steps is not None:
+        if rollup.steps_max is None or new_steps > rollup.steps_max:
+            rollup.steps_max = new_steps
+        if rollup.steps_first_date is None or day <= rollup.steps_first_date:
+            rollup.steps_first, rollup.steps_first_date = new_steps, day
+        if rollup.steps_last_date is None or day >= rollup.steps_last_date:
+            rollup.steps_last, rollup.steps_last_date = new_steps, day
+
+
+def _window_rows(session, user_id, *date_ranges):
+    """Read the committed HealthStat values of a user within the given inclusive date ranges, in date order."""
+    columns = [HealthStat.date] + [getattr(HealthStat, column) for column in ROLLUP_METRICS.values()]
+    conditions = [HealthStat.date.between(start, end) for start, end in date_ranges]
+
+    # Column queries read the database rather than the identity map, so pending edits aren't double counted
+    with session.no_autoflush:
+        return session.query(*columns).filter(
+            HealthStat.user_id == user_id,
+            or_(*conditions)
+        ).order_by(HealthStat.date).all()
+
+
+def _refresh_extremes(rollup, session):
+    """Recompute the best, first and last step days of a rollup from history."""
+    steps = [
+        (row.date, row.steps)
+        for row in _window_rows(session, rollup.user_id, (rollup.start_date, rollup.end_date))
+        if row.steps
+    ]
+    rollup.steps_max = max(value for _, value in steps) if steps else None
+    rollup.steps_first_date, rollup.steps_first = steps[0] if steps else (None, None)
+    rollup.steps_last_date, rollup.steps_last = steps[-1] if steps else (None, None)
+    rollup.extremes_stale = False
+
+
+def _advance(rollup, session, end_date):
+    """
+    Slide a rollup's window forward to end on ``end_date``.
+
+    Only the days leaving and entering the window are read; a gap longer
+    than the window rebuilds it from scratch.
+    """
+    if rollup.end_date is not None and end_date <= rollup.end_date:
+        return
+
+    old_start, old_end = rollup.start_date, rollup.end_date
+    new_start = end_date - datetime.timedelta(days=rollup.window_days - 1)
+
+    if old_end is None or new_start > old_end:
+        _reset(rollup, end_date)
+        for row in _window_rows(session, rollup.user_id, (new_start, end_date)):
+            _apply_change(rollup, row.date, None, _stat_values(row))
+        return
+
+    rows = _window_rows(
+        session, rollup.user_id,
+        (old_start, new_start - datetime.timedelta(days=1)),
+        (old_end + datetime.timedelta(days=1), end_date)
+    )
+    rollup.start_date, rollup.end_date = new_start, end_date
+    for row in rows:
+        if row.date < new_start:
+            _apply_change(rollup, row.date, _stat_values(row), None)
+        else:
+            _apply_change(rollup, row.date, None, _stat_values(row))
+
+
+def _unsaved_copy(rollup):
+    """Copy a rollup's columns into a new object that is never added to a session."""
+    return HealthStatRollup(**{key: getattr(rollup, key) for key in inspect(rollup).mapper.column_attrs.keys()})
+
+
+def _get_rollups(session, user_id, end_date, rollups=None):
+    """Get a user's rollups for every window, creating and advancing them to ``end_date`` as needed."""
+    rollups = rollups if rollups is not None else {}
+    missing = [window for window in ROLLUP_WINDOWS if (user_id, window) not in rollups]
+    if missing:
+        with session.no_autoflush:
+            existing = session.query(HealthStatRollup).filter(
+                HealthStatRollup.user_id == user_id,
+                HealthStatRollup.window_days.in_(missing)
+            ).all()
+        for rollup in existing:
+            rollups[(user_id, rollup.window_days)] = rollup
+
+        for window in missing:
+            if (user_id, window) not in rollups:
+                rollup = HealthStatRollup(user_id=user_id, window_days=window)
+                _reset(rollup, end_date)
+                rollup.end_date = None
+                session.add(rollup)
+                rollups[(user_id, window)] = rollup
+
+    for window in ROLLUP_WINDOWS:
+        _advance(rollups[(user_id, window)], session, end_date)
+    return rollups
+
+
+def _committed_value(state, key):
+    """Get the value an attribute had in the database before pending changes."""
+    history = state.attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.obj(), key)
+
+
+class _CommittedStat:
+    """The committed column values of a modified HealthStat."""
+
+    def __init__(self, stat):
+        state = inspect(stat)
+        for key in state.mapper.column_attrs.keys():
+            setattr(self, key, _committed_value(state, key))
+
+
+def pending_health_stat_changes(session):
+    """
+    Collect the HealthStat changes a flush is about to write, one entry per user and day.
+
+    An update that moves a row to another user or date is split into a removal
+    and an insertion.
+
+    Returns:
+        list: (user_id, date, old, new) tuples; old holds the committed column
+        values or is None for an insert, new is the pending HealthStat or None
+        for a delete
+    """
+    changes = []
+    with session.no_autoflush:
+        for stat in session.new:
+            if isinstance(stat, HealthStat):
+                changes.append((None, stat))
+        for stat in session.dirty:
+            if isinstance(stat, HealthStat) and session.is_modified(stat):
+                changes.append((_CommittedStat(stat), stat))
+        for stat in session.deleted:
+            if isinstance(stat, HealthStat):
+                changes.append((_CommittedStat(stat), None))
+
+    entries = []
+    for old, new in changes:
+        # HealthStat.date defaults to today when the row is inserted
+        new_date = (new.date or datetime.datetime.now(datetime.timezone.utc).date()) if new is not None else None
+
+        if old is not None and new is not None and (old.user_id, old.date) == (new.user_id, new_date):
+            entries.append((old.user_id, old.date, old, new))
+            continue
+        if old is not None:
+            entries.append((old.user_id, old.date, old, None))
+        if new is not None:
+            entries.append((new.user_id, new_date, None, new))
+
+    return [entry for entry in entries if entry[0] is not None and entry[1] is not None]
+
+
+@event.listens_for(Session, 'before_flush')
+def _update_rollups(session, flush_context, instances):
+    """Fold pending HealthStat inserts, updates and deletes into the owners' rollups."""
+    changes = pending_health_stat_changes(session)
+    if not changes:
+        return
+
+    today = datetime.date.today()
+    rollups = {}
+    for user_id, day, old, new in changes:
+        old_values = _stat_values(old) if old is not None else None
+        new_values = _stat_values(new) if new is not None else None
+
+        _get_rollups(session, user_id, today, rollups)
+        for window in ROLLUP_WINDOWS:
+            rollup = rollups[(user_id, window)]
+            # Days after the window are picked up when it advances to them
+            if rollup.start_date <= day <= rollup.end_date:
+                _apply_change(rollup, day, old_values, new_values)
+
+
+def _is_derived_conflict(error):
+    """Check whether a failed commit only conflicted on a derived table."""
+    message = (error.statement or '') if isinstance(error, IntegrityError) else str(error)
+    return not set(DERIVED_TABLES).isdisjoint(re.findall(r'\w+', message))
+
+
+def commit_health_stats(session=None):
+    """
+    Commit a session holding HealthStat writes, retrying derived-row conflicts.
+
+    The rollup, bucket and anomaly baseline listeners run inside the flush, so
+    a concurrent writer updating a derived row (StaleDataError) or creating it
+    first (IntegrityError) fails the whole commit. The pending changes are then
+    staged again on a fresh transaction, where the listeners re-read the rows
+    the other writer committed. Any other error is raised unchanged.
+
+    Args:
+        session (Session, optional): The session to commit. Defaults to db.session.
+    """
+    session = session or db.session
+    for attempt in range(DERIVED_COMMIT_ATTEMPTS):
+        new = []
+        for obj in session.new:
+            mapper = inspect(obj).mapper
+            keys = [mapper.get_property_by_column(column).key for column in mapper.primary_key]
+            new.append((obj, {key: getattr(obj, key) for key in keys}))
+        dirty = []
+        for obj in session.dirty:
+            state = inspect(obj)
+            changed = {key: getattr(obj, key) for key in state.mapper.column_attrs.keys() if state.attrs[key].history.has_changes()}
+            if changed:
+                dirty.append((obj, changed))
+        deleted = list(session.deleted)
+
+        try:
+            session.commit()
+            return
+        except (StaleDataError, IntegrityError) as e:
+            session.rollback()
+            if attempt == DERIVED_COMMIT_ATTEMPTS - 1 or not _is_derived_conflict(e):
+                raise
+            print(f"Retrying health stat commit after a conflict on derived data: {str(e).splitlines()[0]}")
+
+        for obj, keys in new:
+            # Keys assigned by the rolled back INSERT are cleared with it
+            for key, value in keys.items():
+                setattr(obj, key, value)
+            session.add(obj)
+        for obj, changed in dirty:
+            # Reload the committed values so the listeners see the change again
+            session.refresh(obj)
+            for key, value in changed.items():
+                setattr(obj, key, value)
+        for obj in deleted:
+            session.delete(obj)
+
+
+def get_rollup_trends(user_id, days=7, rollup=None):
+    """
+    Get the historical trends of a user from their rollup for a window.
+
+    Returns the same keys as HealthAIEngine._get_historical_trends. A rollup
+    whose window ends before today is advanced on an unsaved copy, which only
+    reads the days entering and leaving the window; nothing is written.
+
+    Args:
+        user_id (int): ID of the user
+        days (int): Window length, one of ROLLUP_WINDOWS
+        rollup (HealthStatRollup, optional): The user's rollup for the window, if already loaded
+
+    Returns:
+        dict: Trend values, empty when there is no data in the window
+    """
+    session = db.session
+    today = datetime.date.today()
+    if rollup is None:
+        with session.no_autoflush:
+            rollup = session.query(HealthStatRollup).filter(
+                HealthStatRollup.user_id == user_id,
+                HealthStatRollup.window_days == days
+            ).first()
+
+    if rollup is None:
+        # Built from history when advanced from an empty window
+        rollup = HealthStatRollup(user_id=user_id, window_days=days)
+    elif rollup.end_date < today or rollup.extremes_stale:
+        rollup = _unsaved_copy(rollup)
+
+    _advance(rollup, session, today)
+    if rollup.extremes_stale:
+        _refresh_extremes(rollup, session)
+
+    trends = {}
+    if rollup.steps_count:
+        trends['avg_steps'] = rollup.steps_mean
+        trends['steps_trend'] = 'increasing' if rollup.steps_count > 1 and rollup.steps_last > rollup.steps_first else 'stable'
+        trends['best_step_day'] = rollup.steps_max
+        trends['consistent_days'] = rollup.consistent_days
+
+    if rollup.sleep_count:
+        trends['avg_sleep'] = rollup.sleep_mean
+        trends['sleep_consistency'] = math.sqrt(rollup.sleep_m2 / (rollup.sleep_count - 1)) if rollup.sleep_count > 1 else 0
+        trends['good_sleep_days'] = rollup.good_sleep_days
+
+    if rollup.calories_count:
+        trends['avg_calories'] = rollup.calories_mean
+        trends['active_days'] = rollup.active_days
+
+    return trends
+
+
+def rebuild_rollups(user_ids=None):
+    """
+    Rebuild rollups from the full HealthStat history.
+
+    Args:
+        user_ids (list, optional): Users to rebuild. Defaults to every user.
+
+    Returns:
+        int: The number of users rebuilt
+    """
+    session = db.session
+    if user_ids is None:
+        user_ids = [row[0] for row in session.query(User.id).order_by(User.id)]
+
+    today = datetime.date.today()
+    for start in range(0, len(user_ids), REBUILD_BATCH_SIZE):
+        batch = user_ids[start:start + REBUILD_BATCH_SIZE]
+        rollups = {}
+        for user_id in batch:
+            _get_rollups(session, user_id, today, rollups)
+            for window in ROLLUP_WINDOWS:
+                rollup = rollups[(user_id, window)]
+                rollup.end_date = None
+                _advance(rollup, session, today)
+        session.commit()
+
+    return len(user_ids)
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        selected = [int(user_id) for user_id in sys.argv[1:]] or None
+        print(f"Rebuilt health rollups for {rebuild_rollups(selected)} users")
@@ -0,0 +1,381 @@
+"""
+Health Time-Series Module
+This module keeps daily, weekly and monthly HealthStatBucket aggregates (count,
+sum, min and max) of every HealthStat metric, so a chart over years of history
+reads a bounded number of pre-aggregated buckets instead of every raw row.
+
+Buckets are updated incrementally whenever a HealthStat is inserted, updated
+or deleted through the ORM. A removal can invalidate a bucket's min or max;
+reads then compute them from the bucket's raw rows for the response, without
+writing, and rebuild_buckets stores them again.
+
+Usage: python health_timeseries.py [user_id ...]   (rebuild buckets from history)
+"""
+
+import datetime
+import math
+import sys
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from db import db, app, User, HealthStat, HealthStatBucket
+from health_rollups import pending_health_stat_changes
+
+# HealthStat columns charted as time series
+TIMESERIES_METRICS = ('weight_kg', 'calories_consumed', 'calories_burned', 'steps', 'water_ml', 'sleep_hours')
+
+# Bucket resolutions, finest first
+RESOLUTIONS = ('day', 'week', 'month')
+
+# Default and maximum number of points a chart may request
+DEFAULT_POINTS = 200
+MAX_POINTS = 2000
+
+# With LTTB downsampling, buckets may outnumber the requested points by this factor
+LTTB_OVERSAMPLE = 4
+
+# Number of users rebuilt per commit by rebuild_buckets
+REBUILD_BATCH_SIZE = 100
+
+
+def bucket_start(day, resolution):
+    """Get the first day of the bucket containing ``day``; weeks start on Monday."""
+    if resolution == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if resolution == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def bucket_end(start, resolution):
+    """Get the last day of the bucket starting on ``start``."""
+    if resolution == 'week':
+        return start + datetime.timedelta(days=6)
+    if resolution == 'month':
+        next_month = (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+        return next_month - datetime.timedelta(days=1)
+    return start
+
+
+def bucket_count(start_date, end_date, resolution):
+    """Count the calendar buckets of a resolution overlapping an inclusive date range."""
+    first = bucket_start(start_date, resolution)
+    last = bucket_start(end_date, resolution)
+    if resolution == 'week':
+        return (last - first).days // 7 + 1
+    if resolution == 'month':
+        return (last.year - first.year) * 12 + last.month - first.month + 1
+    return (last - first).days + 1
+
+
+def _aggregate(rows, keys=None):
+    """
+    Aggregate HealthStat rows into (count, total, min, max) per bucket.
+
+    Args:
+        rows (iterable): Rows with a date and the TIMESERIES_METRICS columns
+        keys (set, optional): Only aggregate these (metric, resolution, bucket_start) keys
+
+    Returns:
+        dict: (metric, resolution, bucket_start) -> [count, total, min, max]
+    """
+    aggregates = {}
+    for row in rows:
+        for metric in TIMESERIES_METRICS:
+            value = getattr(row, metric)
+            if value is None:
+                continue
+            for resolution in RESOLUTIONS:
+                key = (metric, resolution, bucket_start(row.date, resolution))
+                if keys is not None and key not in keys:
+                    continue
+                aggregate = aggregates.get(key)
+                if aggregate is None:
+                    aggregates[key] = [1, float(value), value, value]
+                else:
+                    aggregate[0] += 1
+                    aggregate[1] += value
+                    aggregate[2] = min(aggregate[2], value)
+                    aggregate[3] = max(aggregate[3], value)
+    return aggregates
+
+
+def _history_rows(session, user_id, start_date=None, end_date=None):
+    """Read the committed HealthStat values of a user, optionally within an inclusive date range."""
+    query = session.query(HealthStat.date, *[getattr(HealthStat, metric) for metric in TIMESERIES_METRICS])
+    query = query.filter(HealthStat.user_id == user_id)
+    if start_date is not None:
+        query = query.filter(HealthStat.date.between(start_date, end_date))
+
+    # Column queries read the database rather than the identity map, so pending edits aren't double counted
+    with session.no_autoflush:
+        return query.all()
+
+
+def _apply_change(bucket, old_value, new_value):
+    """Move a bucket's aggregates from a day's old metric value to its new one."""
+    if old_value is not None:
+        bucket.count -= 1
+        bucket.total -= old_value
+        if bucket.count <= 0:
+            bucket.count, bucket.total = 0, 0.0
+            bucket.min_value = bucket.max_value = None
+            bucket.extremes_stale = False
+        elif old_value <= bucket.min_value or old_value >= bucket.max_value:
+            bucket.extremes_stale = True
+
+    if new_value is not None:
+        bucket.count += 1
+        bucket.total += new_value
+        # A stale bucket is recomputed from history, which will include the new value
+        if not bucket.extremes_stale:
+            bucket.min_value = new_value if bucket.min_value is None else min(bucket.min_value, new_value)
+            bucket.max_value = new_value if bucket.max_value is None else max(bucket.max_value, new_value)
+
+
+def _get_buckets(session, user_id, keys):
+    """
+    Get a user's buckets for (metric, resolution, bucket_start) keys.
+
+    Missing buckets are created from the committed history of their days, so
+    buckets never backfilled still come out complete.
+    """
+    starts = {start for _, _, start in keys}
+    with session.no_autoflush:
+        existing = session.query(HealthStatBucket).filter(
+            HealthStatBucket.user_id == user_id,
+            HealthStatBucket.bucket_start.in_(starts)
+        ).all()
+
+    buckets = {
+        (bucket.metric, bucket.resolution, bucket.bucket_start): bucket
+        for bucket in existing
+        if (bucket.metric, bucket.resolution, bucket.bucket_start) in keys
+    }
+
+    missing = set(keys) - set(buckets)
+    if missing:
+        first = min(start for _, _, start in missing)
+        last = max(bucket_end(start, resolution) for _, resolution, start in missing)
+        aggregates = _aggregate(_history_rows(session, user_id, first, last), missing)
+
+        for key in missing:
+            metric, resolution, start = key
+            count, total, min_value, max_value = aggregates.get(key, (0, 0.0, None, None))
+            bucket = HealthStatBucket(
+                user_id=user_id, metric=metric, resolution=resolution, bucket_start=start,
+                count=count, total=total, min_value=min_value, max_value=max_value,
+                extremes_stale=False
+            )
+            session.add(bucket)
+            buckets[key] = bucket
+
+    return buckets
+
+
+@event.listens_for(Session, 'before_flush')
+def _update_buckets(session, flush_context, instances):
+    """Fold pending HealthStat inserts, updates and deletes into the owners' buckets."""
+    changes = {}
+    for user_id, day, old, new in pending_health_stat_changes(session):
+        for metric in TIMESERIES_METRICS:
+            old_value = getattr(old, metric) if old is not None else None
+            new_value = getattr(new, metric) if new is not None else None
+            if old_value != new_value:
+                changes.setdefault(user_id, []).append((metric, day, old_value, new_value))
+
+    for user_id, user_changes in changes.items():
+        keys = {
+            (metric, resolution, bucket_start(day, resolution))
+            for metric, day, _, _ in user_changes
+            for resolution in RESOLUTIONS
+        }
+        buckets = _get_buckets(session, user_id, keys)
+
+        for metric, day, old_value, new_value in user_changes:
+            for resolution in RESOLUTIONS:
+                _apply_change(buckets[(metric, resolution, bucket_start(day, resolution))], old_value, new_value)
+
+
+def _fresh_extremes(session, user_id, stale):
+    """
+    Compute the min and max of stale buckets from their raw rows, leaving the buckets unchanged.
+
+    Returns:
+        dict: (metric, resolution, bucket_start) -> (min, max)
+    """
+    first = min(bucket.bucket_start for bucket in stale)
+    last = max(bucket_end(bucket.bucket_start, bucket.resolution) for bucket in stale)
+    keys = {(bucket.metric, bucket.resolution, bucket.bucket_start) for bucket in stale}
+    aggregates = _aggregate(_history_rows(session, user_id, first, last), keys)
+    return {key: tuple(aggregates.get(key, (0, 0.0, None, None))[2:]) for key in keys}
+
+
+def lttb(x, y, threshold):
+    """
+    Pick the points of a series that best keep its visual shape, with
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Args:
+        x (array-like): Increasing x values
+        y (array-like): Y values
+        threshold (int): Number of points to keep
+
+    Returns:
+        np.ndarray: Indexes of the kept points, in order
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        return np.array([0, n - 1][:threshold], dtype=np.int64)
+
+    # The first and last points are always kept; the rest are split into threshold - 2 buckets
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = a = 0
+
+    for i in range(threshold - 2):
+        next_start = int(math.floor((i + 1) * every)) + 1
+        next_end = min(int(math.floor((i + 2) * every)) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        start = int(math.floor(i * every)) + 1
+        end = next_start
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) -
+            (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        selected[i + 1] = a
+
+    selected[-1] = n - 1
+    return selected
+
+
+def choose_resolution(start_date, end_date, budget):
+    """
+    Get the finest resolution whose buckets over a date range fit a budget.
+
+    When even the coarsest one doesn't fit, it is returned anyway and the
+    caller has to reduce its buckets to the budget.
+    """
+    for resolution in RESOLUTIONS:
+        if bucket_count(start_date, end_date, resolution) <= budget:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def get_timeseries(user_id, metric, start_date, end_date, points=DEFAULT_POINTS, downsample=False):
+    """
+    Get a chart-ready series of one metric for a user.
+
+    The finest resolution whose bucket count over the range fits within
+    ``points`` is used. With ``downsample``, a finer resolution of up to
+    LTTB_OVERSAMPLE times as many buckets is read and reduced to ``points``
+    with LTTB, keeping peaks that coarse buckets would average away. A range
+    too long for even monthly buckets to fit is reduced with LTTB either way,
+    so a series never has more than ``points`` points. Buckets overlapping the
+    edges of the range are included whole. Reading never writes.
+
+    Args:
+        user_id (int): ID of the user
+        metric (str): One of TIMESERIES_METRICS
+        start_date (datetime.date): First day of the range
+        end_date (datetime.date): Last day of the range
+        points (int): Maximum number of points to return
+        downsample (bool): Whether to downsample with LTTB
+
+    Returns:
+        dict: The metric, resolution, whether the series was downsampled, and
+        its points with date, count, sum, avg, min and max
+    """
+    budget = points * LTTB_OVERSAMPLE if downsample else points
+    resolution = choose_resolution(start_date, end_date, budget)
+
+    session = db.session
+    buckets = session.query(HealthStatBucket).filter(
+        HealthStatBucket.user_id == user_id,
+        HealthStatBucket.metric == metric,
+        HealthStatBucket.resolution == resolution,
+        HealthStatBucket.bucket_start.between(bucket_start(start_date, resolution), end_date),
+        HealthStatBucket.count > 0
+    ).order_by(HealthStatBucket.bucket_start).all()
+
+    downsampled = False
+    if len(buckets) > points:
+        x = [bucket.bucket_start.toordinal() for bucket in buckets]
+        y = [bucket.total / bucket.count for bucket in buckets]
+        buckets = [buckets[i] for i in lttb(x, y, points)]
+        downsampled = True
+
+    extremes = {}
+    stale = [bucket for bucket in buckets if bucket.extremes_stale]
+    if stale:
+        extremes = _fresh_extremes(session, user_id, stale)
+
+    series = []
+    for bucket in buckets:
+        min_value, max_value = extremes.get(
+            (bucket.metric, bucket.resolution, bucket.bucket_start), (bucket.min_value, bucket.max_value)
+        )
+        series.append({
+            'date': bucket.bucket_start.strftime('%Y-%m-%d'),
+            'count': bucket.count,
+            'sum': bucket.total,
+            'avg': round(bucket.total / bucket.count, 2),
+            'min': min_value,
+            'max': max_value
+        })
+
+    return {
+        'metric': metric,
+        'resolution': resolution,
+        'downsampled': downsampled,
+        'points': series
+    }
+
+
+def rebuild_buckets(user_ids=None):
+    """
+    Rebuild buckets from the full HealthStat history.
+
+    Args:
+        user_ids (list, optional): Users to rebuild. Defaults to every user.
+
+    Returns:
+        int: The number of users rebuilt
+    """
+    session = db.session
+    if user_ids is None:
+        user_ids = [row[0] for row in session.query(User.id).order_by(User.id)]
+
+    for start in range(0, len(user_ids), REBUILD_BATCH_SIZE):
+        batch = user_ids[start:start + REBUILD_BATCH_SIZE]
+        HealthStatBucket.query.filter(HealthStatBucket.user_id.in_(batch)).delete(synchronize_session=False)
+
+        for user_id in batch:
+            aggregates = _aggregate(_history_rows(session, user_id))
+            session.add_all([
+                HealthStatBucket(
+                    user_id=user_id, metric=metric, resolution=resolution, bucket_start=bucket_start_date,
+                    count=count, total=total, min_value=min_value, max_value=max_value,
+                    extremes_stale=False
+                )
+                for (metric, resolution, bucket_start_date), (count, total, min_value, max_value) in aggregates.items()
+            ])
+        session.commit()
+
+    return len(user_ids)
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        selected = [int(user_id) for user_id in sys.argv[1:]] or None
+        print(f"Rebuilt health buckets for {rebuild_buckets(selected)} users")
@@ -0,0 +1,207 @@
+"""
+Instrumentation Module
+This module records the wall time and database query count of named stages
+into in-process histograms, and renders them as JSON or in the Prometheus
+text format.
+
+Stages are marked with ``timed``, as a decorator or a context manager, and
+may nest. Whether a stage is recorded is sampled once at the outermost stage,
+so a sampled call records its whole breakdown and an unsampled one costs a
+single random draw.
+"""
+
+import os
+import random
+import threading
+import time
+from contextlib import ContextDecorator
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Share of outermost stages that are recorded
+SAMPLE_RATE = float(os.getenv('INSTRUMENTATION_SAMPLE_RATE', 1.0))
+
+# Histogram upper bounds, in seconds and in queries
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+METRIC_PREFIX = 'fitgen_stage'
+
+# Every stage's histograms, so they can be scraped from one place
+STAGES = {}
+_stages_lock = threading.Lock()
+
+# Per-thread stack of open stages and running query count
+_local = threading.local()
+
+
+class Histogram:
+    """Thread-safe cumulative histogram with fixed bucket upper bounds."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot counts values above every bound
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        """Add a value."""
+        index = len(self.buckets)
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = position
+                break
+
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            self.max = max(self.max, value)
+
+    def snapshot(self):
+        """Get (cumulative bucket counts, count, total, max) as of now."""
+        with self._lock:
+            counts, count, total, maximum = list(self.counts), self.count, self.total, self.max
+
+        cumulative = []
+        running = 0
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+        return cumulative, count, total, maximum
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket containing it."""
+        cumulative, count, _, maximum = self.snapshot()
+        if count == 0:
+            return 0.0
+
+        rank = q * count
+        for bound, running in zip(self.buckets, cumulative):
+            if running >= rank:
+                return min(bound, maximum)
+        return maximum
+
+
+class _Stage:
+    """Duration and query count histograms of one named stage."""
+
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+
+
+def _get_stage(name):
+    """Get a stage's histograms, creating them on first use."""
+    stage = STAGES.get(name)
+    if stage is None:
+        with _stages_lock:
+            stage = STAGES.setdefault(name, _Stage())
+    return stage
+
+
+def _stack():
+    """Get this thread's stack of open stages."""
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+        _local.queries = 0
+    return stack
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    """Count queries run while a sampled stage is open on this thread."""
+    stack = getattr(_local, 'stack', None)
+    if stack and stack[-1][3]:
+        _local.queries += 1
+
+
+class timed(ContextDecorator):
+    """
+    Record the wall time and query count of a stage.
+
+    Usage:
+        @timed('health_ai.movement')
+        def generate(...): ...
+
+        with timed('health_ai.trends'):
+            ...
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = _stack()
+        sampled = stack[-1][3] if stack else (SAMPLE_RATE >= 1 or random.random() < SAMPLE_RATE)
+        # State lives on the thread's stack, so one instance can be entered concurrently and recursively
+        stack.append((self.name, time.perf_counter(), _local.queries, sampled))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        name, started, queries, sampled = _local.stack.pop()
+        if sampled:
+            stage = _get_stage(name)
+            stage.duration.observe(time.perf_counter() - started)
+            stage.queries.observe(_local.queries - queries)
+        return False
+
+
+def get_stage_stats():
+    """
+    Get a summary of every stage.
+
+    Returns:
+        dict: Stage name -> call count, mean, p50, p95 and max milliseconds,
+        and mean and max queries
+    """
+    stats = {}
+    for name, stage in sorted(STAGES.items()):
+        _, count, total, maximum = stage.duration.snapshot()
+        _, _, total_queries, max_queries = stage.queries.snapshot()
+        stats[name] = {
+            'count': count,
+            'mean_ms': round(total / count * 1000, 3) if count else 0.0,
+            'p50_ms': round(stage.duration.quantile(0.5) * 1000, 3),
+            'p95_ms': round(stage.duration.quantile(0.95) * 1000, 3),
+            'max_ms': round(maximum * 1000, 3),
+            'mean_queries': round(total_queries / count, 2) if count else 0.0,
+            'max_queries': int(max_queries)
+        }
+    return stats
+
+
+def _render_histogram(lines, metric, name, histogram):
+    """Append a stage histogram's Prometheus sample lines."""
+    cumulative, count, total, _ = histogram.snapshot()
+    for bound, running in zip(histogram.buckets, cumulative):
+        lines.append(f'{metric}_bucket{{stage="{name}",le="{bound}"}} {running}')
+    lines.append(f'{metric}_bucket{{stage="{name}",le="+Inf"}} {count}')
+    lines.append(f'{metric}_sum{{stage="{name}"}} {total}')
+    lines.append(f'{metric}_count{{stage="{name}"}} {count}')
+
+
+def render_prometheus():
+    """Render every stage's histograms in the Prometheus text exposition format."""
+    stages = sorted(STAGES.items())
+    lines = []
+    for suffix, attribute, help_text in (
+        ('duration_seconds', 'duration', 'Wall time of an instrumented stage.'),
+        ('db_queries', 'queries', 'Database queries run by an instrumented stage.')
+    ):
+        metric = f'{METRIC_PREFIX}_{suffix}'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} histogram')
+        for name, stage in stages:
+            _render_histogram(lines, metric, name, getattr(stage, attribute))
+    return '\n'.join(lines) + '\n'
+
+
+def reset_stages():
+    """Forget every recorded stage."""
+    with _stages_lock:
+        STAGES.clear()
@@ -0,0 +1,169 @@
+"""
+Meal Plan Optimizer Module
+This module picks the breakfast/lunch/dinner/snack combination whose totals come
+closest to a user's calorie and macronutrient targets, with a variety constraint across days.
+"""
+
+import numpy as np
+
+from food_catalog import MACRO_FIELDS
+
+# Share of the daily targets each meal slot is expected to cover
+MEAL_CALORIE_SHARES = {
+    "breakfast": 0.25,
+    "lunch": 0.35,
+    "dinner": 0.30,
+    "snacks": 0.10
+}
+
+# Relative weight of each field in MACRO_FIELDS order (calories count double)
+TARGET_WEIGHTS = np.array([2.0, 1.0, 1.0, 1.0])
+
+
+class MealPlanOptimizer:
+    """
+    Macro-target optimizer over the food catalog's macro matrix.
+
+    Every slot is first pruned to the candidates closest to its share of the
+    targets. The slots are then split into two groups whose combinations are
+    enumerated once, and each day is solved with a single batched score matrix.
+    The objective is a weighted squared relative error, so the cross term
+    between the two groups is a plain matrix product and no Python loop ever
+    touches an individual combination.
+    """
+
+    def __init__(self, macro_matrix, slot_ids, targets, candidates_per_slot=32,
+                 variety_days=2, repeat_penalty=0.02, meal_ids=None):
+        """
+        Args:
+            macro_matrix (np.ndarray): ``(meals, 4)`` matrix of calories, protein, carbs and fat
+            slot_ids (dict): Meal slot -> catalog meal ids allowed in that slot
+            targets (sequence): Daily calorie, protein, carbs and fat targets
+            candidates_per_slot (int): How many candidates to keep per slot after pruning
+            variety_days (int): A meal is not repeated in its slot within this many days
+            repeat_penalty (float): Score penalty per earlier use of a meal in the plan
+            meal_ids (np.ndarray, optional): Sorted meal ids of the rows of ``macro_matrix``,
+                for catalogs whose ids are not row positions. Defaults to row positions.
+        """
+        self.slots = [slot for slot, ids in slot_ids.items() if len(ids) > 0]
+        self.variety_days = variety_days
+        self.repeat_penalty = repeat_penalty
+
+        targets = np.asarray(targets, dtype=np.float64).reshape(len(MACRO_FIELDS))
+        targets = np.where(targets > 0, targets, 1.0)
+
+        # Renormalize slot shares over the slots that actually have meals
+        share_total = sum(MEAL_CALORIE_SHARES.get(slot, 0.0) for slot in self.slots) or 1.0
+
+        self.candidates = {}
+        features = {}
+        for slot in self.slots:
+            ids = np.asarray(slot_ids[slot], dtype=np.int64)
+            rows = ids if meal_ids is None else np.searchsorted(meal_ids, ids)
+            relative = macro_matrix[rows] / targets
+            share = MEAL_CALORIE_SHARES.get(slot, 0.0) / share_total
+
+            if len(ids) > candidates_per_slot:
+                distance = ((relative - share) ** 2 * TARGET_WEIGHTS).sum(axis=1)
+                keep = np.sort(np.argpartition(distance, candidates_per_slot)[:candidates_per_slot])
+            else:
+                keep = np.arange(len(ids))
+
+            self.candidates[slot] = ids[keep]
+            features[slot] = relative[keep]
+
+        half = (len(self.slots) + 1) // 2
+        self.group_a = self.slots[:half]
+        self.group_b = self.slots[half:]
+        self.combos_a, totals_a = self._enumerate(self.group_a, features)
+        self.combos_b, totals_b = self._enumerate(self.group_b, features)
+
+        # ||a + b - 1||^2_w = ||a - 1||^2_w + ||b||^2_w + 2 (a - 1) . w . b
+        offset_a = totals_a - 1.0
+        self.base_scores = (
+            ((offset_a ** 2) * TARGET_WEIGHTS).sum(axis=1)[:, None]
+            + ((totals_b ** 2) * TARGET_WEIGHTS).sum(axis=1)[None, :]
+            + 2.0 * (offset_a * TARGET_WEIGHTS) @ totals_b.T
+        ).astype(np.float32)
+        self._scores = np.empty_like(self.base_scores)
+
+        # Per-slot candidate usage so far, for the variety constraint
+        self.history = []
+        self.use_counts = {slot: np.zeros(len(self.candidates[slot])) for slot in self.slots}
+
+    def _enumerate(self, slots, features):
+        """Enumerate every candidate combination of a slot group with its summed features."""
+        if not slots:
+            return np.zeros((1, 0), dtype=np.int64), np.zeros((1, len(MACRO_FIELDS)))
+
+        grids = np.meshgrid(*[np.arange(len(self.candidates[slot])) for slot in slots], indexing='ij')
+        combos = np.stack([grid.ravel() for grid in grids], axis=1)
+
+        totals = np.zeros((len(combos), len(MACRO_FIELDS)))
+        for position, slot in enumerate(slots):
+            totals += features[slot][combos[:, position]]
+
+        return combos, totals
+
+    def _group_penalties(self, slots, combos, penalties):
+        """Sum the per-candidate penalties of every combination in a slot group."""
+        total = np.zeros(len(combos), dtype=np.float32)
+        for position, slot in enumerate(slots):
+            total += penalties[slot][combos[:, position]]
+        return total
+
+    def _slot_penalties(self):
+        """Build per-candidate penalties from the meals already chosen on earlier days."""
+        penalties = {}
+
+        for slot in self.slots:
+            penalty = self.use_counts[slot] * self.repeat_penalty
+
+            # Hard variety constraint, relaxed when it would leave the slot empty
+            recent = np.zeros(len(penalty), dtype=bool)
+            if self.variety_days > 0:
+                for day in self.history[-self.variety_days:]:
+                    if slot in day:
+                        recent[day[slot]] = True
+            if not recent.all():
+                penalty = np.where(recent, np.inf, penalty)
+
+            penalties[slot] = penalty
+
+        return penalties
+
+    def next_day(self):
+        """
+        Choose the best meal for every slot given the days planned so far.
+
+        Returns:
+            dict: Meal slot -> chosen catalog meal id
+        """
+        if not self.slots:
+            return {}
+
+        penalties = self._slot_penalties()
+        scores = np.add(
+            self.base_scores,
+            self._group_penalties(self.group_a, self.combos_a, penalties)[:, None],
+            out=self._scores
+        )
+        scores += self._group_penalties(self.group_b, self.combos_b, penalties)[None, :]
+        row, col = np.unravel_index(np.argmin(scores), scores.shape)
+
+        # Remember positions within each slot's candidate list for the variety checks
+        chosen = {}
+        for position, slot in enumerate(self.group_a):
+            chosen[slot] = self.combos_a[row, position]
+        for position, slot in enumerate(self.group_b):
+            chosen[slot] = self.combos_b[col, position]
+
+        for slot, candidate in chosen.items():
+            self.use_counts[slot][candidate] += 1
+        self.history.append(chosen)
+
+        return {slot: int(self.candidates[slot][candidate]) for slot, candidate in chosen.items()}
+
+    def plan(self, num_days):
+        """Choose meals for ``num_days`` consecutive days."""
+        return [self.next_day() for _ in range(num_days)]
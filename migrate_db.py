@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+"""
+Database migration script.
+Applies schema and data migrations to existing databases that db.create_all() cannot handle.
+Run with: python migrate_db.py
+"""
+
+import json
+
+from sqlalchemy import inspect, text
+
+from db import app, db, DietPlan, User, HealthStatBucket, HealthStatRollup, ChatMessage
+from diet_plan import compact_plan, is_compact_plan
+
+# Rows loaded and committed per migration step
+BATCH_SIZE = 200
+
+
+def add_missing_columns(model):
+    """Add nullable columns declared on a model but missing from its existing table, plus its indexes."""
+    table = model.__table__
+    existing_columns = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+
+    for column in table.columns:
+        if column.name in existing_columns:
+            continue
+        column_type = column.type.compile(dialect=db.engine.dialect)
+        db.session.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+        print(f"Added column {table.name}.{column.name}")
+    db.session.commit()
+
+    for index in table.indexes:
+        index.create(bind=db.engine, checkfirst=True)
+
+
+def add_diet_plan_summary_columns():
+    """Add the diet plan summary columns and backfill them from plan_data."""
+    add_missing_columns(DietPlan)
+
+    backfilled = 0
+    last_id = 0
+    while True:
+        plans = DietPlan.query.filter(
+            DietPlan.id > last_id,
+            DietPlan.num_days.is_(None)
+        ).order_by(DietPlan.id).limit(BATCH_SIZE).all()
+        if not plans:
+            break
+
+        for plan in plans:
+            last_id = plan.id
+            plan.set_summary(plan.get_plan())
+            backfilled += 1
+
+        db.session.commit()
+
+    print(f"Backfilled summary columns for {backfilled} diet plans")
+
+
+def compact_diet_plans():
+    """Convert diet plans stored with full meal dicts into compact catalog references."""
+    converted = 0
+    skipped = 0
+    last_id = 0
+
+    while True:
+        plans = DietPlan.query.filter(DietPlan.id > last_id).order_by(DietPlan.id).limit(BATCH_SIZE).all()
+        if not plans:
+            break
+
+        for plan in plans:
+            last_id = plan.id
+            try:
+                plan_data = json.loads(plan.plan_data)
+            except ValueError:
+                skipped += 1
+                continue
+
+            if is_compact_plan(plan_data):
+                continue
+
+            # Plans whose meals no longer match the catalog stay in full form
+            compact = compact_plan(plan_data)
+            if compact is None:
+                skipped += 1
+                continue
+
+            plan.plan_data = json.dumps(compact, separators=(',', ':'))
+            converted += 1
+
+        db.session.commit()
+
+    print(f"Compacted {converted} diet plans ({skipped} left in full form)")
+
+
+def add_user_health_data_column():
+    """Add the column health-AI response caching validates against."""
+    add_missing_columns(User)
+
+
+def backfill_health_stat_buckets():
+    """Build the time-series buckets of existing HealthStat history, once."""
+    from health_timeseries import rebuild_buckets
+
+    if HealthStatBucket.query.first() is not None:
+        return
+    print(f"Built health time-series buckets for {rebuild_buckets()} users")
+
+
+def add_health_stat_rollup_version():
+    """Add the version column guarding concurrent rollup updates, starting existing rows at 1."""
+    add_missing_columns(HealthStatRollup)
+    HealthStatRollup.query.filter(HealthStatRollup.version.is_(None)).update(
+        {HealthStatRollup.version: 1}, synchronize_session=False
+    )
+    db.session.commit()
+
+
+def add_chat_message_indexes():
+    """Add the chat history indexes to an existing chat_message table."""
+    add_missing_columns(ChatMessage)
+
+
+MIGRATIONS = [
+    add_diet_plan_summary_columns,
+    compact_diet_plans,
+    add_user_health_data_column,
+    add_health_stat_rollup_version,
+    backfill_health_stat_buckets,
+    add_chat_message_indexes
+]
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        db.create_all()
+        for migration in MIGRATIONS:
+            migration()
+    print("Database migrations applied successfully!")
@@ -0,0 +1,171 @@
+"""
+Recommendation Precompute Job
+This module computes health recommendations ahead of time for every user with
+FitnessData for a date, so the /api/health-ai/recommendations route can serve
+them from the RecommendationCache table during the morning load spike.
+
+Recommendations depend on the hour of the day, so one entry is computed per
+user for each requested hour. Users are split into chunks by id and the
+chunks are computed on a process pool; the parent process does all writes.
+
+Usage: python precompute_recommendations.py [YYYY-MM-DD] [--hours 6,7,8,9]
+"""
+
+import datetime
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from db import db, app, User, FitnessData, HealthStatRollup, RecommendationCache
+from health_ai_engine import HealthAIEngine, HealthContext, build_health_data, recommendation_fingerprint
+from health_rollups import get_rollup_trends
+
+# Hours of the day precomputed by default, covering the morning dashboard peak
+PRECOMPUTE_HOURS = (6, 7, 8, 9)
+
+# Number of users computed per worker task
+PRECOMPUTE_CHUNK_SIZE = 200
+
+
+def _init_worker():
+    """Drop database connections inherited from the parent process."""
+    with app.app_context():
+        db.engine.dispose()
+
+
+def compute_chunk(user_ids, for_date, hours):
+    """
+    Compute recommendations for a chunk of users at each of the given hours.
+
+    Workers only read; the parent process writes every result.
+
+    Returns:
+        list: (user_id, hour, fingerprint, recommendations, health_data) tuples
+    """
+    with app.app_context():
+        return _compute_users(user_ids, for_date, hours)
+
+
+def _compute_users(user_ids, for_date, hours):
+    """Compute the chunk's results, fingerprinted from the same inputs the route hashes."""
+    rows = db.session.query(User, HealthStatRollup).outerjoin(
+        HealthStatRollup, (HealthStatRollup.user_id == User.id) & (HealthStatRollup.window_days == 7)
+    ).filter(User.id.in_(user_ids)).all()
+    fitness_rows = FitnessData.query.filter(
+        FitnessData.user_id.in_(user_ids),
+        FitnessData.date == for_date
+    ).order_by(FitnessData.id).all()
+
+    # The route reads the first row of a user's day, so later duplicates are skipped
+    first_rows = {}
+    for fitness_data in fitness_rows:
+        first_rows.setdefault(fitness_data.user_id, fitness_data)
+
+    results = []
+    for user, rollup in rows:
+        fitness_data = first_rows.get(user.id)
+        if fitness_data is None:
+            continue
+
+        # Read-only, and errors fail the chunk rather than caching a fingerprint of empty trends
+        trends = get_rollup_trends(user.id, 7, rollup)
+        health_data = build_health_data(fitness_data)
+        fingerprint = recommendation_fingerprint(health_data, trends, user)
+
+        for hour in hours:
+            now = datetime.datetime.combine(for_date, datetime.time(hour))
+            context = HealthContext(user.id, now, user, fitness_data, rollup, None, trends)
+            recommendations = HealthAIEngine.generate_personalized_recommendations(user.id, health_data, now, context)
+            if 'error' not in recommendations:
+                results.append((user.id, hour, fingerprint, recommendations, health_data))
+
+    return results
+
+
+def _store_chunk(for_date, hours, user_ids, results):
+    """Replace the cache entries of a chunk of users with freshly computed ones."""
+    RecommendationCache.query.filter(
+        RecommendationCache.user_id.in_(user_ids),
+        RecommendationCache.for_date == for_date,
+        RecommendationCache.hour.in_(hours)
+    ).delete(synchronize_session=False)
+
+    computed_at = datetime.datetime.now(datetime.timezone.utc)
+    db.session.add_all([
+        RecommendationCache(
+            user_id=user_id,
+            for_date=for_date,
+            hour=hour,
+            fingerprint=fingerprint,
+            recommendations=json.dumps(recommendations),
+            health_data=json.dumps(health_data),
+            computed_at=computed_at
+        )
+        for user_id, hour, fingerprint, recommendations, health_data in results
+    ])
+    db.session.commit()
+
+
+def precompute_recommendations(for_date=None, hours=PRECOMPUTE_HOURS, chunk_size=PRECOMPUTE_CHUNK_SIZE,
+                               max_workers=None):
+    """
+    Precompute and cache recommendations for every user with FitnessData on a date.
+
+    Entries from earlier dates are deleted first.
+
+    Args:
+        for_date (datetime.date, optional): Date to compute for. Defaults to today.
+        hours (sequence): Hours of the day to compute for
+        chunk_size (int): Number of users per worker task
+        max_workers (int, optional): Pool size. Defaults to RECOMMENDATION_WORKERS or the CPU count.
+
+    Returns:
+        int: The number of cache entries written
+    """
+    for_date = for_date or datetime.date.today()
+    hours = tuple(hours)
+    max_workers = max_workers or int(os.getenv('RECOMMENDATION_WORKERS', os.cpu_count() or 1))
+
+    RecommendationCache.query.filter(RecommendationCache.for_date < for_date).delete(synchronize_session=False)
+    db.session.commit()
+
+    user_ids = [
+        row[0] for row in db.session.query(FitnessData.user_id)
+        .filter(FitnessData.date == for_date)
+        .distinct()
+        .order_by(FitnessData.user_id)
+    ]
+    chunks = [user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size)]
+
+    written = 0
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+        futures = {executor.submit(compute_chunk, chunk, for_date, hours): chunk for chunk in chunks}
+        for future in as_completed(futures):
+            chunk = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"Error precomputing recommendations for users {chunk[0]}-{chunk[-1]}: {str(e)}")
+                continue
+
+            _store_chunk(for_date, hours, chunk, results)
+            written += len(results)
+
+    return written
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    selected_hours = PRECOMPUTE_HOURS
+    if '--hours' in args:
+        position = args.index('--hours')
+        selected_hours = [int(hour) for hour in args[position + 1].split(',')]
+        del args[position:position + 2]
+
+    selected_date = datetime.date.fromisoformat(args[0]) if args else None
+
+    with app.app_context():
+        db.create_all()
+        count = precompute_recommendations(selected_date, selected_hours)
+        print(f"Precomputed {count} recommendation entries")
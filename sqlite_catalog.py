@@ -0,0 +1,501 @@
+"""
+SQLite Food Catalog Module
+This module provides a food catalog backend stored in SQLite, for catalogs too
+large to keep in a JSON file, and a bulk importer that streams JSON, NDJSON and
+CSV files into it.
+
+Usage: python sqlite_catalog.py <catalog.db> <foods.json|foods.ndjson|foods.csv> [--replace]
+"""
+
+import csv
+import json
+import os
+import sqlite3
+import sys
+import threading
+
+import numpy as np
+
+from cache import LRUCache
+from food_catalog import (MACRO_FIELDS, KEYWORD_BITS, KEYWORD_MATCHER, SEARCH_WORD_PATTERN,
+                          meal_key, normalize_allergens)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meal (
+    id INTEGER PRIMARY KEY,
+    meal_key TEXT NOT NULL UNIQUE,
+    meal_type TEXT NOT NULL,
+    name TEXT NOT NULL,
+    ingredient_text TEXT NOT NULL,
+    budget_friendly INTEGER NOT NULL DEFAULT 0,
+    allergen_mask INTEGER NOT NULL DEFAULT 0,
+    calories REAL NOT NULL DEFAULT 0,
+    protein REAL NOT NULL DEFAULT 0,
+    carbs REAL NOT NULL DEFAULT 0,
+    fat REAL NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_meal_type_budget ON meal (meal_type, budget_friendly, id);
+CREATE INDEX IF NOT EXISTS ix_meal_type_calories ON meal (meal_type, calories);
+CREATE TABLE IF NOT EXISTS meal_diet_type (
+    diet_type TEXT NOT NULL,
+    meal_id INTEGER NOT NULL REFERENCES meal (id) ON DELETE CASCADE,
+    PRIMARY KEY (diet_type, meal_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_meal_diet_type_meal ON meal_diet_type (meal_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS meal_fts USING fts5 (
+    name, ingredient_text, content='meal', content_rowid='id'
+);
+"""
+
+# Number of meals the importer writes per statement batch
+IMPORT_BATCH_SIZE = 5000
+
+# Characters read per chunk when streaming a JSON file
+JSON_CHUNK_SIZE = 1 << 16
+
+# Meal fields that hold lists in the JSON layout and are ';'-separated in CSV files
+CSV_LIST_FIELDS = ('ingredients', 'diet_types')
+
+
+class SQLiteFoodCatalog:
+    """
+    Food catalog backed by a SQLite database built with import_catalog.
+
+    Implements the same interface as FoodCatalog, but nothing is loaded up
+    front: filters are indexed queries, meals are fetched by id on demand and
+    kept in an LRU cache, and name/ingredient search uses an FTS5 index. Meal
+    ids are database row ids, which stay stable across re-imports so stored
+    plans keep resolving. The catalog version is the database's user_version,
+    which the importer bumps, and all caches are dropped when it changes.
+    """
+
+    def __init__(self, path, meal_cache_size=4096, filter_cache_size=256):
+        self.path = path
+        self.version = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._meals = LRUCache('food_catalog_meals', maxsize=meal_cache_size)
+        self._filters = LRUCache('food_catalog_filters', maxsize=filter_cache_size)
+        self.refresh()
+
+    def _connection(self):
+        """Get this thread's connection, reopening it in forked worker processes."""
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = connect(self.path)
+            local.pid = os.getpid()
+        return local.connection
+
+    def refresh(self):
+        """Drop the cached meals and filter results if the catalog was re-imported."""
+        version = self._connection().execute("PRAGMA user_version").fetchone()[0]
+        if version == self.version:
+            return
+
+        with self._lock:
+            if version != self.version:
+                self._meals.clear()
+                self._filters.clear()
+                self.version = version
+
+    def snapshot(self):
+        """
+        Get the catalog to read a consistent set of meal ids from.
+
+        Row ids stay stable across re-imports, so the catalog is its own snapshot.
+        """
+        self.refresh()
+        return self
+
+    def as_dict(self):
+        """Return the catalog in the original ``{meal_type: [meal, ...]}`` layout."""
+        self.refresh()
+        food_db = {}
+        for meal_type, data in self._connection().execute("SELECT meal_type, data FROM meal ORDER BY id"):
+            food_db.setdefault(meal_type, []).append(json.loads(data))
+        return food_db
+
+    def filter_ids(self, meal_type=None, diet_type=None, budget_friendly=False, allergens=None):
+        """Get the sorted ids of meals matching all of the given criteria."""
+        self.refresh()
+        allergens = normalize_allergens(allergens or [])
+        cache_key = (meal_type, diet_type or None, bool(budget_friendly), allergens)
+        ids = self._filters.get(cache_key)
+        if ids is not None:
+            return ids
+
+        conditions = []
+        params = []
+        if meal_type is not None:
+            conditions.append("meal_type = ?")
+            params.append(meal_type)
+
+        if diet_type:
+            conditions.append("id IN (SELECT meal_id FROM meal_diet_type WHERE diet_type = ?)")
+            params.append(diet_type)
+
+        if budget_friendly:
+            conditions.append("budget_friendly = 1")
+
+        # Same substring semantics as FoodCatalog: keywords use the precomputed bitmask
+        keyword_bits = 0
+        for allergen in allergens:
+            if allergen in KEYWORD_BITS:
+                keyword_bits |= KEYWORD_BITS[allergen]
+            else:
+                conditions.append("instr(ingredient_text, ?) = 0")
+                params.append(allergen)
+        if keyword_bits:
+            conditions.append("(allergen_mask & ?) = 0")
+            params.append(keyword_bits)
+
+        query = "SELECT id FROM meal"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY id"
+
+        ids = [row[0] for row in self._connection().execute(query, params)]
+        self._filters.set(cache_key, ids)
+        return ids
+
+    def filter(self, meal_type=None, diet_type=None, budget_friendly=False, allergens=None):
+        """Get the meals matching all of the given criteria, in catalog order."""
+        return [self.get_meal(meal_id) for meal_id in self.filter_ids(meal_type, diet_type, budget_friendly, allergens)]
+
+    def meal_ids_with_allergens(self, allergens):
+        """Get the ids of meals whose ingredients mention any of the given allergens."""
+        excluded = set(self.filter_ids(allergens=allergens))
+        return frozenset(meal_id for meal_id in self.filter_ids() if meal_id not in excluded)
+
+    def _fetch(self, column, meal_id):
+        """Fetch one column of a meal row, caching the row's key and data together."""
+        row = self._meals.get(meal_id)
+        if row is None:
+            row = self._connection().execute(
+                "SELECT meal_key, data FROM meal WHERE id = ?", (meal_id,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(meal_id)
+            row = (row[0], json.loads(row[1]))
+            self._meals.set(meal_id, row)
+        return row[column]
+
+    def get_meal(self, meal_id):
+        """Get a meal dict by id."""
+        return self._fetch(1, meal_id)
+
+    def get_meal_key(self, meal_id):
+        """Get the stable key of a meal by id."""
+        return self._fetch(0, meal_id)
+
+    def meal_id_for_key(self, key):
+        """Get the id of the meal with a stable key, or None if there is no such meal."""
+        self.refresh()
+        row = self._connection().execute("SELECT id FROM meal WHERE meal_key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def macros(self, meal_ids):
+        """Get the ``(len(meal_ids), 4)`` macro matrix rows of the given sorted meal ids."""
+        meal_ids = np.asarray(meal_ids, dtype=np.int64)
+        rows = self._connection().execute(
+            f"SELECT id, {', '.join(MACRO_FIELDS)} FROM meal "
+            "WHERE id IN (SELECT value FROM json_each(?)) ORDER BY id",
+            (json.dumps(meal_ids.tolist()),)
+        ).fetchall()
+
+        matrix = np.zeros((len(meal_ids), len(MACRO_FIELDS)))
+        if rows:
+            found = np.array(rows, dtype=np.float64)
+            matrix[np.searchsorted(meal_ids, found[:, 0].astype(np.int64))] = found[:, 1:]
+        return matrix
+
+    def search(self, query, meal_type=None, limit=20):
+        """Get the meals whose name or ingredients match every word of ``query``, best matches first."""
+        self.refresh()
+        words = SEARCH_WORD_PATTERN.findall(query.lower())
+        if not words:
+            return []
+
+        # Quote every word as a prefix term so user input can't inject FTS5 syntax
+        match = ' '.join(f'"{word}"*' for word in words)
+        sql = "SELECT meal.id FROM meal_fts JOIN meal ON meal.id = meal_fts.rowid WHERE meal_fts MATCH ?"
+        params = [match]
+        if meal_type is not None:
+            sql += " AND meal.meal_type = ?"
+            params.append(meal_type)
+        sql += " ORDER BY bm25(meal_fts) LIMIT ?"
+        params.append(limit)
+
+        return [self.get_meal(row[0]) for row in self._connection().execute(sql, params)]
+
+    def find_meal_id(self, meal_type, meal):
+        """Get the id of the catalog meal identical to ``meal``, or None if there is no such meal."""
+        meal_id = self.meal_id_for_key(meal_key(meal_type, meal))
+        if meal_id is None or self.get_meal(meal_id) != meal:
+            return None
+        return meal_id
+
+    def has_meal_type(self, meal_type):
+        """Check whether the catalog knows about a meal type."""
+        self.refresh()
+        return self._connection().execute(
+            "SELECT 1 FROM meal WHERE meal_type = ? LIMIT 1", (meal_type,)
+        ).fetchone() is not None
+
+
+def connect(path):
+    """Open a catalog database, creating its schema if needed."""
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def iter_json_values(f, chunk_size=JSON_CHUNK_SIZE):
+    """
+    Stream the meals of a JSON file without parsing the whole document.
+
+    Accepts either an array of meals with a ``meal_type`` field, or the
+    food_database.json layout of ``{meal_type: [meal, ...]}``.
+
+    Yields:
+        tuple: (meal_type, meal) pairs
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def ensure(size=1):
+        # Make sure at least ``size`` unread characters are buffered, unless the file ended
+        nonlocal buffer, position, eof
+        while len(buffer) - position < size and not eof:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+            buffer = buffer[position:] + chunk
+            position = 0
+
+    def peek():
+        # Next non-whitespace character, or '' at the end of the file
+        nonlocal position
+        while True:
+            ensure()
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position < len(buffer) or eof:
+                return buffer[position] if position < len(buffer) else ''
+
+    def expect(chars):
+        nonlocal position
+        char = peek()
+        if char not in chars:
+            raise ValueError(f"Malformed catalog JSON: expected one of {chars!r}, got {char!r}")
+        position += 1
+        return char
+
+    def value():
+        # Decode one value, reading more of the file while it is incomplete
+        nonlocal position
+        peek()
+        while True:
+            try:
+                result, end = decoder.raw_decode(buffer, position)
+                position = end
+                return result
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                ensure(len(buffer) - position + chunk_size)
+
+    def array(meal_type):
+        expect('[')
+        if peek() == ']':
+            expect(']')
+            return
+        while True:
+            meal = value()
+            yield meal_type if meal_type is not None else meal.pop('meal_type', None), meal
+            if expect(',]') == ']':
+                return
+
+    if peek() == '[':
+        yield from array(None)
+        return
+
+    expect('{')
+    if peek() == '}':
+        return
+    while True:
+        meal_type = value()
+        expect(':')
+        yield from array(meal_type)
+        if expect(',}') == '}':
+            return
+
+
+def iter_ndjson_values(f):
+    """Stream the meals of a newline-delimited JSON file with one meal, including its meal_type, per line."""
+    for line in f:
+        if line.strip():
+            meal = json.loads(line)
+            yield meal.pop('meal_type', None), meal
+
+
+def iter_csv_values(f):
+    """
+    Stream the meals of a CSV file with a header row.
+
+    Columns are meal fields plus ``meal_type``; ingredients and diet_types are
+    ';'-separated, and empty cells are left out of the meal.
+    """
+    for row in csv.DictReader(f):
+        meal = {}
+        for field, cell in row.items():
+            cell = (cell or '').strip()
+            if not field or not cell:
+                continue
+            if field in CSV_LIST_FIELDS:
+                meal[field] = [item.strip() for item in cell.split(';') if item.strip()]
+            elif field in MACRO_FIELDS:
+                number = float(cell)
+                meal[field] = int(number) if number.is_integer() else number
+            elif field == 'budget_friendly':
+                meal[field] = cell.lower() in ('1', 'true', 'yes', 'y')
+            else:
+                meal[field] = cell
+        yield meal.pop('meal_type', None), meal
+
+
+def _meal_row(meal_type, meal):
+    """Get the meal table row of a meal."""
+    ingredient_text = '\n'.join(ingredient.lower() for ingredient in meal.get('ingredients', []))
+    return (
+        meal_key(meal_type, meal),
+        meal_type,
+        meal.get('name', ''),
+        ingredient_text,
+        int(bool(meal.get('budget_friendly', False))),
+        KEYWORD_MATCHER.scan(ingredient_text),
+        *[meal.get(field, 0) or 0 for field in MACRO_FIELDS],
+        json.dumps(meal, separators=(',', ':'))
+    )
+
+
+def _write_batch(connection, batch):
+    """Upsert a batch of meals with their diet types, recording their keys in temp.import_key."""
+    connection.executemany(
+        """
+        INSERT INTO meal (meal_key, meal_type, name, ingredient_text, budget_friendly, allergen_mask,
+                          calories, protein, carbs, fat, data)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (meal_key) DO UPDATE SET
+            meal_type = excluded.meal_type, name = excluded.name,
+            ingredient_text = excluded.ingredient_text, budget_friendly = excluded.budget_friendly,
+            allergen_mask = excluded.allergen_mask, calories = excluded.calories,
+            protein = excluded.protein, carbs = excluded.carbs, fat = excluded.fat, data = excluded.data
+        """,
+        [_meal_row(meal_type, meal) for meal_type, meal in batch]
+    )
+
+    keys = json.dumps([meal_key(meal_type, meal) for meal_type, meal in batch])
+    connection.execute("INSERT OR IGNORE INTO temp.import_key SELECT value FROM json_each(?)", (keys,))
+    ids = dict(connection.execute(
+        "SELECT meal_key, id FROM meal WHERE meal_key IN (SELECT value FROM json_each(?))", (keys,)
+    ))
+    connection.execute(
+        "DELETE FROM meal_diet_type WHERE meal_id IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(ids.values())),)
+    )
+    connection.executemany(
+        "INSERT OR IGNORE INTO meal_diet_type (diet_type, meal_id) VALUES (?, ?)",
+        [
+            (diet_type, ids[meal_key(meal_type, meal)])
+            for meal_type, meal in batch
+            for diet_type in meal.get('diet_types', [])
+        ]
+    )
+
+
+def import_catalog(path, source, fmt=None, replace=False, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Stream a JSON, NDJSON or CSV food file into a SQLite catalog.
+
+    Meals are upserted by their stable key, so re-importing an updated file
+    keeps meal ids (and the plans referencing them) intact; with ``replace``,
+    meals missing from the file are deleted afterwards rather than everything
+    up front. The whole import, the full-text index rebuild and the catalog
+    version bump are one transaction, so running SQLiteFoodCatalog instances
+    see either the old catalog or the new one, never a partial import, and
+    drop their caches when the version changes.
+
+    Args:
+        path (str): Path of the catalog database
+        source (str): Path of the file to import
+        fmt (str, optional): 'json', 'ndjson' or 'csv'. Defaults to the file extension.
+        replace (bool): Whether to delete the existing meals missing from the file
+        batch_size (int): Meals written per statement batch
+
+    Returns:
+        int: The number of meals imported
+    """
+    if fmt is None:
+        extension = os.path.splitext(source)[1].lower().lstrip('.')
+        fmt = {'jsonl': 'ndjson', 'ndjson': 'ndjson', 'csv': 'csv'}.get(extension, 'json')
+
+    readers = {'json': iter_json_values, 'ndjson': iter_ndjson_values, 'csv': iter_csv_values}
+    if fmt not in readers:
+        raise ValueError(f"Unsupported catalog format: {fmt}")
+
+    connection = connect(path)
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    # Transactions are managed explicitly below
+    connection.isolation_level = None
+
+    imported = 0
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("CREATE TEMP TABLE IF NOT EXISTS import_key (meal_key TEXT PRIMARY KEY)")
+            connection.execute("DELETE FROM temp.import_key")
+
+            with open(source, 'r', encoding='utf-8', newline='' if fmt == 'csv' else None) as f:
+                batch = []
+                for meal_type, meal in readers[fmt](f):
+                    if not meal_type:
+                        raise ValueError(f"Meal {meal.get('name')!r} has no meal_type")
+                    batch.append((meal_type, meal))
+                    if len(batch) >= batch_size:
+                        _write_batch(connection, batch)
+                        imported += len(batch)
+                        batch = []
+
+                if batch:
+                    _write_batch(connection, batch)
+                    imported += len(batch)
+
+            if replace:
+                connection.execute("DELETE FROM meal WHERE meal_key NOT IN (SELECT meal_key FROM temp.import_key)")
+
+            connection.execute("INSERT INTO meal_fts (meal_fts) VALUES ('rebuild')")
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            connection.execute(f"PRAGMA user_version = {version + 1}")
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+    finally:
+        connection.close()
+
+    return imported
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+
+    count = import_catalog(sys.argv[1], sys.argv[2], replace='--replace' in sys.argv[3:])
+    print(f"Imported {count} meals into {sys.argv[1]}")
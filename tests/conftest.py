@@ -0,0 +1,72 @@
+"""
+Shared pytest fixtures: an in-memory SQLite app with the API blueprints, and
+helpers to create users and their JWT headers.
+"""
+
+import os
+import sys
+import tempfile
+
+# Keep tests off the real database, chat index and write-behind thread
+os.environ.setdefault('CHATBOT_INDEX_DIR', tempfile.mkdtemp(prefix='fitgen-chatbot-index-'))
+os.environ.setdefault('CHAT_WRITE_MODE', 'sync')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+from db import db, User
+from cache import CACHES
+from chatbot_api import chatbot_bp
+from diet_api import diet_bp
+from fitness_api import fitness_bp
+from health_ai_engine import health_ai_bp
+
+
+@pytest.fixture
+def app():
+    """A fresh app on an empty in-memory database."""
+    test_app = Flask(__name__)
+    test_app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        JWT_SECRET_KEY='test-secret'
+    )
+    db.init_app(test_app)
+    JWTManager(test_app)
+    test_app.register_blueprint(chatbot_bp)
+    test_app.register_blueprint(diet_bp)
+    test_app.register_blueprint(fitness_bp)
+    test_app.register_blueprint(health_ai_bp, url_prefix='/api/health-ai')
+
+    for cache in CACHES.values():
+        cache.clear()
+
+    with test_app.app_context():
+        db.create_all()
+        yield test_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    """Create and commit a user."""
+    def make(email, **fields):
+        user = User(email=email, password='x', **fields)
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+def auth_headers(user):
+    """Authorization headers carrying a user's JWT identity."""
+    token = create_access_token(identity={'email': user.email, 'role': user.role, 'user_id': user.id})
+    return {'Authorization': f'Bearer {token}'}
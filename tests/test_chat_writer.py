@@ -0,0 +1,72 @@
+import datetime
+import json
+
+import chatbot_api
+from chat_writer import ChatWriter
+from chatbot_api import get_conversation_history
+from conftest import auth_headers
+from db import db, ChatMessage
+
+
+def _row(user_id, content, seconds=0):
+    return {
+        'user_id': user_id, 'role': 'user', 'content': content, 'category': 'fitness',
+        'timestamp': datetime.datetime(2026, 1, 1, 9) + datetime.timedelta(seconds=seconds)
+    }
+
+
+def _writer(tmp_path, **options):
+    # A long interval keeps the background thread out of the way; the tests flush
+    return ChatWriter('write_behind', batch_size=1000, interval=3600, engine=db.engine,
+                      failed_log=str(tmp_path / 'failed.jsonl'), **options)
+
+
+def test_failing_row_is_logged_after_max_attempts(make_user, tmp_path):
+    user = make_user('writer@example.com')
+    writer = _writer(tmp_path, max_attempts=2)
+    writer.write([_row(user.id, 'first', 0), _row(user.id, None, 1), _row(user.id, 'third', 2)])
+
+    try:
+        writer.flush()
+        assert False, "the batch should fail on its first attempt"
+    except Exception:
+        pass
+    assert len(writer.pending(user.id)) == 3
+
+    assert writer.flush() == 2
+    assert writer.pending(user.id) == []
+    assert [m.content for m in ChatMessage.query.order_by(ChatMessage.timestamp)] == ['first', 'third']
+
+    logged = [json.loads(line) for line in (tmp_path / 'failed.jsonl').read_text().splitlines()]
+    assert [row['content'] for row in logged] == [None]
+    assert writer.stats()['failed'] == 1
+
+
+def test_history_keeps_rows_flushed_while_it_is_read(make_user, tmp_path, monkeypatch):
+    class FlushingWriter(ChatWriter):
+        def pending(self, user_id, category=None):
+            # The flush thread commits the buffer just as the history is read
+            self.flush()
+            return super().pending(user_id, category)
+
+    user = make_user('history@example.com')
+    writer = FlushingWriter('write_behind', batch_size=1000, interval=3600, engine=db.engine,
+                            failed_log=str(tmp_path / 'failed.jsonl'))
+    writer.write([_row(user.id, 'hello', 0), _row(user.id, 'again', 1)])
+    monkeypatch.setattr(chatbot_api, 'chat_writer', writer)
+
+    assert [m['content'] for m in get_conversation_history(user.id, 'fitness')] == ['hello', 'again']
+
+
+def test_clear_history_drops_buffered_rows(client, make_user, tmp_path, monkeypatch):
+    user = make_user('clear@example.com')
+    other = make_user('other@example.com')
+    writer = _writer(tmp_path)
+    writer.write([_row(user.id, 'mine'), _row(other.id, 'theirs')])
+    monkeypatch.setattr(chatbot_api, 'chat_writer', writer)
+
+    response = client.post('/api/chatbot/clear-history', json={'category': 'all'}, headers=auth_headers(user))
+    assert response.status_code == 200
+
+    writer.flush()
+    assert [m.content for m in ChatMessage.query] == ['theirs']
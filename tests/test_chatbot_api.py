@@ -0,0 +1,27 @@
+import chatbot_api
+from chatbot_api import answer_cache, get_answer
+
+
+def test_retrieval_errors_are_not_cached(monkeypatch):
+    def broken(message, category):
+        raise OSError("index unreadable")
+
+    monkeypatch.setattr(chatbot_api, 'find_document', broken)
+    assert get_answer('zzqx', 'fitness') == ('default', None)
+    assert answer_cache.get(('fitness', 'zzqx')) is None
+
+    monkeypatch.setattr(chatbot_api, 'find_document', lambda message, category: {'text': 'found it'})
+    assert get_answer('zzqx', 'fitness') == ('text', 'found it')
+    assert answer_cache.get(('fitness', 'zzqx')) == ('text', 'found it')
+
+
+def test_answers_are_dropped_when_the_index_changes(monkeypatch):
+    monkeypatch.setattr(chatbot_api, 'find_document', lambda message, category: {'text': 'old answer'})
+    monkeypatch.setattr(chatbot_api, 'index_version', lambda: 1.0)
+    assert get_answer('zzqx', 'fitness') == ('text', 'old answer')
+
+    monkeypatch.setattr(chatbot_api, 'find_document', lambda message, category: {'text': 'new answer'})
+    assert get_answer('zzqx', 'fitness') == ('text', 'old answer')
+
+    monkeypatch.setattr(chatbot_api, 'index_version', lambda: 2.0)
+    assert get_answer('zzqx', 'fitness') == ('text', 'new answer')
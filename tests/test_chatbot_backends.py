@@ -0,0 +1,93 @@
+import json
+import socket
+import threading
+
+import pytest
+
+import chatbot_api
+from chatbot_backends import SocketModelBackend, StubModelServer, UnixStubModelServer
+from conftest import auth_headers
+from db import ChatMessage
+
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def stub_servers():
+    """Start stub model servers, shutting them down after the test."""
+    started = []
+
+    def start(server):
+        started.append(_serve(server))
+        return server
+
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def _use_model(monkeypatch, address):
+    monkeypatch.setattr(chatbot_api, 'chat_backend', SocketModelBackend(address, timeout=5))
+
+
+def _stream(client, user, message='zzqx'):
+    response = client.post('/api/chatbot/message/stream', headers=auth_headers(user),
+                           json={'message': message, 'category': 'fitness'})
+    events = []
+    for block in response.get_data(as_text=True).strip().split('\n\n'):
+        event, data = block.split('\n')
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+def test_chunks_are_relayed_in_order_and_saved(client, make_user, monkeypatch, stub_servers):
+    server = stub_servers(StubModelServer(reply='one two three', delay=0))
+    _use_model(monkeypatch, f'127.0.0.1:{server.server_address[1]}')
+    user = make_user('stream@example.com')
+
+    events = _stream(client, user)
+
+    assert events == [('chunk', {'text': 'one '}), ('chunk', {'text': 'two '}), ('chunk', {'text': 'three '}),
+                      ('done', {'category': 'fitness'})]
+    assert [(m.role, m.content) for m in ChatMessage.query.order_by(ChatMessage.timestamp)] == \
+        [('user', 'zzqx'), ('assistant', 'one two three ')]
+
+
+def test_unix_socket_address(client, make_user, monkeypatch, stub_servers, tmp_path):
+    path = str(tmp_path / 'model.sock')
+    stub_servers(UnixStubModelServer(path, reply='over a unix socket', delay=0))
+    _use_model(monkeypatch, f'unix:{path}')
+    user = make_user('unix@example.com')
+
+    chunks = [data['text'] for event, data in _stream(client, user) if event == 'chunk']
+    assert ''.join(chunks) == 'over a unix socket '
+
+
+def test_refused_connection_falls_back_to_rules(client, make_user, monkeypatch):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]  # Nothing listens here once the probe closes
+    _use_model(monkeypatch, f'127.0.0.1:{port}')
+    user = make_user('fallback@example.com')
+
+    events = _stream(client, user)
+
+    rules_reply = chatbot_api.generate_ai_response('zzqx', [], 'fitness', user)
+    assert ''.join(data['text'] for event, data in events if event == 'chunk') == rules_reply
+    assert events[-1][0] == 'done'
+    assert ChatMessage.query.count() == 2
+
+
+def test_mid_stream_error_saves_nothing(client, make_user, monkeypatch, stub_servers):
+    server = stub_servers(StubModelServer(reply='one two three', delay=0, fail_after=2))
+    _use_model(monkeypatch, f'127.0.0.1:{server.server_address[1]}')
+    user = make_user('broken@example.com')
+
+    events = _stream(client, user)
+
+    assert [event for event, _ in events] == ['chunk', 'chunk', 'error']
+    assert ChatMessage.query.count() == 0
@@ -0,0 +1,7 @@
+from chatbot_intents import check_corpus
+
+
+def test_intent_corpus_routes_as_expected():
+    total, mismatches = check_corpus()
+    assert total
+    assert mismatches == []
@@ -0,0 +1,38 @@
+import json
+import os
+
+import chatbot_retrieval
+from chatbot_retrieval import TOKENIZER_VERSION, get_index, knowledge_documents, tokenize, update_index
+
+
+def test_plurals_stem_like_their_singular():
+    for plural, singular in (('exercises', 'exercise'), ('calories', 'calorie'), ('boxes', 'box'),
+                             ('lunches', 'lunch'), ('glasses', 'glass'), ('steps', 'step')):
+        assert tokenize(plural) == tokenize(singular)
+    assert tokenize('fitness stress') == ['fitness', 'stress']
+
+
+def test_first_open_picks_up_knowledge_base_edits(tmp_path, monkeypatch):
+    directory = str(tmp_path / 'index')
+    update_index([{'id': 'stale', 'category': 'diet', 'title': '', 'text': 'an outdated answer'}], directory=directory)
+    monkeypatch.setattr(chatbot_retrieval, '_updated_directories', set())
+
+    index = get_index(directory)
+    assert sorted(document['id'] for document in index.documents if document['id'] != 'stale') == \
+        sorted(document['id'] for document in knowledge_documents())
+    assert index.masks[None].sum() == len(knowledge_documents())
+
+
+def test_index_from_another_tokenizer_is_rebuilt(tmp_path):
+    directory = str(tmp_path / 'index')
+    documents = [{'id': 'one', 'category': 'fitness', 'title': '', 'text': 'stretching exercises'}]
+    update_index(documents, directory=directory)
+
+    manifest_path = os.path.join(directory, 'manifest.json')
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    manifest['tokenizer'] = TOKENIZER_VERSION - 1
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+
+    assert update_index(documents, directory=directory)['rebuilt'] is True
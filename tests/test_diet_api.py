@@ -0,0 +1,180 @@
+import base64
+import datetime
+import json
+import time
+
+import pytest
+
+from conftest import auth_headers
+from db import db, DietPlan, Trainer, TrainerClient
+from diet_api import DIET_PLANS_PAGE_SIZE, MAX_DIET_PLANS_PAGE_SIZE, apply_preference_overrides
+
+
+def _trainer_with_clients(make_user, count):
+    trainer_user = make_user('trainer@example.com', role='trainer')
+    trainer = Trainer(user_id=trainer_user.id)
+    db.session.add(trainer)
+    db.session.commit()
+
+    clients = [make_user(f'client{index}@example.com') for index in range(count)]
+    db.session.add_all([TrainerClient(trainer_id=trainer.id, client_id=client.id, status='active') for client in clients])
+    db.session.commit()
+    return trainer_user, clients
+
+
+def test_batch_plans_are_saved_when_the_client_disconnects(client, make_user):
+    trainer_user, clients = _trainer_with_clients(make_user, 3)
+
+    response = client.post('/api/diet-plans/batch', headers=auth_headers(trainer_user), buffered=False, json={
+        'items': [c.id for c in clients],
+        'defaults': {'num_days': 1}
+    })
+    assert response.status_code == 200
+    response.close()  # Hang up before reading a single line
+
+    deadline = time.monotonic() + 30
+    while DietPlan.query.count() < 3 and time.monotonic() < deadline:
+        time.sleep(0.1)
+    assert sorted(plan.user_id for plan in DietPlan.query) == sorted(c.id for c in clients)
+
+
+def test_batch_streams_every_item_and_a_summary(client, make_user):
+    trainer_user, clients = _trainer_with_clients(make_user, 2)
+
+    response = client.post('/api/diet-plans/batch', headers=auth_headers(trainer_user), json={
+        'items': [clients[0].id, {'client_id': clients[1].id}, {'num_days': 1}, 999],
+        'defaults': {'num_days': 1}
+    })
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert sorted(line['index'] for line in lines if 'diet_plan' in line) == [0, 1, 2]
+    assert lines[-1]['summary'] is True
+    assert lines[-1]['saved'] == 2 and lines[-1]['failed'] == 1
+
+
+def test_batch_rejects_num_days_past_the_cap(client, make_user):
+    trainer_user, clients = _trainer_with_clients(make_user, 1)
+
+    response = client.post('/api/diet-plans/batch', headers=auth_headers(trainer_user), json={
+        'items': [{'client_id': clients[0].id, 'num_days': 100000}]
+    })
+    assert response.status_code == 400
+    assert DietPlan.query.count() == 0
+
+
+def test_optimize_override_parses_booleans_explicitly():
+    for value, expected in ((True, True), ('true', True), ('1', True), (1, True),
+                            (False, False), ('false', False), ('False', False), ('0', False), (0, False)):
+        assert apply_preference_overrides({}, {'optimize': value})['optimize'] is expected
+
+    for value in ('maybe', '', 2, None, [True]):
+        with pytest.raises(ValueError):
+            apply_preference_overrides({}, {'optimize': value})
+
+
+def test_invalid_optimize_is_a_bad_request(client):
+    response = client.post('/api/diet-plan/stream', json={'optimize': 'maybe', 'num_days': 1})
+    assert response.status_code == 400
+    assert 'optimize' in response.get_json()['error']
+
+
+def test_cache_stats_cover_every_named_cache(client):
+    first = client.post('/api/diet-plan', json={'num_days': 1})
+    second = client.post('/api/diet-plan', json={'num_days': 1})
+    assert first.get_json()['diet_plan'] == second.get_json()['diet_plan']
+
+    stats = client.get('/api/diet-plan/cache-stats').get_json()
+    assert stats['anonymous_diet_plans']['hits'] == 1
+    assert 'health_ai_payloads' in stats
+
+
+def test_plan_horizon_is_capped_on_every_endpoint(client):
+    for body in ({'num_days': 2000}, {'num_days': 0}, {'num_days': 'abc'}, {'num_days': True}):
+        response = client.post('/api/diet-plan', json=body)
+        assert response.status_code == 400
+        assert 'num_days' in response.get_json()['error']
+
+    assert len(client.post('/api/diet-plan', json={'num_days': '2'}).get_json()['diet_plan']['days']) == 2
+
+
+def test_stream_rejects_invalid_num_days(client):
+    for body in ({'num_days': 'abc'}, {'num_days': None}, {'num_days': 100000}):
+        response = client.post('/api/diet-plan/stream', json=body)
+        assert response.status_code == 400
+        assert 'num_days' in response.get_json()['error']
+
+    lines = client.post('/api/diet-plan/stream', json={'num_days': 2}).get_data(as_text=True).splitlines()
+    assert json.loads(lines[0])['num_days'] == 2
+    assert json.loads(lines[-1])['generated'] == 2
+
+
+def test_seed_must_be_an_integer_or_string(client):
+    for seed in ({'a': 1}, [1], 1.5, True):
+        response = client.post('/api/diet-plan', json={'num_days': 1, 'seed': seed})
+        assert response.status_code == 400
+        assert 'seed' in response.get_json()['error']
+
+    for seed in (42, 'weekly'):
+        first = client.post('/api/diet-plan', json={'num_days': 1, 'seed': seed}).get_json()['diet_plan']
+        second = client.post('/api/diet-plan', json={'num_days': 1, 'seed': seed}).get_json()['diet_plan']
+        assert first == second
+
+
+def _saved_plans(user, created_at, count):
+    plans = []
+    for _ in range(count):
+        plan = DietPlan(user_id=user.id, created_at=created_at, start_date=created_at.date(),
+                        end_date=created_at.date(), plan_data='{}')
+        plan.set_summary({'user_info': {'daily_calories': 2000}, 'days': [{}]})
+        plans.append(plan)
+    db.session.add_all(plans)
+    db.session.commit()
+    return plans
+
+
+def test_plan_pages_split_plans_created_at_the_same_time(client, make_user):
+    user = make_user('pages@example.com')
+    same_time = datetime.datetime(2024, 5, 1, 12, 0)
+    plans = _saved_plans(user, same_time, 5) + _saved_plans(user, same_time - datetime.timedelta(days=1), 2)
+
+    seen = []
+    cursor = None
+    while True:
+        query = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+        response = client.get('/api/diet-plans', headers=auth_headers(user), query_string=query)
+        assert response.status_code == 200
+        page = response.get_json()
+        assert len(page['diet_plans']) <= 2
+        seen.extend(plan['id'] for plan in page['diet_plans'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    expected = sorted(plans, key=lambda plan: (plan.created_at, plan.id), reverse=True)
+    assert seen == [plan.id for plan in expected]
+
+
+@pytest.mark.parametrize('cursor', [
+    'abc',
+    'not a cursor',
+    base64.urlsafe_b64encode(b'yesterday|1').decode(),
+    base64.urlsafe_b64encode(b'2024-05-01T12:00:00|1|2').decode(),
+    base64.urlsafe_b64encode(b'2024-05-01T12:00:00|99999999999999999999').decode(),
+])
+def test_malformed_plan_cursor_is_a_bad_request(client, make_user, cursor):
+    user = make_user('cursor@example.com')
+    response = client.get('/api/diet-plans', headers=auth_headers(user), query_string={'cursor': cursor})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid cursor'}
+
+
+@pytest.mark.parametrize('limit, page_size', [(None, DIET_PLANS_PAGE_SIZE), (0, 1), (-5, 1), (1000, MAX_DIET_PLANS_PAGE_SIZE)])
+def test_plan_page_size_is_clamped(client, make_user, limit, page_size):
+    user = make_user('limit@example.com')
+    _saved_plans(user, datetime.datetime(2024, 5, 1), MAX_DIET_PLANS_PAGE_SIZE + 1)
+
+    query = {} if limit is None else {'limit': limit}
+    response = client.get('/api/diet-plans', headers=auth_headers(user), query_string=query)
+    assert response.status_code == 200
+    assert len(response.get_json()['diet_plans']) == page_size
+    assert response.get_json()['next_cursor'] is not None
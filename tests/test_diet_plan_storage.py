@@ -0,0 +1,90 @@
+import datetime
+import json
+import os
+import subprocess
+import sys
+
+import diet_plan
+import migrate_db
+from db import db, DietPlan
+from food_catalog import FoodCatalog
+
+MEAL_TYPES = ('breakfast', 'lunch', 'dinner', 'snacks')
+
+
+def _meal(name, calories):
+    return {'name': name, 'calories': calories, 'protein': 10, 'carbs': 12.5, 'fat': 5,
+            'ingredients': [name], 'diet_types': ['balanced']}
+
+
+def _catalog(path, food_db, mtime):
+    with open(path, 'w') as f:
+        json.dump(food_db, f)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def _use_catalog(tmp_path, monkeypatch):
+    path = str(tmp_path / 'foods.json')
+    _catalog(path, {meal_type: [_meal(f'{meal_type} {n}', 100 + n) for n in range(3)] for meal_type in MEAL_TYPES},
+             1_000_000_000)
+    catalog = FoodCatalog(path)
+    monkeypatch.setattr(diet_plan, 'food_catalog', catalog)
+    return path, catalog
+
+
+def test_importing_models_does_not_load_the_catalog():
+    code = "import sys, db; sys.exit('diet_plan' in sys.modules or 'numpy' in sys.modules)"
+    cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    assert subprocess.run([sys.executable, '-c', code], cwd=cwd).returncode == 0
+
+
+def test_compact_plan_round_trips(tmp_path, monkeypatch):
+    _use_catalog(tmp_path, monkeypatch)
+    plan = diet_plan.generate_diet_plan({'num_days': 3, 'seed': 7})
+
+    compact = diet_plan.compact_plan(plan)
+    assert diet_plan.is_compact_plan(compact)
+    assert diet_plan.expand_plan(json.loads(json.dumps(compact))) == json.loads(json.dumps(plan))
+
+
+def test_meals_removed_from_the_catalog_expand_as_unavailable(tmp_path, monkeypatch):
+    path, catalog = _use_catalog(tmp_path, monkeypatch)
+    plan = diet_plan.generate_diet_plan({'num_days': 2, 'seed': 3})
+    compact = diet_plan.compact_plan(plan)
+
+    # Keep only one meal per type, renamed, so most saved keys no longer exist
+    _catalog(path, {meal_type: [_meal(f'new {meal_type}', 300)] for meal_type in MEAL_TYPES}, 2_000_000_000)
+    catalog.refresh()
+
+    expanded = diet_plan.expand_plan(compact)
+    for compact_day, day in zip(compact['days'], expanded['days']):
+        meal_keys, _ = compact_day
+        for meal_type, key in zip(MEAL_TYPES, meal_keys):
+            assert day['meals'][meal_type] == {'name': key, 'unavailable': True}
+    assert [day['totals'] for day in expanded['days']] == [day['totals'] for day in plan['days']]
+
+
+def test_migration_compacts_stored_plans(app, make_user, tmp_path, monkeypatch):
+    _use_catalog(tmp_path, monkeypatch)
+    user = make_user('migrate@example.com')
+    plan = json.loads(json.dumps(diet_plan.generate_diet_plan({'num_days': 2, 'seed': 5})))
+    off_catalog = json.loads(json.dumps(plan))
+    off_catalog['days'][0]['meals']['lunch'] = _meal('homemade lunch', 450)
+
+    stored = []
+    for plan_dict in (plan, off_catalog):
+        row = DietPlan(user_id=user.id, start_date=datetime.date.today(), end_date=datetime.date.today(),
+                       plan_data=json.dumps(plan_dict))
+        row.set_summary(plan_dict)
+        db.session.add(row)
+        stored.append(row)
+    db.session.commit()
+
+    migrate_db.compact_diet_plans()
+    db.session.expire_all()
+
+    compacted, full = stored
+    assert diet_plan.is_compact_plan(json.loads(compacted.plan_data))
+    assert compacted.get_plan() == plan
+    assert json.loads(full.plan_data) == off_catalog
+    assert full.get_plan() == off_catalog
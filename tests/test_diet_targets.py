@@ -0,0 +1,46 @@
+import itertools
+
+import numpy as np
+
+from diet_plan import DIET_TYPES, calculate_daily_calories, calculate_daily_calories_batch, calculate_macro_targets_batch
+
+
+def _reference_daily_calories(weight_kg, height_cm, age, gender, activity_level, goal):
+    """The row-at-a-time calculation the batch kernels replaced."""
+    activity_multiplier = {"sedentary": 1.2, "light": 1.375, "moderate": 1.55, "active": 1.725,
+                           "very_active": 1.9}.get(activity_level, 1.2)
+    if gender.lower() == "male":
+        bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age + 5
+    else:
+        bmr = 10 * weight_kg + 6.25 * height_cm - 5 * age - 161
+    daily_calories = bmr * activity_multiplier + {"maintain": 0, "lose": -500, "gain": 500}.get(goal, 0)
+    return max(daily_calories, 1200 if gender.lower() == "female" else 1500)
+
+
+def _reference_macro_targets(daily_calories, diet_type):
+    distribution = DIET_TYPES.get(diet_type, DIET_TYPES['balanced'])
+    return (daily_calories * distribution['protein'] / 4, daily_calories * distribution['carbs'] / 4,
+            daily_calories * distribution['fat'] / 9)
+
+
+GENDERS = ['male', 'female', 'Male', 'FEMALE', 'other']
+ACTIVITY_LEVELS = ['sedentary', 'light', 'moderate', 'active', 'very_active', 'unknown', None]
+GOALS = ['maintain', 'lose', 'gain', 'bulk', None]
+BODIES = [(70, 175, 30), (48.5, 152, 71), (120, 190, 19)]
+
+
+def test_batch_targets_match_the_scalar_calculation():
+    rows = [(*body, gender, activity_level, goal)
+            for body, gender, activity_level, goal in itertools.product(BODIES, GENDERS, ACTIVITY_LEVELS, GOALS)]
+    columns = [np.array(column, dtype=object) for column in zip(*rows)]
+    batch = calculate_daily_calories_batch(*columns)
+
+    for row, value in zip(rows, batch):
+        assert value == _reference_daily_calories(*row)
+        assert calculate_daily_calories(*row) == value
+
+    diet_types = list(DIET_TYPES) + ['unknown', None]
+    diet_type = np.array([diet_types[index % len(diet_types)] for index in range(len(rows))], dtype=object)
+    targets = calculate_macro_targets_batch(batch, diet_type)
+    for index, value in enumerate(batch):
+        assert tuple(column[index] for column in targets) == _reference_macro_targets(value, diet_type[index])
@@ -0,0 +1,101 @@
+import json
+import os
+
+import diet_plan
+from food_catalog import ALLERGEN_KEYWORDS, AllergenMatcher, FoodCatalog
+
+
+def _meal(name, calories):
+    return {'name': name, 'calories': calories, 'protein': 10, 'carbs': 10, 'fat': 5,
+            'ingredients': [name], 'diet_types': ['balanced']}
+
+
+def _write(path, food_db, mtime):
+    with open(path, 'w') as f:
+        json.dump(food_db, f)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_plan_keeps_reading_the_snapshot_it_filtered(tmp_path, monkeypatch):
+    path = str(tmp_path / 'foods.json')
+    _write(path, {meal_type: [_meal(f'old {meal_type} {n}', 100) for n in range(3)]
+                  for meal_type in ('breakfast', 'lunch', 'dinner', 'snacks')}, 1_000_000_000)
+    catalog = FoodCatalog(path)
+    monkeypatch.setattr(diet_plan, 'food_catalog', catalog)
+
+    _, days = diet_plan.start_diet_plan({'num_days': 3, 'seed': 1})
+    version = catalog.version
+    first_day = next(days)
+
+    # Fewer meals, so the old ids would point past the end or at other meals
+    _write(path, {'breakfast': [_meal('new breakfast', 999)]}, 2_000_000_000)
+    catalog.refresh()
+    assert catalog.version == version + 1
+
+    for day in [first_day, *days]:
+        assert set(day['meals']) == {'breakfast', 'lunch', 'dinner', 'snacks'}
+        assert all(meal['name'].startswith('old ') for meal in day['meals'].values())
+
+
+def test_reload_publishes_a_new_snapshot_without_touching_the_old_one(tmp_path):
+    path = str(tmp_path / 'foods.json')
+    _write(path, {'lunch': [_meal('soup', 200), _meal('salad', 150)]}, 1_000_000_000)
+    catalog = FoodCatalog(path)
+    before = catalog.snapshot()
+
+    _write(path, {'dinner': [_meal('stew', 500)]}, 2_000_000_000)
+    after = catalog.snapshot()
+
+    assert after is not before and after.version == before.version + 1
+    assert before.filter_ids('lunch') == [0, 1] and before.get_meal(1)['name'] == 'salad'
+    assert before.macros([0, 1])[:, 0].tolist() == [200, 150]
+    assert after.filter_ids('lunch') == [] and after.get_meal(0)['name'] == 'stew'
+
+
+def _reference_allergen_ids(catalog, allergens):
+    """The per-ingredient substring filter the automaton replaced."""
+    allergens = [allergen.strip().lower() for allergen in allergens if allergen and allergen.strip()]
+    return {
+        meal_id for meal_id, meal in enumerate(catalog.meals)
+        if any(allergen in ingredient.lower() for allergen in allergens for ingredient in meal.get('ingredients', []))
+    }
+
+
+ALLERGY_LISTS = [
+    ['nut'], ['peanut'], ['walnut'], ['nut', 'peanut'], ['peanut', 'walnut'], ['Coconut'],
+    ['pea'], ['rice'], ['almond milk'], ['Chicken Breast'], ['tomato', 'walnut'], ['rice', 'NUT', 'berry'],
+    ['egg', 'eggplant'], ['  oat  ', ''], ['xyz'], []
+] + [[keyword] for keyword in ALLERGEN_KEYWORDS]
+
+
+def test_allergen_matches_equal_the_substring_filter_over_the_catalog():
+    catalog = FoodCatalog(diet_plan.FOOD_DATABASE_PATH).snapshot()
+    for allergens in ALLERGY_LISTS:
+        assert catalog.meal_ids_with_allergens(allergens) == _reference_allergen_ids(catalog, allergens), allergens
+
+
+def test_overlapping_allergen_patterns(tmp_path):
+    path = str(tmp_path / 'foods.json')
+    ingredients = [['peanut butter'], ['walnuts'], ['coconut milk'], ['Hazelnut spread'], ['peas', 'rice'],
+                   ['pea', 'nutmeg'], ['wal', 'nut'], ['eggplant'], ['Doughnut'], ['apple']]
+    meals = [dict(_meal(f'meal {index}', 100), ingredients=items) for index, items in enumerate(ingredients)]
+    _write(path, {'snacks': meals}, 1_000_000_000)
+    catalog = FoodCatalog(path).snapshot()
+
+    assert catalog.meal_ids_with_allergens(['walnut']) == {1}
+    assert catalog.meal_ids_with_allergens(['peanut']) == {0}
+    assert catalog.meal_ids_with_allergens(['nut']) == {0, 1, 2, 3, 5, 6, 8}
+    # Non-keyword patterns, overlapping each other and never spanning two ingredients
+    assert catalog.meal_ids_with_allergens(['hazelnut', 'doughnut']) == {3, 8}
+    assert catalog.meal_ids_with_allergens(['wal nut', 'walnu']) == {1}
+    assert catalog.meal_ids_with_allergens(['pea', 'peanut b']) == {0, 4, 5}
+    for allergens in ALLERGY_LISTS:
+        assert catalog.meal_ids_with_allergens(allergens) == _reference_allergen_ids(catalog, allergens), allergens
+
+
+def test_allergen_matcher_reports_every_overlapping_pattern():
+    matcher = AllergenMatcher(['nut', 'peanut', 'walnut', 'anut', 'p'])
+    assert matcher.scan('peanut') == 0b11011
+    assert matcher.scan('walnut') == 0b00101
+    assert matcher.scan('coconut') == 0b00001
+    assert matcher.scan('nu t') == 0
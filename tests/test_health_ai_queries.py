@@ -0,0 +1,69 @@
+import datetime
+
+import pytest
+from sqlalchemy import event
+
+from db import db, FitnessData, HealthStat
+from health_ai_engine import build_recommendations_payload, build_wellness_payload
+
+
+@pytest.fixture
+def statements(app):
+    """Statements sent to the database while the test runs."""
+    sent = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        sent.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    yield sent
+    event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def _user_with_history(make_user):
+    today = datetime.date.today()
+    user = make_user('queries@example.com', age=30)
+    for day in range(7):
+        db.session.add(HealthStat(user_id=user.id, date=today - datetime.timedelta(days=day),
+                                  steps=7000, sleep_hours=7))
+    db.session.add(FitnessData(user_id=user.id, date=today, steps=5000, sleep_hours=7, calories_burned=200))
+    db.session.commit()
+    user_id = user.id
+    # Start each payload from an empty identity map, like a fresh request
+    db.session.expunge_all()
+    return user_id, datetime.datetime.combine(today, datetime.time(9))
+
+
+def _reads(sent):
+    return [statement for statement in sent if statement.lstrip().upper().startswith('SELECT')]
+
+
+def test_recommendations_payload_reads_once(make_user, statements):
+    user_id, now = _user_with_history(make_user)
+
+    statements.clear()
+    payload, _ = build_recommendations_payload(user_id, now)
+    db.session.commit()
+    assert payload['cached'] is False
+    assert len(_reads(statements)) == 1
+    assert len(statements) == 2  # The read, then storing the computed entry
+
+    db.session.expunge_all()
+    statements.clear()
+    payload, _ = build_recommendations_payload(user_id, now)
+    assert payload['cached'] is True
+    assert len(statements) == 1
+
+
+def test_wellness_payload_reads_once_after_the_hourly_cohort_load(make_user, statements):
+    user_id, now = _user_with_history(make_user)
+
+    statements.clear()
+    build_wellness_payload(user_id, now)
+    assert len(_reads(statements)) == 2  # The context, and the cohorts once per hour
+
+    db.session.expunge_all()
+    statements.clear()
+    payload, _ = build_wellness_payload(user_id, now)
+    assert payload['success'] is True
+    assert len(statements) == 1
@@ -0,0 +1,81 @@
+import datetime
+
+from conftest import auth_headers
+from db import db, HealthStat, HealthMetricBaseline, Notification
+from health_anomalies import ANOMALY_METRICS, ANOMALY_WARMUP_DAYS, NOTIFICATION_TYPE, score_value
+
+START = datetime.date(2024, 3, 1)
+
+
+def _record_weights(user_id, weights, start=START):
+    for offset, weight in enumerate(weights):
+        db.session.add(HealthStat(user_id=user_id, date=start + datetime.timedelta(days=offset), weight_kg=weight))
+        db.session.commit()
+
+
+def _alerts(user_id):
+    return Notification.query.filter_by(user_id=user_id, notification_type=NOTIFICATION_TYPE).all()
+
+
+def test_stable_series_raises_no_alert(make_user):
+    user_id = make_user('stable@example.com').id
+    _record_weights(user_id, [70.0, 70.2, 69.9, 70.1, 70.0, 69.8, 70.2, 70.1, 70.0, 69.9, 70.1, 70.0])
+
+    baseline = HealthMetricBaseline.query.filter_by(user_id=user_id, metric='weight').one()
+    assert baseline.days == 11
+    assert abs(baseline.mean - 70.0) < 0.2
+    assert _alerts(user_id) == []
+
+
+def test_spike_during_warm_up_is_not_flagged(make_user):
+    user_id = make_user('warmup@example.com').id
+    _record_weights(user_id, [70.0] * (ANOMALY_WARMUP_DAYS - 1) + [80.0])
+
+    assert HealthMetricBaseline.query.filter_by(user_id=user_id, metric='weight').one().days == ANOMALY_WARMUP_DAYS - 1
+    assert _alerts(user_id) == []
+
+
+def test_spike_after_warm_up_creates_one_notification(client, make_user):
+    user = make_user('spike@example.com')
+    _record_weights(user.id, [70.0, 70.2, 69.9, 70.1, 70.0, 69.8, 70.2, 70.1])
+    spike_day = (START + datetime.timedelta(days=8)).isoformat()
+
+    for weight in (78.0, 78.5):
+        # Correcting the same day's reading doesn't alert again
+        response = client.post('/api/fitness/health-stat', headers=auth_headers(user),
+                               json={'date': spike_day, 'weight_kg': weight})
+        assert response.status_code in (200, 201)
+
+    alerts = _alerts(user.id)
+    assert len(alerts) == 1
+    assert alerts[0].title == 'Sudden weight change'
+    assert alerts[0].get_data()['metric'] == 'weight'
+    assert alerts[0].get_data()['date'] == spike_day
+
+
+def test_sleep_only_alerts_on_a_drop(make_user):
+    user_id = make_user('sleep@example.com').id
+    for offset, hours in enumerate([7.5, 7.0, 8.0, 7.5, 7.0, 8.0, 7.5, 7.5, 11.5, 7.5, 3.0]):
+        db.session.add(HealthStat(user_id=user_id, date=START + datetime.timedelta(days=offset), sleep_hours=hours))
+        db.session.commit()
+
+    alerts = _alerts(user_id)
+    assert [alert.get_data()['date'] for alert in alerts] == [(START + datetime.timedelta(days=10)).isoformat()]
+    assert alerts[0].title == 'Sleep drop'
+
+
+def test_score_flags_values_at_the_threshold():
+    config = ANOMALY_METRICS['weight']
+    baseline = HealthMetricBaseline(days=ANOMALY_WARMUP_DAYS, mean=70.0, variance=1.0)
+
+    assert score_value(baseline, 72.5, config) is None
+    assert score_value(baseline, 73.0, config) == 3.0
+    assert score_value(baseline, 67.0, config) == -3.0
+
+    # Deviations under the minimum change are ignored however tight the baseline
+    tight = HealthMetricBaseline(days=ANOMALY_WARMUP_DAYS, mean=70.0, variance=0.0)
+    assert score_value(tight, 71.9, config) is None
+    assert score_value(tight, 72.0, config) == 2.0 / config['min_std']
+
+    baseline.days = ANOMALY_WARMUP_DAYS - 1
+    assert score_value(baseline, 80.0, config) is None
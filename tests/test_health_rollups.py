@@ -0,0 +1,120 @@
+import datetime
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+from db import db, User, HealthStat, HealthStatRollup, HealthStatBucket, HealthMetricBaseline
+from health_rollups import _advance, _reset, commit_health_stats, get_rollup_trends, rebuild_rollups
+
+
+def _write_history(user_id, days=10):
+    today = datetime.date.today()
+    for day in range(days):
+        db.session.add(HealthStat(
+            user_id=user_id,
+            date=today - datetime.timedelta(days=day),
+            steps=6000 + day * 700,
+            sleep_hours=6 + (day % 3),
+            calories_burned=200 + day * 20
+        ))
+    db.session.commit()
+
+
+def test_trends_advance_stale_window_without_writing(make_user):
+    user_id = make_user('rollup@example.com').id
+    _write_history(user_id)
+
+    # Leave the stored 7-day window ending yesterday, as if nothing was written today
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    rollup = HealthStatRollup.query.filter_by(user_id=user_id, window_days=7).one()
+    _reset(rollup, yesterday)
+    rollup.end_date = None
+    _advance(rollup, db.session, yesterday)
+    db.session.commit()
+
+    unrelated = User(email='pending@example.com', password='x')
+    db.session.add(unrelated)
+    trends = get_rollup_trends(user_id, 7)
+    assert unrelated in db.session.new
+    db.session.rollback()
+
+    assert User.query.filter_by(email='pending@example.com').first() is None
+    assert HealthStatRollup.query.filter_by(user_id=user_id, window_days=7).one().end_date == yesterday
+
+    rebuild_rollups([user_id])
+    assert trends == get_rollup_trends(user_id, 7)
+
+
+def test_concurrent_rollup_update_fails_instead_of_losing_changes(make_user):
+    user_id = make_user('race@example.com').id
+    _write_history(user_id, days=3)
+
+    other = Session(bind=db.engine)
+    try:
+        # Both sessions read the rollups before either writes
+        stale_rollups = other.query(HealthStatRollup).filter_by(user_id=user_id).all()
+        assert stale_rollups
+
+        db.session.add(HealthStat(user_id=user_id, date=datetime.date.today() - datetime.timedelta(days=4), steps=9000))
+        db.session.commit()
+
+        other.add(HealthStat(user_id=user_id, date=datetime.date.today() - datetime.timedelta(days=5), steps=9500))
+        with pytest.raises(StaleDataError):
+            other.commit()
+    finally:
+        other.rollback()
+        other.close()
+
+
+def test_commit_retries_concurrent_rollup_update(make_user):
+    user_id = make_user('retry@example.com').id
+    _write_history(user_id, days=3)
+
+    other = Session(bind=db.engine)
+    try:
+        stale_rollups = other.query(HealthStatRollup).filter_by(user_id=user_id).all()
+        assert stale_rollups
+
+        db.session.add(HealthStat(user_id=user_id, date=datetime.date.today() - datetime.timedelta(days=4), steps=9000))
+        db.session.commit()
+
+        other.add(HealthStat(user_id=user_id, date=datetime.date.today() - datetime.timedelta(days=5), steps=9500))
+        commit_health_stats(other)
+    finally:
+        other.close()
+
+    db.session.expire_all()
+    assert HealthStat.query.filter_by(user_id=user_id).count() == 5
+    assert HealthStatRollup.query.filter_by(user_id=user_id, window_days=7).one().steps_count == 5
+
+
+def test_commit_retries_concurrent_derived_row_creation(make_user):
+    user_id = make_user('first@example.com').id
+    today = datetime.date.today()
+
+    other = Session(bind=db.engine)
+    raced = []
+
+    def create_derived_rows_first(session, flush_context, instances):
+        # Runs after the derived listeners found no rows, as a concurrent first write would
+        if not raced:
+            raced.append(True)
+            db.session.add(HealthStat(user_id=user_id, date=today - datetime.timedelta(days=1), steps=7000, weight_kg=70))
+            db.session.commit()
+
+    event.listen(other, 'before_flush', create_derived_rows_first)
+    try:
+        other.add(HealthStat(user_id=user_id, date=today, steps=8000, weight_kg=71))
+        commit_health_stats(other)
+    finally:
+        other.close()
+
+    assert raced
+    db.session.expire_all()
+    assert HealthStat.query.filter_by(user_id=user_id).count() == 2
+    assert HealthStatRollup.query.filter_by(user_id=user_id, window_days=7).one().steps_count == 2
+    assert HealthStatBucket.query.filter_by(user_id=user_id, metric='steps', resolution='day', bucket_start=today).one().total == 8000
+    baseline = HealthMetricBaseline.query.filter_by(user_id=user_id, metric='weight').one()
+    assert (baseline.days, baseline.current_date, baseline.current_value) == (1, today, 71)
@@ -0,0 +1,68 @@
+import datetime
+
+import numpy as np
+
+from db import db, User, HealthStat, HealthStatBucket
+from health_timeseries import choose_resolution, get_timeseries, lttb
+
+
+def test_choose_resolution_picks_the_finest_that_fits():
+    start = datetime.date(2024, 1, 1)
+    assert choose_resolution(start, start + datetime.timedelta(days=29), 30) == 'day'
+    assert choose_resolution(start, start + datetime.timedelta(days=30), 30) == 'week'
+    assert choose_resolution(start, datetime.date(2024, 12, 31), 20) == 'month'
+    # Nothing fits, so the coarsest is returned for the caller to reduce
+    assert choose_resolution(start, datetime.date(2028, 12, 31), 20) == 'month'
+
+
+def test_lttb_keeps_endpoints_count_and_peaks():
+    x = np.arange(100)
+    y = np.zeros(100)
+    y[37] = 50
+    y[71] = -40
+
+    selected = lttb(x, y, 10)
+    assert len(selected) == 10
+    assert selected[0] == 0 and selected[-1] == 99
+    assert list(selected) == sorted(selected)
+    assert 37 in selected and 71 in selected
+
+    assert list(lttb(x[:5], y[:5], 10)) == [0, 1, 2, 3, 4]
+    assert list(lttb(x, y, 2)) == [0, 99]
+
+
+def test_long_ranges_stay_within_the_point_budget(make_user):
+    user = make_user('series@example.com')
+    start = datetime.date(2020, 1, 1)
+    for month in range(60):
+        day = datetime.date(2020 + month // 12, month % 12 + 1, 15)
+        db.session.add(HealthStat(user_id=user.id, date=day, steps=1000 + month))
+    db.session.commit()
+
+    series = get_timeseries(user.id, 'steps', start, datetime.date(2024, 12, 31), points=20)
+    assert series['resolution'] == 'month'
+    assert series['downsampled'] is True
+    assert len(series['points']) == 20
+
+
+def test_stale_extremes_are_computed_without_writing(make_user):
+    user = make_user('stale@example.com')
+    day = datetime.date(2024, 3, 4)
+    stats = [HealthStat(user_id=user.id, date=day + datetime.timedelta(days=offset), steps=steps)
+             for offset, steps in enumerate((5000, 9000, 7000))]
+    db.session.add_all(stats)
+    db.session.commit()
+
+    # Deleting the week's max leaves its bucket with stale extremes
+    db.session.delete(stats[1])
+    db.session.commit()
+    assert HealthStatBucket.query.filter_by(user_id=user.id, metric='steps', resolution='week').one().extremes_stale
+
+    db.session.add(User(email='pending@example.com', password='x'))
+    series = get_timeseries(user.id, 'steps', day, day + datetime.timedelta(days=6), points=1)
+    assert series['resolution'] == 'week'
+    assert (series['points'][0]['min'], series['points'][0]['max']) == (5000, 7000)
+
+    db.session.rollback()
+    assert User.query.filter_by(email='pending@example.com').count() == 0
+    assert HealthStatBucket.query.filter_by(user_id=user.id, metric='steps', resolution='week').one().extremes_stale
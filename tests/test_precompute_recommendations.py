@@ -0,0 +1,42 @@
+import datetime
+
+from db import db, FitnessData, HealthStat, RecommendationCache
+from health_ai_engine import build_recommendations_payload
+from health_rollups import rebuild_rollups
+from precompute_recommendations import _compute_users, _store_chunk
+
+
+def _setup_user(make_user, today):
+    user = make_user('precompute@example.com', age=30, weight_kg=70)
+    for day in range(7):
+        db.session.add(HealthStat(user_id=user.id, date=today - datetime.timedelta(days=day),
+                                  steps=6000 + day * 500, sleep_hours=7))
+    db.session.add(FitnessData(user_id=user.id, date=today, steps=5000, sleep_hours=7, calories_burned=200))
+    db.session.commit()
+    return user
+
+
+def test_precomputed_entries_are_served_by_the_route(make_user):
+    today = datetime.date.today()
+    user = _setup_user(make_user, today)
+    rebuild_rollups([user.id])
+
+    results = _compute_users([user.id], today, (8,))
+    assert not db.session.new and not db.session.dirty
+    _store_chunk(today, (8,), [user.id], results)
+
+    payload, _ = build_recommendations_payload(user.id, datetime.datetime.combine(today, datetime.time(8, 30)))
+    assert payload['cached'] is True
+
+
+def test_profile_edit_invalidates_precomputed_entries(make_user):
+    today = datetime.date.today()
+    user = _setup_user(make_user, today)
+    _store_chunk(today, (8,), [user.id], _compute_users([user.id], today, (8,)))
+
+    user.weight_kg = 95
+    db.session.commit()
+
+    payload, _ = build_recommendations_payload(user.id, datetime.datetime.combine(today, datetime.time(8, 30)))
+    assert payload['cached'] is False
+    assert RecommendationCache.query.filter_by(user_id=user.id).count() == 1
@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+
+import pytest
+
+from diet_plan import FOOD_DATABASE_PATH
+from food_catalog import FoodCatalog, MEAL_TYPES
+from sqlite_catalog import (SQLiteFoodCatalog, connect, import_catalog, iter_csv_values, iter_json_values,
+                            iter_ndjson_values)
+
+
+@pytest.fixture
+def food_db():
+    with open(FOOD_DATABASE_PATH) as f:
+        return json.load(f)
+
+
+def _flatten(food_db):
+    return [(meal_type, meal) for meal_type, meals in food_db.items() for meal in meals]
+
+
+def test_json_stream_reads_both_layouts_across_chunk_boundaries(food_db):
+    expected = _flatten(food_db)
+    layout = json.dumps(food_db, indent=2)
+    array = json.dumps([dict(meal, meal_type=meal_type) for meal_type, meal in expected])
+
+    for text in (layout, array):
+        for chunk_size in (1, 7, 1 << 16):
+            assert list(iter_json_values(io.StringIO(text), chunk_size)) == expected
+
+    assert list(iter_json_values(io.StringIO(' { } '))) == []
+    assert list(iter_json_values(io.StringIO('[]'))) == []
+    with pytest.raises(ValueError):
+        list(iter_json_values(io.StringIO('{"lunch": [{"name": "x"} {"name": "y"}]}')))
+
+
+def test_ndjson_and_csv_readers(food_db):
+    expected = _flatten(food_db)
+    ndjson = '\n'.join(json.dumps(dict(meal, meal_type=meal_type)) for meal_type, meal in expected) + '\n\n'
+    assert list(iter_ndjson_values(io.StringIO(ndjson))) == expected
+
+    rows = io.StringIO()
+    writer = csv.writer(rows)
+    writer.writerow(['meal_type', 'name', 'ingredients', 'diet_types', 'calories', 'protein', 'budget_friendly', 'image'])
+    writer.writerow(['lunch', 'Bean Bowl', 'beans; rice ;', 'vegan;balanced', '450', '12.5', 'yes', ''])
+    rows.seek(0)
+    assert list(iter_csv_values(rows)) == [('lunch', {
+        'name': 'Bean Bowl', 'ingredients': ['beans', 'rice'], 'diet_types': ['vegan', 'balanced'],
+        'calories': 450, 'protein': 12.5, 'budget_friendly': True
+    })]
+
+
+def _keys(catalog, ids):
+    return [catalog.get_meal_key(meal_id) for meal_id in ids]
+
+
+def test_filters_match_the_in_memory_catalog(food_db, tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    assert import_catalog(path, FOOD_DATABASE_PATH) == len(_flatten(food_db))
+    sqlite_catalog = SQLiteFoodCatalog(path)
+    memory_catalog = FoodCatalog(str(tmp_path / 'missing.json'), default_data=food_db)
+
+    diet_types = {diet_type for _, meal in _flatten(food_db) for diet_type in meal.get('diet_types', [])}
+    for meal_type in [None, *MEAL_TYPES]:
+        for diet_type in [None, *sorted(diet_types)]:
+            for budget_friendly in (False, True):
+                for allergens in ([], ['egg'], ['nut', 'Milk'], ['olive oil', 'chicken'], ['zzz']):
+                    criteria = (meal_type, diet_type, budget_friendly, allergens)
+                    assert _keys(sqlite_catalog, sqlite_catalog.filter_ids(*criteria)) == \
+                        _keys(memory_catalog, memory_catalog.filter_ids(*criteria)), criteria
+
+
+def test_search_escapes_fts_syntax(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    import_catalog(path, FOOD_DATABASE_PATH)
+    catalog = SQLiteFoodCatalog(path)
+
+    assert [meal['name'] for meal in catalog.search('scrambled')] == ['Scrambled Eggs with Whole Grain Toast']
+    for query in ('egg" OR "x', 'NOT egg', 'egg*)', 'name:egg', '"', 'AND OR NEAR'):
+        catalog.search(query)  # Parsed as plain words, never as FTS5 syntax
+
+
+def _write_json(path, food_db):
+    with open(path, 'w') as f:
+        json.dump(food_db, f)
+    return str(path)
+
+
+def test_replace_keeps_ids_and_is_all_or_nothing(food_db, tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    import_catalog(path, FOOD_DATABASE_PATH)
+    catalog = SQLiteFoodCatalog(path)
+    ids = {catalog.get_meal_key(meal_id): meal_id for meal_id in catalog.filter_ids()}
+    version = catalog.version
+
+    # A file whose last meal is invalid rolls back, leaving the catalog untouched
+    broken = [dict(meal, meal_type=meal_type) for meal_type, meal in _flatten(food_db)[:3]] + [{'name': 'orphan'}]
+    with pytest.raises(ValueError):
+        import_catalog(path, _write_json(tmp_path / 'broken.json', broken), replace=True)
+    catalog.refresh()
+    assert catalog.version == version and len(catalog.filter_ids()) == len(ids)
+
+    kept = {meal_type: meals[:2] for meal_type, meals in food_db.items()}
+    import_catalog(path, _write_json(tmp_path / 'kept.json', kept), replace=True)
+    catalog.refresh()
+    assert catalog.version == version + 1
+    remaining = {catalog.get_meal_key(meal_id): meal_id for meal_id in catalog.filter_ids()}
+    assert len(remaining) == 8
+    assert all(ids[key] == meal_id for key, meal_id in remaining.items())
+    assert connect(path).execute("SELECT count(*) FROM meal_diet_type WHERE meal_id NOT IN (SELECT id FROM meal)").fetchone()[0] == 0
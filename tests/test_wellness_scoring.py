@@ -0,0 +1,62 @@
+import datetime
+
+from db import db, FitnessData, HealthStat
+from health_ai_engine import build_wellness_payload
+from wellness_scoring import cohort_cache, load_wellness_cohorts
+
+
+def test_cohort_scores_match_per_user_scores(make_user):
+    today = datetime.date.today()
+    now = datetime.datetime.combine(today, datetime.time(12))
+    profiles = [
+        # steps, sleep hours, calories burned, heart rate, days of 8000+ steps this week
+        (12000, 8.0, 450, 62, 6),
+        (3000, 5.0, 120, 95, 1),
+        (9000, 7.5, 300, 0, 3),
+        (7000, 6.5, 200, 110, 0),
+    ]
+
+    user_ids = []
+    for index, (steps, sleep_hours, calories, heart_rate, consistent_days) in enumerate(profiles):
+        user = make_user(f'user{index}@example.com', age=30)
+        user_ids.append(user.id)
+        for day in range(7):
+            db.session.add(HealthStat(
+                user_id=user.id,
+                date=today - datetime.timedelta(days=day),
+                steps=9000 if day < consistent_days else 4000,
+                sleep_hours=sleep_hours,
+                calories_burned=calories
+            ))
+        db.session.add(FitnessData(
+            user_id=user.id, date=today, steps=steps, sleep_hours=sleep_hours,
+            calories_burned=calories, heart_rate=heart_rate or None
+        ))
+    db.session.commit()
+
+    per_user = sorted(build_wellness_payload(user_id, now)[0]['wellness_score']['score'] for user_id in user_ids)
+    cohort = sorted(round(float(score)) for band in load_wellness_cohorts(today).bands.values() for score in band)
+
+    assert cohort == per_user
+
+
+def test_duplicate_fitness_rows_count_a_user_once(make_user):
+    today = datetime.date.today()
+    user = make_user('duplicate@example.com', age=30)
+    other = make_user('other@example.com', age=30)
+    db.session.add_all([
+        FitnessData(user_id=user.id, date=today, steps=2000, sleep_hours=5.0, calories_burned=100),
+        FitnessData(user_id=user.id, date=today, steps=11000, sleep_hours=8.0, calories_burned=400),
+        FitnessData(user_id=other.id, date=today, steps=6000, sleep_hours=7.0, calories_burned=250),
+        FitnessData(user_id=user.id, date=today - datetime.timedelta(days=1), steps=500)
+    ])
+    db.session.commit()
+
+    scores = sorted(score for band in load_wellness_cohorts(today).bands.values() for score in band)
+    assert len(scores) == 2
+
+    # Scored from the latest row, as if the earlier one never existed
+    db.session.delete(FitnessData.query.filter_by(user_id=user.id, steps=2000).one())
+    db.session.commit()
+    cohort_cache.clear()
+    assert sorted(score for band in load_wellness_cohorts(today).bands.values() for score in band) == scores
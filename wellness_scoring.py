@@ -0,0 +1,233 @@
+"""
+Wellness Scoring Module
+This module scores wellness with NumPy over whole arrays of metrics, so a single
+user and an entire cohort share the same threshold tables, and ranks users
+against others of their age.
+"""
+
+import datetime
+
+import numpy as np
+from sqlalchemy import func
+
+from cache import LRUCache
+from db import db, User, FitnessData, HealthStatRollup
+
+WELLNESS_MAX_SCORE = 100
+
+# Minimum steps -> points; below the first threshold points scale linearly up to it
+STEPS_THRESHOLDS = [5000, 8000, 10000, 12000]
+STEPS_POINTS = [12, 18, 22, 25]
+
+# Minimum calories burned -> points; below the first threshold points scale linearly up to it
+ACTIVITY_THRESHOLDS = [250, 400, 600]
+ACTIVITY_POINTS = [12, 16, 20]
+
+# Inclusive (low, high) sleep hour bands -> points, first match wins
+SLEEP_BANDS = [((7, 9), 25), ((6, 10), 18), ((5, 11), 10)]
+SLEEP_OTHER_POINTS = 5
+SLEEP_NO_DATA_POINTS = 0
+
+# Inclusive (low, high) average heart rate bands -> points, first match wins
+HEART_RATE_BANDS = [((60, 80), 15), ((50, 90), 12), ((90, 100), 8)]
+HEART_RATE_OTHER_POINTS = 5
+HEART_RATE_NO_DATA_POINTS = 10  # Neutral if no data
+
+# Days in a week of 8000+ steps needed for full consistency points
+CONSISTENCY_DAYS = 7
+CONSISTENCY_POINTS = 15
+
+# Minimum percentage -> grade and message, in ascending order
+WELLNESS_GRADES = [
+    (0, 'Needs Improvement', 'Let\'s work together to improve your health! Small steps lead to big changes! 🎯'),
+    (55, 'Fair', 'Good progress! A few improvements can boost your wellness significantly! 📈'),
+    (70, 'Good', 'Great job! You\'re on the right track to optimal health! 💪'),
+    (85, 'Excellent', 'Outstanding wellness! You\'re crushing your health goals! 🌟')
+]
+
+# Lower bounds of the age bands users are ranked within
+AGE_BAND_EDGES = [18, 25, 35, 45, 55, 65]
+
+# Cohort score distributions, rebuilt at most once an hour per date
+cohort_cache = LRUCache('wellness_cohorts', maxsize=8, ttl=3600)
+
+
+def _ladder_points(values, thresholds, points):
+    """Score values on a ladder of minimum thresholds, scaling linearly below the first one."""
+    values = np.asarray(values, dtype=np.float64)
+    table = np.array([0.0] + list(points))
+    step = np.digitize(values, thresholds)
+    linear = np.maximum(0, values / thresholds[0] * points[0])
+    return np.where(step == 0, linear, table[step])
+
+
+def _band_points(values, bands, other_points, no_data_points):
+    """Score values by the first inclusive band containing them, with missing (non-positive) values scored apart."""
+    values = np.asarray(values, dtype=np.float64)
+    conditions = [values <= 0] + [(values >= low) & (values <= high) for (low, high), _ in bands]
+    choices = [no_data_points] + [points for _, points in bands]
+    return np.select(conditions, choices, default=other_points).astype(np.float64)
+
+
+def score_wellness_batch(steps, sleep_hours, calories_burned, consistent_days, heart_rate):
+    """
+    Score the wellness of many users at once.
+
+    Args:
+        steps (array-like): Steps today
+        sleep_hours (array-like): Hours slept
+        calories_burned (array-like): Calories burned today
+        consistent_days (array-like): Days of 8000+ steps in the last week
+        heart_rate (array-like): Average heart rate, 0 if unknown
+
+    Returns:
+        dict: Float arrays of the 'steps', 'sleep', 'activity', 'consistency' and
+        'heart_health' points, the total 'score' and 'percentage', and the
+        'grade' index into WELLNESS_GRADES
+    """
+    components = {
+        'steps': _ladder_points(steps, STEPS_THRESHOLDS, STEPS_POINTS),
+        'sleep': _band_points(sleep_hours, SLEEP_BANDS, SLEEP_OTHER_POINTS, SLEEP_NO_DATA_POINTS),
+        'activity': _ladder_points(calories_burned, ACTIVITY_THRESHOLDS, ACTIVITY_POINTS),
+        'consistency': np.minimum(
+            CONSISTENCY_POINTS,
+            (np.asarray(consistent_days, dtype=np.float64) / CONSISTENCY_DAYS) * CONSISTENCY_POINTS
+        ),
+        'heart_health': _band_points(heart_rate, HEART_RATE_BANDS, HEART_RATE_OTHER_POINTS, HEART_RATE_NO_DATA_POINTS)
+    }
+
+    score = components['steps'] + components['sleep'] + components['activity'] + components['consistency'] + components['heart_health']
+    percentage = (score / WELLNESS_MAX_SCORE) * 100
+
+    components['score'] = score
+    components['percentage'] = percentage
+    components['grade'] = np.digitize(percentage, [minimum for minimum, _, _ in WELLNESS_GRADES[1:]])
+    return components
+
+
+def age_band_codes(ages):
+    """Map ages to age band indexes; 0 is under the first edge and unknown ages count as 0."""
+    ages = np.nan_to_num(np.asarray(ages, dtype=np.float64), nan=0.0)
+    return np.digitize(ages, AGE_BAND_EDGES)
+
+
+def age_band_label(code):
+    """Get a readable label for an age band index."""
+    if code == 0:
+        return f"under {AGE_BAND_EDGES[0]}"
+    if code == len(AGE_BAND_EDGES):
+        return f"{AGE_BAND_EDGES[-1]}+"
+    return f"{AGE_BAND_EDGES[code - 1]}-{AGE_BAND_EDGES[code] - 1}"
+
+
+def cohort_percentiles(scores, groups):
+    """
+    Get the percentile of every score within its group.
+
+    A percentile is the share of the group, including the user, scoring at
+    or below the user, so the best score in a group is at 100.
+
+    Args:
+        scores (array-like): Scores between 0 and WELLNESS_MAX_SCORE
+        groups (array-like): Non-negative integer group codes
+
+    Returns:
+        np.ndarray: Percentiles between 0 and 100
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    groups = np.asarray(groups, dtype=np.int64)
+    if scores.size == 0:
+        return np.zeros(0)
+
+    # One sorted key array; group offsets keep every group's scores in their own range
+    keys = groups * (WELLNESS_MAX_SCORE + 1.0) + scores
+    sorted_keys = np.sort(keys)
+    sizes = np.bincount(groups)
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+
+    at_or_below = np.searchsorted(sorted_keys, keys, side='right') - starts[groups]
+    return at_or_below / sizes[groups] * 100
+
+
+class WellnessCohorts:
+    """Sorted wellness scores per age band, for ranking a user against others their age."""
+
+    def __init__(self, scores, ages):
+        codes = age_band_codes(ages)
+        scores = np.asarray(scores, dtype=np.float64)
+        self.bands = {int(code): np.sort(scores[codes == code]) for code in np.unique(codes)}
+
+    def rank(self, score, age):
+        """
+        Rank a score within the age band of ``age``.
+
+        Returns:
+            dict: Age band, cohort size, percentile and top percentage, or None without a cohort
+        """
+        code = int(age_band_codes([age or 0])[0])
+        band = self.bands.get(code)
+        if band is None or band.size == 0:
+            return None
+
+        percentile = float(np.searchsorted(band, score, side='right')) / band.size * 100
+        top_percent = max(1, int(np.ceil(100 - percentile)))
+        if top_percent <= 50:
+            message = f"You're in the top {top_percent}% of users your age"
+        else:
+            message = f"You're ahead of {int(percentile)}% of users your age"
+
+        return {
+            'age_band': age_band_label(code),
+            'cohort_size': int(band.size),
+            'percentile': round(percentile, 1),
+            'top_percent': top_percent,
+            'message': message
+        }
+
+
+def load_wellness_cohorts(for_date=None):
+    """
+    Score every user with FitnessData on a date and group the scores by age band.
+
+    A user with several FitnessData rows for the date is scored once, from the
+    latest row. Consistency comes from each user's 7-day HealthStatRollup as of
+    its last update. The result is cached for an hour per date.
+    """
+    for_date = for_date or datetime.date.today()
+    cohorts = cohort_cache.get(for_date)
+    if cohorts is not None:
+        return cohorts
+
+    # Syncs can leave several rows for a user and date; only the latest counts
+    latest_ids = db.session.query(func.max(FitnessData.id)).filter(
+        FitnessData.date == for_date
+    ).group_by(FitnessData.user_id)
+
+    rows = db.session.query(
+        FitnessData.steps,
+        FitnessData.sleep_hours,
+        FitnessData.calories_burned,
+        FitnessData.heart_rate,
+        HealthStatRollup.consistent_days,
+        User.age
+    ).join(
+        User, User.id == FitnessData.user_id
+    ).outerjoin(
+        HealthStatRollup,
+        (HealthStatRollup.user_id == FitnessData.user_id) & (HealthStatRollup.window_days == 7)
+    ).filter(FitnessData.id.in_(latest_ids)).all()
+
+    columns = np.array(rows, dtype=np.float64).reshape(len(rows), 6)
+    columns = np.nan_to_num(columns, nan=0.0)
+    steps, sleep_hours, calories_burned, heart_rate, consistent_days, ages = columns.T
+    scores = score_wellness_batch(
+        steps=steps,
+        sleep_hours=sleep_hours,
+        calories_burned=calories_burned,
+        consistent_days=consistent_days,
+        heart_rate=heart_rate
+    )['score']
+
+    cohorts = WellnessCohorts(scores, ages)
+    cohort_cache.set(for_date, cohorts)
+    return cohorts